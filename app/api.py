@@ -0,0 +1,359 @@
+# app/api.py
+"""
+Lokalt HTTP-API (JSON, bara GET) över tjänstelagret, för interna verktyg
+som annars skulle läsa Streamlit-sidorna eller data.db direkt.
+
+    python -m app.api [--host 127.0.0.1] [--port 8502] [--db data/data.db]
+
+Körs som en egen process (ThreadingHTTPServer, en tråd per anslutning) och
+delar alltså inget med Streamlit utom databasen.
+
+Endpoints:
+  /health
+  /users/<user>/overview[?asof=YYYY-MM-DD]     innehav (portfolio.overview / overview_asof)
+  /users/<user>/cash[?asof=YYYY-MM-DD]         likvida medel
+  /users/<user>/realized[?asof=YYYY-MM-DD]     realiserad P&L (GAV)
+  /users/<user>/nav?period=Allt&anchor=YYYY-MM-DD
+                                               indexserie (performance.nav_series)
+  /users/<user>/trades?limit=50&ticker=&side=&cursor_ts=&cursor_id=
+                                               historik, nyast först (keyset-paginering)
+  /quotes?tickers=AAK.ST,ABB.ST                senaste kurs (quotes, annars prices)
+
+Varje svar har en ETag byggd på de underliggande tabellernas ändringsläge:
+versionsräknarna i data_versions (prices, trades:<user>, se versions.py)
+och för /quotes senaste fetched_at. ETag räknas med en enda liten fråga
+innan något annat görs, så en klient som skickar If-None-Match med
+oförändrad data får 304 utan att svaret byggs. Färdiga svar (JSON-bytes)
+cachas i processen på (URL, ETag).
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from app.services import db
+from app.services import performance
+from app.services import portfolio
+from app.services import telemetry
+from app.services import trades
+from app.services import versions
+
+logger = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+PORT = 8502
+RESPONSE_CACHE_SIZE = 256
+MAX_TRADES_LIMIT = 500
+
+
+# ---------- JSON ----------
+
+def _clean(v):
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    if isinstance(v, (pd.Timestamp, date)):
+        return v.isoformat()
+    if hasattr(v, "item"):            # numpy-skalärer
+        return _clean(v.item())
+    return v
+
+
+def _records(df: pd.DataFrame) -> list[dict]:
+    return [{k: _clean(v) for k, v in row.items()} for row in df.to_dict(orient="records")]
+
+
+# ---------- Endpoints ----------
+#
+# Varje endpoint är (validator, builder): validator(conn, user, q) ger det
+# som ETag byggs på (billigt), builder(conn, user, q) ger svaret.
+
+def _user_validator(*, prices: bool) -> Callable:
+    def validator(conn: sqlite3.Connection, user: str, q: dict) -> tuple:
+        domains = [versions.trades_domain(user)] + ([versions.PRICES] if prices else [])
+        return versions.get(conn, *domains)
+    return validator
+
+
+def _asof(q: dict) -> Optional[date]:
+    """?asof=YYYY-MM-DD: läget vid dagens slut (månadssnapshots i portfolio)."""
+    asof = _param(q, "asof")
+    return date.fromisoformat(asof) if asof else None
+
+
+def _overview(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    asof = _asof(q)
+    if asof is None:
+        return {"user": user, "positions": _records(portfolio.overview(conn, user))}
+    return {"user": user, "asof": asof.isoformat(), "positions": _records(portfolio.overview_asof(conn, user, asof))}
+
+
+def _cash(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    asof = _asof(q)
+    if asof is None:
+        return {"user": user, "cash": portfolio.cash_balance(conn, user)}
+    return {"user": user, "asof": asof.isoformat(), "cash": portfolio.cash_balance_asof(conn, user, asof)}
+
+
+def _realized(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    asof = _asof(q)
+    if asof is None:
+        return {"user": user, "realized_pnl": portfolio.realized_pnl_avgcost(conn, user)}
+    return {"user": user, "asof": asof.isoformat(), "realized_pnl": portfolio.realized_pnl_asof(conn, user, asof)}
+
+
+def _nav_params(q: dict) -> tuple[str, date]:
+    period = _param(q, "period") or "Allt"
+    if period not in performance.PERIOD_OPTIONS:
+        raise ValueError(f"Okänd period: {period} (välj bland {', '.join(performance.PERIOD_OPTIONS)})")
+    anchor = _param(q, "anchor")
+    return period, date.fromisoformat(anchor) if anchor else date.today()
+
+
+def _nav_validator(conn: sqlite3.Connection, user: str, q: dict) -> tuple:
+    return (_nav_params(q)[1].isoformat(),) + versions.get(conn, versions.trades_domain(user), versions.PRICES)
+
+
+def _nav(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    period, anchor = _nav_params(q)
+    series, base, method = performance.nav_series(conn, user, period, anchor)
+    return {
+        "user": user, "period": period, "anchor": anchor.isoformat(), "method": method,
+        "base_value": _clean(float(base)),
+        "series": [{"date": d.date().isoformat(), "value": _clean(float(v))} for d, v in series.items()],
+    }
+
+
+def _trades(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    limit = max(1, min(int(_param(q, "limit") or 50), MAX_TRADES_LIMIT))
+    cursor = None
+    if _param(q, "cursor_ts") is not None:
+        cursor = (_param(q, "cursor_ts"), int(_param(q, "cursor_id") or 0))
+    page, nxt = trades.list_trades_page(
+        conn, user, ticker=_param(q, "ticker"), side=_param(q, "side"),
+        start=_param(q, "start"), end=_param(q, "end"), cursor=cursor, limit=limit,
+    )
+    return {
+        "user": user,
+        "trades": _records(page),
+        "next": {"cursor_ts": nxt[0], "cursor_id": nxt[1]} if nxt else None,
+    }
+
+
+def _tickers(q: dict) -> list[str]:
+    raw = _param(q, "tickers") or ""
+    out = sorted({t.strip().upper() for t in raw.split(",") if t.strip()})
+    if not out:
+        raise ValueError("Ange tickers=A,B,...")
+    return out
+
+
+def _quotes_validator(conn: sqlite3.Connection, user: str, q: dict) -> tuple:
+    tickers = _tickers(q)
+    row = conn.execute(
+        f"SELECT COUNT(*), MAX(fetched_at) FROM quotes WHERE ticker IN ({','.join('?' * len(tickers))})",
+        tickers,
+    ).fetchone()
+    return tuple(row) + versions.get(conn, versions.PRICES)
+
+
+def _quotes(conn: sqlite3.Connection, user: str, q: dict) -> dict:
+    """Cachad kurs ur quotes om den finns, annars senaste stängning i prices. Ingen nätverkstrafik."""
+    tickers = _tickers(q)
+    rows = conn.execute(
+        f"SELECT ticker, price, ts, fetched_at FROM quotes WHERE price IS NOT NULL "
+        f"AND ticker IN ({','.join('?' * len(tickers))})",
+        tickers,
+    ).fetchall()
+    cached = {t: (p, ts, f) for t, p, ts, f in rows}
+    fallback = portfolio.latest_prices(conn, [t for t in tickers if t not in cached]).set_index("ticker")
+    out = []
+    for t in tickers:
+        if t in cached:
+            p, ts, f = cached[t]
+            out.append({"ticker": t, "price": p, "ts": ts, "fetched_at": f, "source": "quote"})
+        elif t in fallback.index:
+            out.append({"ticker": t, "price": _clean(fallback.at[t, "last_close"]),
+                        "ts": fallback.at[t, "last_ts"], "fetched_at": None, "source": "db"})
+        else:
+            out.append({"ticker": t, "price": None, "ts": None, "fetched_at": None, "source": None})
+    return {"quotes": out}
+
+
+USER_ROUTES: dict[str, tuple[Callable, Callable]] = {
+    "overview": (_user_validator(prices=True), _overview),
+    # belopp räknas om till SEK med växelkurser, som versioneras med prices
+    "cash": (_user_validator(prices=True), _cash),
+    "realized": (_user_validator(prices=True), _realized),
+    "nav": (_nav_validator, _nav),
+    "trades": (_user_validator(prices=False), _trades),
+}
+_USER_PATH = re.compile(r"^/users/([^/]+)/([a-z_]+)$")
+
+
+def _param(q: dict, name: str) -> Optional[str]:
+    v = q.get(name)
+    return v[-1] if v else None
+
+
+def _route(path: str) -> Optional[tuple[Callable, Callable, str]]:
+    if path == "/quotes":
+        return _quotes_validator, _quotes, ""
+    m = _USER_PATH.match(path)
+    if m and m.group(2) in USER_ROUTES:
+        validator, builder = USER_ROUTES[m.group(2)]
+        return validator, builder, unquote(m.group(1))
+    return None
+
+
+def make_etag(key: str, state: tuple) -> str:
+    return '"' + hashlib.blake2b(repr((key, state)).encode(), digest_size=12).hexdigest() + '"'
+
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match: lista med (ev. svaga) taggar eller *."""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# ---------- Svarscache ----------
+
+class ResponseCache:
+    """JSON-bytes per (URL, ETag); gamla ETags trillar ut i LRU-ordning."""
+
+    def __init__(self, size: int = RESPONSE_CACHE_SIZE) -> None:
+        self.size = size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: tuple, build: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        body = build()
+        with self._lock:
+            self._data[key] = body
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+        return body
+
+
+# ---------- Server ----------
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], db_path: Union[Path, str]) -> None:
+        super().__init__(address, ApiHandler)
+        self.db_path = str(db_path)
+        self.cache = ResponseCache()
+        self.not_modified = 0
+        conn = self.connect()
+        try:
+            db.ensure_schema(conn)
+        finally:
+            conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        # en anslutning per begäran: billig i SQLite och inget delat tillstånd mellan trådar
+        return sqlite3.connect(self.db_path, timeout=5.0)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server: ApiServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        with telemetry.span("api.get", path=urlsplit(self.path).path):
+            self._get()
+
+    def _get(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            return self._send(200, {"status": "ok"})
+        route = _route(url.path)
+        if route is None:
+            return self._send(404, {"error": f"Okänd sökväg: {url.path}"})
+        validator, builder, user = route
+        q = parse_qs(url.query)
+        conn = self.server.connect()
+        try:
+            etag = make_etag(self.path, validator(conn, user, q))
+            if _matches(self.headers.get("If-None-Match"), etag):
+                self.server.not_modified += 1
+                return self._send(304, None, etag)
+            body = self.server.cache.get_or_build(
+                (self.path, etag), lambda: json.dumps(builder(conn, user, q), ensure_ascii=False).encode("utf-8")
+            )
+            return self._send(200, body, etag)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        except Exception:
+            logger.exception("API-fel för %s", self.path)
+            return self._send(500, {"error": "Internt fel"})
+        finally:
+            conn.close()
+
+    def _send(self, status: int, body, etag: Optional[str] = None) -> None:
+        if isinstance(body, dict):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")   # spara men fråga alltid med If-None-Match
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(host: str = HOST, port: int = PORT, db_path: Union[Path, str] = db.DB_PATH) -> ApiServer:
+    return ApiServer((host, port), db_path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Lokalt JSON-API över portföljdata")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--db", default=str(db.DB_PATH))
+    args = ap.parse_args()
+    telemetry.setup(db.ROOT / "logs" / "api.log")
+    server = make_server(args.host, args.port, args.db)
+    logger.info("API lyssnar på http://%s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
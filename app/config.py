@@ -10,6 +10,15 @@ ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = ROOT / "data" / "data.db"
 APP_LOG = ROOT / "logs" / "app.log"
 
+# Universum (CSV med name_display;yf_symbol;segment)
+UNIVERSE_CSV = ROOT / "data" / "omx_securities.csv"
+
+# Börs -> CSV-fil (med segment-kolumn) eller katalog med en CSV per segment.
+# Shards laddas först när de efterfrågas (se universe.ShardedUniverse).
+UNIVERSE_SOURCES = {
+    "Stockholm": UNIVERSE_CSV,
+}
+
 # Demo-login (läggs i .env senare)
 DEMO_USER = "demo"
 DEMO_PASS = "demo123"
@@ -4,12 +4,16 @@ from datetime import date, timedelta
 import numpy as np
 import pandas as pd
 import streamlit as st
-import yfinance as yf
-import altair as alt # (använder detta för att få crosshair i grafen)
 
-from app.config import START_CASH # (hämtas ur config.py)
+from app.services import alerts
 from app.services import db as dbsvc
+from app.services import downsample
+from app.services import fx
 from app.services import portfolio
+from app.services import price_fetcher
+from app.services import performance
+from app.services import telemetry
+from app.services import versions
 
 
 # hjälpfunktioner nedan:
@@ -26,9 +30,8 @@ def _to_index_df(obj: pd.Series | pd.DataFrame, name: str) -> pd.DataFrame:
     return s.to_frame()
 
 PAGE_TITLE = "Dashboard"
-
-PERIOD_OPTIONS = ["1 dag", "1 vecka", "3 månader", "6 månader", "YTD", "1 år", "Allt"]
-PERIOD_DAYS = {"1 dag": 1, "1 vecka": 7, "3 månader": 90, "6 månader": 180, "1 år": 365}
+OMXSPI = "^OMXSPI"
+CHART_POINTS = 900  # ≈ grafens bredd i pixlar (wide layout), fler punkter syns ändå inte
 
 
 @st.cache_resource(show_spinner=False)
@@ -38,117 +41,60 @@ def get_conn():
     return conn
 
 
-def _ytd_start(anchor: date) -> date:
-    return date(anchor.year, 1, 1)
+def _data_versions(conn, user: str) -> tuple[int, int]:
+    """(prices, trades:<user>) – nyckel för cachade DB-läsningar nedan."""
+    return versions.get(conn, versions.PRICES, versions.trades_domain(user))
 
 
-def _period_start_for(anchor: date, period: str) -> date | None:
-    if period == "Allt":
-        return None
-    if period == "YTD":
-        return _ytd_start(anchor)
-    return anchor - timedelta(days=PERIOD_DAYS[period])
+@st.cache_data(show_spinner=False, max_entries=64)
+def _overview_now(_conn, user: str, ver: tuple[int, int]) -> tuple[pd.DataFrame, float]:
+    return portfolio.overview(_conn, user), portfolio.cash_balance(_conn, user)
 
 
-def _max_db_date(conn, tickers: list[str]) -> date | None:
+@st.cache_data(show_spinner=False, max_entries=64)
+def _max_db_date(_conn, tickers: list[str], prices_ver: int) -> date | None:
     if not tickers:
         return None
     placeholders = ",".join(["?"] * len(tickers))
     sql = f"SELECT MAX(ts) FROM prices WHERE ticker IN ({placeholders})"
-    row = conn.execute(sql, tickers).fetchone()
+    row = _conn.execute(sql, tickers).fetchone()
     if not row or not row[0]:
         return None
     return pd.to_datetime(row[0]).date()
 
 
-def _load_price_panel(conn, tickers: list[str], start_date: date | None, end_date: date) -> pd.DataFrame:
-    """Pivot: index=ts (datetime), columns=ticker, values=close."""
-    if not tickers:
-        return pd.DataFrame()
-    placeholders = ",".join(["?"] * len(tickers))
-    params: list = tickers[:]
-    conds = [f"ticker IN ({placeholders})", "ts <= ?"]
-    params.append(end_date.isoformat())
-    if start_date is not None:
-        conds.append("ts >= ?")
-        params.append(start_date.isoformat())
-    where = " AND ".join(conds)
-    sql = f"SELECT ts, ticker, close FROM prices WHERE {where} ORDER BY ts"
-    df = pd.read_sql_query(sql, conn, params=params)
-    if df.empty:
-        return pd.DataFrame()
-    df["ts"] = pd.to_datetime(df["ts"])  # säkerställ datetimeindex
-    pivot = df.pivot(index="ts", columns="ticker", values="close").sort_index()
-    pivot = pivot.dropna(how="all", axis=1).interpolate(limit_direction="both")
-    return pivot
-
-
-def _load_trades(conn, user: str, end_date: date) -> pd.DataFrame:
-    sql = """
-      SELECT ts, ticker, side, qty, price, fee
-      FROM trades
-      WHERE user = ? AND ts <= ?
-      ORDER BY ts, id
-    """
-    df = pd.read_sql_query(sql, conn, params=[user, end_date.isoformat()])
-    if df.empty:
-        return df
-    df["ts"] = pd.to_datetime(df["ts"])  # datum
-    df["qty_signed"] = df["qty"].where(df["side"] == "BUY", -df["qty"])  # + vid köp, - vid sälj
-    df["cash_flow"] = df.apply(
-        lambda r: -(r["price"] * r["qty"] + r["fee"]) if r["side"] == "BUY"
-        else (r["price"] * r["qty"] - r["fee"]),
-        axis=1,
-    )
-    return df
-
-
-def _positions_qty_panel(trades: pd.DataFrame, price_index: pd.DatetimeIndex) -> pd.DataFrame:
-    """
-    Dagliga kvantiteter per ticker över hela price_index:
-    - summera qty på handelsdagar
-    - kumulera (cumsum) på originalets datum
-    - fyll sedan framåt in i periodens datum (reindex med ffill)
-    """
-    if trades.empty:
-        return pd.DataFrame(0.0, index=price_index, columns=[])
-    qty = trades.pivot_table(index="ts", columns="ticker", values="qty_signed", aggfunc="sum").sort_index()
-    qty = qty.cumsum()
-    qty = qty.reindex(price_index, method="ffill").fillna(0.0)
-    return qty
-
-
-def _cash_series(trades: pd.DataFrame, price_index: pd.DatetimeIndex) -> pd.Series:
-    if trades.empty:
-        return pd.Series(START_CASH, index=price_index, name="cash")
-    cf = trades.groupby("ts")["cash_flow"].sum().sort_index()
-    cf = cf.reindex(price_index, fill_value=0.0)
-    cash = START_CASH + cf.cumsum()
-    return cash.rename("cash")
-
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def _omxspi_series(start_date: date | None, end_date: date) -> pd.Series:
-    kwargs = dict(interval="1d", auto_adjust=False, progress=False, threads=False)
-    if start_date:
-        hist = yf.download("^OMXSPI", start=start_date - timedelta(days=5), end=end_date + timedelta(days=1), **kwargs)
-    else:
-        hist = yf.download("^OMXSPI", period="max", **kwargs)
-    if hist is None or hist.empty:
-        return pd.Series(dtype="float64")
-    s = hist["Adj Close"] if "Adj Close" in hist.columns else hist["Close"]
-    s = s.dropna()
-    s.index = pd.to_datetime(s.index)
-    if start_date:
-        s = s[s.index.date >= start_date]
-    s = s[s.index.date <= end_date]
-    return s
-
-
-# Fyll saknade last_close/market_value från DB och Yahoo vid behov 
-def _fill_missing_last_close_and_mv(conn, df_pos: pd.DataFrame, anchor: date) -> pd.DataFrame:
+@st.cache_data(show_spinner=False, max_entries=64)
+def _omxspi_series(_conn, start_date: date, end_date: date, prices_ver: int) -> pd.Series:
+    """^OMXSPI ur prices (fylls av bakgrundshämtningen, se _request_omxspi)."""
+    rows = _conn.execute(
+        "SELECT ts, close FROM prices WHERE ticker = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+        (OMXSPI, start_date.isoformat(), end_date.isoformat()),
+    ).fetchall()
+    if not rows:
+        return pd.Series(dtype="float64", index=pd.DatetimeIndex([]))
+    ts, close = zip(*rows)
+    return pd.Series(close, index=pd.to_datetime(pd.Index(ts), format="ISO8601"), dtype="float64")
+
+
+def _request_omxspi(omx: pd.Series, start_date: date, end_date: date) -> price_fetcher.FetchJob | None:
+    """Startar bakgrundshämtning om DB saknar början eller slutet av perioden."""
+    fetcher = price_fetcher.get_fetcher(dbsvc.DB_PATH)
+    if omx.empty or omx.index[0].date() > start_date + timedelta(days=7):
+        return fetcher.request([OMXSPI], start_date - timedelta(days=5), end_date)
+    last = omx.index[-1].date()
+    if last < end_date - timedelta(days=3):
+        return fetcher.request([OMXSPI], last, end_date)
+    return None
+
+
+# Fyll saknade last_close/market_value från DB, Yahoo-hämtning startas i bakgrunden
+@telemetry.traced("dashboard.last_close")
+def _fill_missing_last_close_and_mv(
+    conn, df_pos: pd.DataFrame, anchor: date
+) -> tuple[pd.DataFrame, price_fetcher.FetchJob | None]:
+    job = None
     if df_pos.empty:
-        return df_pos
+        return df_pos, job
 
     # Säkerställ numerik
     for c in ("last_close", "market_value", "qty"):
@@ -176,29 +122,58 @@ def _fill_missing_last_close_and_mv(conn, df_pos: pd.DataFrame, anchor: date) ->
             if db_map:
                 df_pos.loc[df_pos["ticker"].isin(db_map.keys()), "last_close"] = df_pos["ticker"].map(db_map)
 
+        # resten hämtas i bakgrunden – sidan visar platshållare tills dess
         still = df_pos.loc[df_pos["last_close"].isna(), "ticker"].dropna().unique().tolist()
-        for t in still:
-            try:
-                hist = yf.download(
-                    t, start=anchor - timedelta(days=7), end=anchor + timedelta(days=1),
-                    interval="1d", auto_adjust=False, progress=False, threads=False
-                )
-                if hist is not None and not hist.empty:
-                    s = hist["Adj Close"] if "Adj Close" in hist.columns else hist["Close"]
-                    val = float(s.dropna().iloc[-1])
-                    df_pos.loc[df_pos["ticker"] == t, "last_close"] = val
-            except Exception:
-                pass
-
-    # Market value
+        if still:
+            job = price_fetcher.get_fetcher(dbsvc.DB_PATH).request(still, anchor - timedelta(days=7), anchor)
+
+    # Market value (i SEK – last_close är i värdepapprets valuta)
+    if "fx_rate" not in df_pos.columns:
+        df_pos["fx_rate"] = fx.latest_rates(conn, df_pos["ticker"].tolist())
+    value = df_pos["qty"] * df_pos["last_close"] * df_pos["fx_rate"]
     if "market_value" in df_pos.columns:
         mv_missing = df_pos["market_value"].isna()
         if mv_missing.any():
-            df_pos.loc[mv_missing, "market_value"] = df_pos.loc[mv_missing, "qty"] * df_pos.loc[mv_missing, "last_close"]
+            df_pos.loc[mv_missing, "market_value"] = value[mv_missing]
     else:
-        df_pos["market_value"] = df_pos["qty"] * df_pos["last_close"]
+        df_pos["market_value"] = value
+
+    return df_pos, job
 
-    return df_pos
+
+@st.fragment(run_every=1.0)
+def _await_prices(job: price_fetcher.FetchJob, what: str) -> None:
+    """Pollar bakgrundshämtningen och kör om hela sidan när den är klar."""
+    if job.done():
+        st.rerun(scope="app")
+    st.caption(f"Hämtar {what} för {', '.join(job.tickers)} …")
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _chart_frame(_plot_df: pd.DataFrame, user: str, period: str, anchor: date, ver: tuple[int, int]) -> pd.DataFrame:
+    """Grafdata nedsamplad till ungefär grafens bredd – byggs en gång per (serie, period, dataversion)."""
+    df = downsample.downsample_frame(_plot_df, ["Portfölj", "^OMXSPI"], CHART_POINTS)
+    df = df.reset_index()
+    return df.rename(columns={df.columns[0]: "Datum"})
+
+
+@telemetry.traced("dashboard.alerts")
+def _alerts_section(conn, user: str) -> None:
+    """Senaste kurslarmen (regler skapas på Bevakning-sidan)."""
+    fired = alerts.recent(conn, user, limit=20)
+    if fired.empty:
+        return
+    unseen = int((fired["seen"] == 0).sum())
+    with st.expander(f"Kurslarm ({unseen} nya)" if unseen else "Kurslarm", expanded=unseen > 0):
+        st.dataframe(
+            fired[["ts", "ticker", "message"]],
+            use_container_width=True,
+            hide_index=True,
+            column_config={"ts": "Datum", "ticker": "Ticker", "message": "Larm"},
+        )
+        if unseen and st.button("Markera som lästa"):
+            alerts.mark_seen(conn, user)
+            st.rerun()
 
 
 # beräkning av orealiserad avkastning 
@@ -242,9 +217,13 @@ def main():
     user = st.session_state["user"]
     conn = get_conn()
 
+    # Versioner för prices/trades: oförändrad data -> cacheträff, ändrad -> exakt omräkning
+    ver = _data_versions(conn, user)
+
     # Översikt (nutid)
     try:
-        df_pos = portfolio.overview(conn, user)
+        with telemetry.span("dashboard.overview"):
+            df_pos, cash_now = _overview_now(conn, user, ver)
     except Exception as e:
         st.error(f"Kunde inte läsa portföljöversikt: {e}")
         st.stop()
@@ -254,17 +233,15 @@ def main():
         st.info("Inga innehav ännu. Gå till **Trades** och registrera din första affär.")
         return
 
-    anchor = _max_db_date(conn, tickers)
+    anchor = _max_db_date(conn, tickers, ver[0])
     if not anchor:
         st.info("Hittade inga prisdata i databasen för dina tickers.")
         st.stop()
 
     # last_close/market_value
-    df_pos = _fill_missing_last_close_and_mv(conn, df_pos, anchor)
+    df_pos, price_job = _fill_missing_last_close_and_mv(conn, df_pos, anchor)
 
     # KPI:er Likvida medel, Portföljvärde, Totalt värde
-    cash_now = portfolio.cash_balance(conn, user)
-
     port_value_now = float(pd.to_numeric(df_pos.get("market_value"), errors="coerce").fillna(0.0).sum())
     total_value_now = cash_now + port_value_now
 
@@ -287,70 +264,45 @@ def main():
             help="Orealiserad avkastning baserat på GAV. Ex. cash.",
         )
 
+    _alerts_section(conn, user)
+
     # Innehavstabell 
     st.subheader("Innehav")
-    cols = ["ticker", "qty", "avg_buy_price", "last_close", "market_value", "unreal_pnl", "utveckling_%"]
+    if price_job is not None and not price_job.done():
+        _await_prices(price_job, "senaste kurs")
+    elif df_pos["last_close"].isna().any():
+        missing = df_pos.loc[df_pos["last_close"].isna(), "ticker"].tolist()
+        st.caption(f"Kurs saknas för {', '.join(missing)} (Yahoo gav inget svar).")
+    no_fx = fx.missing(conn, tickers)
+    if no_fx:
+        st.caption(f"Växelkurs saknas för {', '.join(no_fx)} – kör ETL för att värdera innehaven i SEK.")
+    cols = ["ticker", "currency", "qty", "avg_buy_price", "last_close", "market_value", "unreal_pnl", "utveckling_%"]
     show = [c for c in cols if c in df_pos.columns]
     st.dataframe(df_pos[show].sort_values("market_value", ascending=False), use_container_width=True)
 
     # Portföljens utveckling (interaktiv graf – period/TWR)
     st.subheader("Portfölj (viktad) – tidsserie")
-    period = st.radio("Period", PERIOD_OPTIONS, horizontal=True, index=2)
+    period = st.radio("Period", performance.PERIOD_OPTIONS, horizontal=True, index=2)
 
-    start_date = _period_start_for(anchor, period)
-
-    price_panel = _load_price_panel(conn, tickers, start_date, anchor)
-    if price_panel.empty:
+    # TWR om affärshistorik finns, annars statisk korg av dagens innehav (memoiserat per dataversion)
+    port_series, base_val, method = performance.nav_series(conn, user, period, anchor)
+    if method == "no_prices":
         st.info("Hittade inga prisdata för perioden. Kör ETL för att fylla historik.")
         st.stop()
-
-    trades = _load_trades(conn, user, anchor)
-    qty_panel = _positions_qty_panel(trades, price_panel.index)
-    qty_panel = qty_panel.reindex(columns=price_panel.columns, fill_value=0.0)
-
-    # Time-Weighted Return (TWR) om historik finns
-    ret = price_panel.pct_change().replace([np.inf, -np.inf], np.nan).fillna(0.0)
-    hold_val = (qty_panel.shift(1) * price_panel.shift(1))
-    tot_val = hold_val.sum(axis=1)
-
-    have_any = tot_val.gt(0)
-    twr_possible = have_any.any()
-    base_val = None
-
-    if twr_possible:
-        first_hold_day = have_any.idxmax()
-        hold_val = hold_val.loc[first_hold_day:]
-        ret = ret.loc[first_hold_day:]
-        tot_val = tot_val.loc[first_hold_day:]
-
-        weights = hold_val.div(tot_val, axis=0).fillna(0.0)
-        port_ret = (weights * ret).sum(axis=1)
-
-        portfolio_index = (1.0 + port_ret).cumprod() * 100.0
-        base_val = float(tot_val.loc[first_hold_day])
-        plot_df = portfolio_index.rename("Portfölj").to_frame()
-    else:
-        plot_df = pd.DataFrame()
-
-    # Fallback: statisk korg av dagens innehav
-    if plot_df.empty or plot_df.shape[0] < 5:
-        qty_now = df_pos.set_index("ticker")["qty"].reindex(price_panel.columns).fillna(0.0)
-        pv = (price_panel.mul(qty_now, axis=1)).sum(axis=1)
-        pv = pv[pv > 0]
-        if not pv.empty:
-            portfolio_index = (pv / pv.iloc[0] * 100.0).rename("Portfölj")
-            base_val = float(pv.iloc[0])
-            plot_df = portfolio_index.to_frame()
-        else:
-            st.info("Ingen tidsserie att visa ännu.")
-            st.stop()
-
-    # OMXSPI (index=100)
-    omx = _omxspi_series(plot_df.index.min().date(), anchor)
-    if omx is not None and not omx.empty:
-        omx = omx.reindex(plot_df.index).ffill()
-        if isinstance(omx, pd.DataFrame):
-            omx = omx.iloc[:, 0]
+    if method == "empty":
+        st.info("Ingen tidsserie att visa ännu.")
+        st.stop()
+    plot_df = port_series.to_frame()
+
+    # OMXSPI (index=100) ur DB – saknas historik hämtas den i bakgrunden
+    omx_start = plot_df.index.min().date()
+    with telemetry.span("dashboard.omxspi"):
+        omx = _omxspi_series(conn, omx_start - timedelta(days=5), anchor, ver[0])
+    omx_job = _request_omxspi(omx, omx_start, anchor)
+    if omx_job is not None and not omx_job.done():
+        _await_prices(omx_job, "indexhistorik")
+    omx = omx.reindex(plot_df.index, method="ffill").dropna()
+    if not omx.empty:
         omx_idx = (omx / omx.iloc[0] * 100.0)
         omx_idx = omx_idx.to_frame(name="^OMXSPI")
         plot_df = plot_df.join(omx_idx, how="left")
@@ -374,19 +326,17 @@ def main():
     if "^OMXSPI" in plot_df.columns:
         plot_df["OMXSPI_%"] = plot_df["^OMXSPI"] - 100.0
 
-    # Altair-graf
-    chart_df = plot_df.reset_index()
-    first_col = chart_df.columns[0]
-    if first_col != "Datum":
-        chart_df = chart_df.rename(columns={first_col: "Datum"})
-
+    # Altair-graf: nedsamplad (LTTB) och EN datamängd för alla lager (fold i stället för melt)
+    with telemetry.span("dashboard.chart_frame"):
+        chart_df = _chart_frame(plot_df, user, period, anchor, ver)
     value_cols = [c for c in ["Portfölj", "^OMXSPI"] if c in chart_df.columns]
-    long_df = chart_df.melt(id_vars=["Datum"], value_vars=value_cols, var_name="Serie", value_name="Index")
+    import altair as alt  # (för crosshair i grafen) laddas först här, inte vid kallstart
+    base = alt.Chart(chart_df)
 
     hover = alt.selection_point(fields=["Datum"], nearest=True, on="mousemove", empty=False)
 
     line = (
-        alt.Chart(long_df)
+        base.transform_fold(value_cols, as_=["Serie", "Index"])
         .mark_line()
         .encode(
             x=alt.X("Datum:T", title="Datum"),
@@ -396,13 +346,14 @@ def main():
         .properties(height=360)
     )
 
-    rule = alt.Chart(long_df).mark_rule(color="#888").encode(x="Datum:T").transform_filter(hover)
+    rule = base.mark_rule(color="#888").encode(x="Datum:T").transform_filter(hover)
     points = (
-        alt.Chart(long_df).mark_circle(size=36).encode(x="Datum:T", y="Index:Q", color="Serie:N").transform_filter(hover)
+        base.transform_fold(value_cols, as_=["Serie", "Index"])
+        .mark_circle(size=36).encode(x="Datum:T", y="Index:Q", color="Serie:N").transform_filter(hover)
     )
 
     tooltip_base = (
-        alt.Chart(chart_df)
+        base
         .mark_rule(opacity=0)
         .encode(
             x="Datum:T",
@@ -416,7 +367,8 @@ def main():
         .add_params(hover)
     )
 
-    st.altair_chart((line + points + rule + tooltip_base).interactive(), use_container_width=True)
+    with telemetry.span("dashboard.chart"):
+        st.altair_chart((line + points + rule + tooltip_base).interactive(), use_container_width=True)
 
     st.caption(
         "Portfölj = avkastning på aktieinnehaven (utan cash), normaliserad till 100. "
@@ -426,7 +378,8 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    with telemetry.span("page.dashboard", user=st.session_state.get("user")):
+        main()
 
 
 
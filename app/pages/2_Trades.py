@@ -1,19 +1,20 @@
 # app/pages/2_Trades.py
 from __future__ import annotations
 
+import time
 from datetime import date
-from typing import Optional
 
-import pandas as pd
 import streamlit as st
-import yfinance as yf
 
 import app.services.trades as trades_svc
-import app.services.portfolio as portfolio
 import app.services.universe as universe
 import app.services.db as dbsvc
+import app.services.quotes as quotes
+import app.services.writer as writer_svc
+import app.services.telemetry as telemetry
 
 PAGE_TITLE = "Trades"
+HISTORY_PAGE_SIZE = 50
 
 @st.cache_resource(show_spinner=False)
 def get_conn():
@@ -21,57 +22,27 @@ def get_conn():
     dbsvc.ensure_schema(conn)
     return conn
 
-@st.cache_data(show_spinner=False, ttl=300)
-def yf_last_close(ticker: str) -> Optional[dict]:
-    """
-    Returnerar {"last_close": float, "ts": "YYYY-MM-DD"} eller None.
-    Robust mot helger/helgdagar och tomma svar från yfinance.
-    """
-    try:
-        tk = yf.Ticker(ticker)
-        df = tk.history(period="14d", interval="1d", auto_adjust=False)
-        if df is None or df.empty:
-            # Andra försök via download()
-            df = yf.download(
-                tickers=ticker,
-                period="14d",
-                interval="1d",
-                auto_adjust=False,
-                progress=False,
-                threads=False,
-            )
-        if df is None or df.empty:
-            return None
-
-        # Städar & tar sista stängningskursen
-        if "Close" not in df.columns:
-            return None
-        df = df.dropna(subset=["Close"])
-        if df.empty:
-            return None
-
-        last_close = float(df["Close"].iloc[-1])
-        idx = df.index[-1]
-        # Hanterar ev. tidszon
-        try:
-            ts_iso = idx.tz_convert("UTC").date().isoformat() if getattr(idx, "tzinfo", None) else idx.date().isoformat()
-        except Exception:
-            ts_iso = idx.date().isoformat()
-
-        return {"last_close": last_close, "ts": ts_iso}
-
-    except Exception:
-        return None
-
-def _fallback_latest_from_db(conn, ticker: str) -> Optional[dict]:
-    try:
-        lp = portfolio.latest_prices(conn, [ticker])
-        if isinstance(lp, pd.DataFrame) and not lp.empty:
-            return {"last_close": float(lp["last_close"].iloc[0]),
-                    "ts": str(lp["ts"].iloc[0])}
-    except Exception:
-        pass
-    return None
+def _set_price(data: dict) -> None:
+    st.session_state["trade_price"] = float(data["last_close"])
+    st.session_state["trade_ts"] = str(data["ts"])
+
+
+@st.fragment(run_every=1.0)
+def _await_quote(conn, ticker: str) -> None:
+    """Väntar på bakgrundshämtningen av en kurs som varken fanns i cache eller DB."""
+    pending = st.session_state.get("quote_pending")
+    if not pending or pending[0] != ticker:
+        return
+    data = quotes.get_quotes(dbsvc.DB_PATH).get(conn, ticker)
+    if data is not None:
+        _set_price(data)
+        st.session_state.pop("quote_pending", None)
+        st.rerun(scope="app")
+    elif time.monotonic() - pending[1] > quotes.LEASE:
+        st.session_state.pop("quote_pending", None)
+        st.error("Kunde inte hämta senaste pris just nu.")
+    else:
+        st.caption(f"Hämtar senaste pris för {ticker} …")
 
 def _ensure_state_keys():
     st.session_state.setdefault("trade_ticker", "")
@@ -91,11 +62,18 @@ def main():
     _ensure_state_keys()
 
 
-    # Universe & ticker-väljare 
-    df_univ = universe.load_universe("data/omx_securities.csv")
+    # Universe & ticker-väljare (laddar bara valda börser/segment)
+    uni = universe.get_universe()
     st.subheader("Välj/sök ticker")
-
-    name_to_sym = dict(zip(df_univ["name_display"], df_univ["yf_symbol"]))
+    exchanges = uni.exchanges()
+    u1, u2 = st.columns(2)
+    with u1:
+        if len(exchanges) > 1:
+            exchanges = st.multiselect("Börser", options=exchanges, default=exchanges[:1], key="univ_exchanges")
+    with u2:
+        seg_options = sorted({seg for ex in exchanges for seg in uni.segments(ex)})
+        segments = st.multiselect("Segment", options=seg_options, placeholder="Alla segment", key="univ_segments")
+    name_to_sym = uni.names(exchanges=exchanges, segments=segments or None)
     choice = st.selectbox(
         "Bolag",
         options=list(name_to_sym.keys()),
@@ -111,22 +89,21 @@ def main():
             if not ticker:
                 st.error("Välj ett bolag först.")
             else:
-                with st.spinner(f"Hämtar senaste pris för {ticker}…"):
-                    data = yf_last_close(ticker)
-                    if data is None:
-                        data = _fallback_latest_from_db(conn, ticker)
-
-                    if data is None:
-                        st.error("Kunde inte hämta senaste pris just nu.")
-                        with st.expander("Visa teknisk info"):
-                            st.write("yfinance gav inget resultat och det fanns inget pris i DB för tickern.")
-                    else:
-                        st.session_state["trade_price"] = float(data["last_close"])
-                        st.session_state["trade_ts"] = str(data["ts"])
-                        st.success(
-                            f"Pris uppdaterat: {st.session_state['trade_price']:.2f} "
-                            f"(datum {st.session_state['trade_ts']})"
-                        )
+                # svarar direkt ur delad cache/DB, hämtning från Yahoo sker i bakgrunden
+                data = quotes.get_quotes(dbsvc.DB_PATH).get(conn, ticker)
+                if data is None:
+                    st.session_state["quote_pending"] = (ticker, time.monotonic())
+                else:
+                    _set_price(data)
+                    st.success(
+                        f"Pris uppdaterat: {st.session_state['trade_price']:.2f} "
+                        f"(datum {st.session_state['trade_ts']})"
+                    )
+                    if data["stale"]:
+                        st.caption("Priset kan vara inaktuellt – en ny kurs hämtas i bakgrunden.")
+        pending = st.session_state.get("quote_pending")
+        if pending and pending[0] == ticker:
+            _await_quote(conn, ticker)
 
     st.divider()
 
@@ -171,7 +148,8 @@ def main():
             elif qty <= 0:
                 st.error("Qty måste vara > 0.")
             else:
-                _id = trades_svc.record_trade(conn, user, ticker, side, qty, price, ts, fee)
+                # via processens skrivtråd (BEGIN IMMEDIATE + gruppcommit)
+                _id = writer_svc.get_writer(dbsvc.DB_PATH).record(user, ticker, side, qty, price, ts, fee)
                 st.success(f"Affär sparad (id={_id}).")
                 st.session_state["last_saved"] = _id
                 st.rerun()
@@ -182,14 +160,77 @@ def main():
         except Exception as e:
             st.exception(e)
 
-
-    # Historik 
+    # Import från mäklare (CSV)
+    with st.expander("Importera affärer från mäklare (CSV)"):
+        st.caption("Kolumner: datum, ticker/värdepapper, typ (köp/sälj), antal, kurs och ev. courtage. "
+                   "Bolagsnamn översätts till ticker via universet.")
+        if "import_msg" in st.session_state:
+            st.success(st.session_state.pop("import_msg"))
+        # ny nyckel efter import -> uppladdaren töms så att filen inte kan importeras två gånger
+        nonce = st.session_state.setdefault("import_nonce", 0)
+        upload = st.file_uploader("Mäklarfil", type=["csv", "txt"], key=f"trade_import_file_{nonce}")
+        if upload is not None:
+            try:
+                df_imp = trades_svc.parse_broker_csv(upload, symbols=name_to_sym)
+            except ValueError as e:
+                st.error(str(e))
+                df_imp = None
+            if df_imp is not None:
+                checked = trades_svc.validate_trades(conn, user, df_imp)
+                n_ok = int(checked["error"].isna().sum())
+                st.write(f"{n_ok} av {len(checked)} rader är giltiga.")
+                if n_ok < len(checked):
+                    st.dataframe(checked[checked["error"].notna()], use_container_width=True)
+                if st.button(f"Importera {n_ok} affärer", disabled=n_ok == 0):
+                    n, rejects = trades_svc.import_trades(conn, user, df_imp)
+                    st.session_state["import_msg"] = f"Importerade {n} affärer, {len(rejects)} avvisade."
+                    st.session_state["import_nonce"] = nonce + 1
+                    st.rerun()
+
+
+    # Historik (en sida i taget, nyast först)
     st.subheader("Historik")
-    df_hist = trades_svc.list_trades(conn, user)
-    if df_hist.empty:
+    f1, f2, f3, f4 = st.columns([2, 1, 1, 1])
+    with f1:
+        h_ticker = st.selectbox("Ticker", options=[""] + trades_svc.traded_tickers(conn, user),
+                                format_func=lambda t: t or "Alla", key="hist_ticker")
+    with f2:
+        h_side = st.selectbox("Typ", options=["", "BUY", "SELL"], format_func=lambda s: s or "Alla", key="hist_side")
+    with f3:
+        h_start = st.date_input("Från", value=None, key="hist_start")
+    with f4:
+        h_end = st.date_input("Till", value=None, key="hist_end")
+    filters = dict(ticker=h_ticker or None, side=h_side or None, start=h_start, end=h_end)
+
+    # cursor-stack: hist_cursors[i] = cursor för sida i (None för första sidan)
+    if st.session_state.get("hist_filters") != filters:
+        st.session_state["hist_filters"] = filters
+        st.session_state["hist_cursors"] = [None]
+    cursors = st.session_state["hist_cursors"]
+
+    total = trades_svc.count_trades(conn, user, **filters)
+    if total == 0:
         st.info("Inga trades ännu – hämta pris och lägg till din första trade ovan.")
     else:
-        st.dataframe(df_hist.sort_values(["ts", "id"]), use_container_width=True)
+        df_hist, next_cursor = trades_svc.list_trades_page(
+            conn, user, cursor=cursors[-1], limit=HISTORY_PAGE_SIZE, **filters
+        )
+        st.dataframe(df_hist, use_container_width=True, hide_index=True)
+        page_no = len(cursors)
+        n_pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+        p1, p2, p3 = st.columns([1, 1, 4])
+        with p1:
+            if st.button("← Nyare", disabled=page_no == 1):
+                if len(cursors) > 1:
+                    cursors.pop()
+                st.rerun()
+        with p2:
+            if st.button("Äldre →", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        with p3:
+            st.caption(f"Sida {page_no} av {n_pages} · {total} affärer")
 
 if __name__ == "__main__":
-    main()
+    with telemetry.span("page.trades", user=st.session_state.get("user")):
+        main()
@@ -1,17 +1,331 @@
 # app/pages/3_Models.py
 from __future__ import annotations
 
+from datetime import date
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 
+from app.services import backtest
+from app.services import db as dbsvc
+from app.services import downsample
+from app.services import montecarlo
+from app.services import optimizer
+from app.services import portfolio
+from app.services import price_fetcher
+from app.services import risk
+from app.services import telemetry
+from app.services import versions
+
 PAGE_TITLE = "Models"
+CORR_MAX_TICKERS = 40   # större heatmap blir oläslig
+MC_MODES = {"Historisk (bootstrap)": "bootstrap", "Normalfördelning": "normal"}
+BT_STRATEGIES = {"Momentum": "momentum", "Likaviktat": "equal_weight"}
+
+
+@st.cache_resource(show_spinner=False)
+def get_conn():
+    conn = dbsvc.get_conn()
+    dbsvc.ensure_schema(conn)
+    return conn
+
+
+def _pct(x: float) -> str:
+    return "–" if pd.isna(x) else f"{x * 100:.1f} %"
+
+
+def _risk_section(conn, user: str) -> None:
+    import altair as alt  # laddas först när en graf ritas (kallstart)
+    st.subheader("Risk")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        scope = st.radio("Tickers", ["Innehav", "Alla i databasen"], horizontal=True, key="risk_scope")
+    with c2:
+        years = st.selectbox("Historik (år)", [1, 3, 5, 10], index=1, key="risk_years")
+    with c3:
+        window = st.selectbox("Rullande fönster (dagar)", [20, 60, 120], key="risk_window")
+
+    df_pos = portfolio.overview(conn, user)
+    weights = dict(zip(df_pos["ticker"], pd.to_numeric(df_pos["market_value"], errors="coerce").fillna(0.0)))
+    tickers = df_pos["ticker"].tolist() if scope == "Innehav" else risk.price_tickers(conn)
+    if not tickers:
+        st.info("Inga innehav ännu. Välj **Alla i databasen** eller registrera en affär under **Trades**.")
+        return
+
+    start = risk.lookback_start(date.today(), years)
+    model = risk.get_model(conn, tickers, start)
+    if not len(model.dates):
+        st.info("Hittade inga prisdata för perioden. Kör ETL för att fylla historik.")
+        return
+    if not model.has_benchmark:
+        # ^OMXSPI hämtas i bakgrunden, beta/TE visas vid nästa körning
+        price_fetcher.get_fetcher(dbsvc.DB_PATH).request([risk.BENCHMARK], start, date.today())
+        st.caption("Historik för ^OMXSPI saknas i DB och hämtas i bakgrunden – beta och tracking error visas när den finns.")
+
+    # Portföljen (dagens marknadsvärden som vikter)
+    port = model.portfolio(weights, window=window)
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric("Volatilitet (år)", _pct(port["vol_ann"]))
+    k2.metric("Max drawdown", _pct(port["max_drawdown"]))
+    k3.metric("Beta mot OMXSPI", "–" if pd.isna(port["beta"]) else f"{port['beta']:.2f}")
+    k4.metric("Tracking error", _pct(port["tracking_error"]))
+
+    roll = port["rolling_vol"].dropna()
+    if not roll.empty:
+        chart_df = downsample.downsample_frame(roll.to_frame(), ["Rullande vol"], 900).reset_index()
+        chart_df.columns = ["Datum", "Rullande vol"]
+        st.altair_chart(
+            alt.Chart(chart_df).mark_line().encode(
+                x=alt.X("Datum:T", title="Datum"),
+                y=alt.Y("Rullande vol:Q", title=f"Rullande vol {window} d (år)", axis=alt.Axis(format="%")),
+            ).properties(height=260),
+            use_container_width=True,
+        )
+
+    # Per ticker
+    metrics = model.ticker_metrics(window=window)
+    st.dataframe(
+        metrics.sort_values("vol_ann", ascending=False),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "vol_ann": st.column_config.NumberColumn("Vol (år)", format="percent"),
+            f"vol_{window}d": st.column_config.NumberColumn(f"Vol {window} d", format="percent"),
+            "max_drawdown": st.column_config.NumberColumn("Max drawdown", format="percent"),
+            "beta": st.column_config.NumberColumn("Beta", format="%.2f"),
+            "tracking_error": st.column_config.NumberColumn("Tracking error", format="percent"),
+            "days": "Dagar",
+        },
+    )
+
+    # Korrelation – innehaven, annars de mest volatila
+    held = [t for t in model.tickers if weights.get(t, 0) > 0]
+    subset = held or metrics.nlargest(CORR_MAX_TICKERS, "vol_ann")["ticker"].tolist()
+    subset = subset[:CORR_MAX_TICKERS]
+    if len(subset) > 1:
+        corr = model.correlation(subset)
+        long = corr.rename_axis("a").reset_index().melt(id_vars="a", var_name="b", value_name="korr")
+        st.altair_chart(
+            alt.Chart(long).mark_rect().encode(
+                x=alt.X("a:N", title=None, sort=subset),
+                y=alt.Y("b:N", title=None, sort=subset),
+                color=alt.Color("korr:Q", scale=alt.Scale(scheme="redblue", domain=[-1, 1], reverse=True)),
+                tooltip=["a", "b", alt.Tooltip("korr:Q", format=".2f")],
+            ).properties(height=max(200, 18 * len(subset))),
+            use_container_width=True,
+        )
+    st.caption(
+        f"Dagsavkastning sedan {start.isoformat()}. Par räknas på dagar där båda har kurs. "
+        "Portföljens mått använder dagens marknadsvärden som vikter."
+    )
+
+
+def _mc_results(res: dict) -> None:
+    v0 = res["value0"]
+    cols = st.columns(4)
+    for col, (label, key, a) in zip(cols, [("VaR 95 %", "var", 0.95), ("VaR 99 %", "var", 0.99),
+                                           ("ES 95 %", "es", 0.95), ("ES 99 %", "es", 0.99)]):
+        x = res[key][a]
+        col.metric(label, f"{x:,.0f} SEK", delta=f"{-x / v0 * 100:.1f} %", delta_color="off")
+    q = res["quantiles"]
+    st.dataframe(
+        pd.DataFrame({
+            "Percentil": [f"{int(p * 100)} %" for p in q],
+            "Värde (SEK)": list(q.values()),
+            "Förändring": [x / v0 - 1.0 for x in q.values()],
+        }),
+        hide_index=True,
+        column_config={
+            "Värde (SEK)": st.column_config.NumberColumn(format="%.0f"),
+            "Förändring": st.column_config.NumberColumn(format="percent"),
+        },
+    )
+    st.caption(
+        f"{res['done']:,} banor på {res['elapsed']:.1f} s ({res['paths_per_sec']:,.0f} banor/s). "
+        f"Startvärde {v0:,.0f} SEK."
+    )
+
+
+def _scenario_section(conn, user: str) -> None:
+    st.subheader("Scenarier (Monte Carlo)")
+    df_pos = portfolio.overview(conn, user)
+    values = dict(zip(df_pos["ticker"], pd.to_numeric(df_pos["market_value"], errors="coerce").fillna(0.0)))
+    held = [t for t, v in values.items() if v > 0]
+    if not held:
+        st.info("Simuleringen utgår från dina innehav – registrera en affär under **Trades**.")
+        return
+
+    with st.form("mc_form"):
+        c1, c2, c3, c4 = st.columns(4)
+        mode = c1.radio("Metod", list(MC_MODES), horizontal=True)
+        horizon = c2.selectbox("Horisont (handelsdagar)", [1, 5, 10, 21, 63], index=2)
+        n_paths = c3.selectbox("Antal banor", [10_000, 100_000, 1_000_000], index=2,
+                               format_func=lambda n: f"{n:,}")
+        years = c4.selectbox("Historik (år)", [1, 3, 5, 10], index=1)
+        submitted = st.form_submit_button("Kör simulering")
+
+    if submitted:
+        model = risk.get_model(conn, held, risk.lookback_start(date.today(), years))
+        k = len(model.tickers)
+        held_vals = [values[t] for t in model.tickers]
+        keep = montecarlo.kept(model.returns[:, :k], held_vals)
+        dropped = sorted(set(held) - {t for t, ok in zip(model.tickers, keep) if ok})
+        log_ret, vals = montecarlo.prepare(model.returns[:, :k], held_vals)
+        if len(log_ret) < 2 or not len(vals):
+            st.warning("För lite gemensam kurshistorik för innehaven – kör ETL för att fylla på.")
+            return
+        bar = st.progress(0.0, text="Startar …")
+        live = st.empty()
+        for res in montecarlo.run(log_ret, vals, horizon=horizon, n_paths=n_paths, mode=MC_MODES[mode]):
+            bar.progress(res["done"] / res["total"],
+                         text=f"{res['done']:,} / {res['total']:,} banor · {res['paths_per_sec']:,.0f} banor/s")
+            if not res["final"]:
+                with live.container():
+                    _mc_results(res)
+        live.empty()
+        bar.empty()
+        st.session_state["mc_result"] = {**res, "params": (mode, horizon, n_paths, years, len(log_ret)),
+                                         "dropped": dropped}
+
+    res = st.session_state.get("mc_result")
+    if res:
+        mode, horizon, n_paths, years, days = res["params"]
+        if res["dropped"]:
+            st.warning(f"Utan kurshistorik, ej med i simuleringen: {', '.join(res['dropped'])}.")
+        _mc_results(res)
+        st.caption(
+            f"{mode}, {horizon} handelsdagar, {days} dagar gemensam historik ({years} år). "
+            "Innehaven hålls fasta under horisonten; förlust räknas mot dagens marknadsvärde."
+        )
+
+
+@st.cache_data(show_spinner="Optimerar …", max_entries=32)
+def _optimize(_conn, held: tuple, method: str, window: int, cap: float, current: dict, prices_ver: int) -> dict:
+    return optimizer.optimize(_conn, list(held), method, window, cap, current=current)
+
+
+def _optimizer_section(conn, user: str) -> None:
+    st.subheader("Optimering")
+    df_pos = portfolio.overview(conn, user)
+    values = dict(zip(df_pos["ticker"], pd.to_numeric(df_pos["market_value"], errors="coerce").fillna(0.0)))
+    held = [t for t, v in values.items() if v > 0]
+    if len(held) < 2:
+        st.info("Optimeringen behöver minst två innehav.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    method = c1.selectbox("Metod", list(optimizer.METHODS), format_func=optimizer.METHODS.get, key="opt_method")
+    window = c2.selectbox("Skattningsfönster (dagar)", [60, 126, 252, 756], index=2, key="opt_window")
+    min_cap = int(np.ceil(100 / len(held)))
+    cap = c3.slider("Max vikt per innehav (%)", min_value=min_cap, max_value=100,
+                    value=max(min_cap, 40), key="opt_cap") / 100.0
+    try:
+        res = _optimize(conn, tuple(held), method, window, cap, values, versions.get(conn, versions.PRICES)[0])
+    except ValueError as e:
+        st.info(str(e))
+        return
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Volatilitet nu (år)", _pct(res["current_vol"]))
+    k2.metric("Volatilitet förslag (år)", _pct(res["vol"]),
+              delta=None if pd.isna(res["current_vol"]) else f"{(res['vol'] - res['current_vol']) * 100:+.1f} p.e.",
+              delta_color="inverse")
+    k3.metric("Förväntad avkastning (hist.)", _pct(res["expected_return"]))
+    st.dataframe(
+        res["weights"].sort_values("weight", ascending=False),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "ticker": "Ticker",
+            "current": st.column_config.NumberColumn("Vikt nu", format="percent"),
+            "weight": st.column_config.NumberColumn("Föreslagen vikt", format="percent"),
+            "change": st.column_config.NumberColumn("Förändring", format="percent"),
+            "risk_contribution": st.column_config.NumberColumn("Riskbidrag", format="percent"),
+        },
+    )
+    st.caption(
+        f"Kovarians över {res['days']} gemensamma handelsdagar, Ledoit-Wolf-krympning "
+        f"{res['shrinkage']:.2f}. Förväntad avkastning är historiskt medel och bara vägledande."
+    )
+
+
+@st.cache_data(show_spinner="Läser kurshistorik …", max_entries=4)
+def _bt_panel(_conn, start: date, end: date, prices_ver: int):
+    return backtest.load_panel(_conn, start, end)
+
+
+def _backtest_section(conn) -> None:
+    import altair as alt
+    st.subheader("Backtest")
+    with st.form("bt_form"):
+        c1, c2, c3, c4, c5 = st.columns(5)
+        strategy = c1.selectbox("Strategi", list(BT_STRATEGIES))
+        rebalance = c2.selectbox("Ombalansering (dagar)", [5, 21, 63], index=1)
+        lookback = c3.selectbox("Momentum-fönster (dagar)", [63, 126, 252], index=1)
+        top_n = c4.selectbox("Antal innehav (momentum)", [5, 10, 20, 40], index=1)
+        years = c5.selectbox("Historik (år)", [5, 10, 20], index=1)
+        fee_pct = st.number_input("Courtage (%)", min_value=0.0, max_value=2.0,
+                                  value=backtest.FEE_RATE * 100, step=0.05, format="%.2f")
+        submitted = st.form_submit_button("Kör backtest")
+    if not submitted:
+        return
+
+    today = date.today()
+    dates, tickers, prices = _bt_panel(conn, risk.lookback_start(today, years), today,
+                                       versions.get(conn, versions.PRICES)[0])
+    if len(dates) < 2:
+        st.info("Hittade inga prisdata för perioden. Kör ETL för att fylla historik.")
+        return
+    res = backtest.run(
+        dates, tickers, prices, BT_STRATEGIES[strategy],
+        {"rebalance": rebalance, "lookback": lookback, "top_n": top_n},
+        fee_rate=fee_pct / 100.0,
+    )
+    s = res["stats"]
+    k1, k2, k3, k4, k5 = st.columns(5)
+    k1.metric("Total avkastning", _pct(s["total_return"]))
+    k2.metric("CAGR", _pct(s["cagr"]))
+    k3.metric("Volatilitet (år)", _pct(s["vol_ann"]))
+    k4.metric("Max drawdown", _pct(s["max_drawdown"]))
+    k5.metric("Courtage", f"{s['fees']:,.0f} SEK", delta=f"{s['trades']:,} affärer", delta_color="off")
+
+    chart_df = downsample.downsample_frame(res["equity"].to_frame(), ["Equity"], 900).reset_index()
+    chart_df.columns = ["Datum", "Värde"]
+    st.altair_chart(
+        alt.Chart(chart_df).mark_line().encode(
+            x=alt.X("Datum:T", title="Datum"),
+            y=alt.Y("Värde:Q", title="Värde (SEK)", axis=alt.Axis(format=",.0f")),
+        ).properties(height=260),
+        use_container_width=True,
+    )
+    with st.expander(f"Affärer ({len(res['trades']):,})"):
+        st.dataframe(res["trades"].tail(1000), use_container_width=True, hide_index=True)
+    st.caption(
+        f"{len(tickers)} tickers, {len(dates)} handelsdagar. Signal på stängning, handel nästa dag; "
+        f"TWR (som på Dashboard) {_pct(s['twr'])}."
+    )
 
 
 def main():
     st.set_page_config(page_title=PAGE_TITLE, layout="wide")
     st.title(PAGE_TITLE)
-    st.info("Under arbete olika modeller finnas.\n\n"
-            "Möjligt att någon AI/ML-modell läggs in här.")
+
+    if "auth_ok" not in st.session_state or not st.session_state["auth_ok"]:
+        st.warning("Du måste logga in via startsidan.")
+        st.stop()
+
+    user = st.session_state["user"]
+    conn = get_conn()
+    _risk_section(conn, user)
+    st.divider()
+    _optimizer_section(conn, user)
+    st.divider()
+    _scenario_section(conn, user)
+    st.divider()
+    _backtest_section(conn)
 
 
 if __name__ == "__main__":
-    main()
+    with telemetry.span("page.models", user=st.session_state.get("user")):
+        main()
@@ -0,0 +1,132 @@
+# app/pages/4_Watchlist.py
+from __future__ import annotations
+
+import streamlit as st
+
+import app.services.alerts as alerts
+import app.services.db as dbsvc
+import app.services.portfolio as portfolio
+import app.services.universe as universe
+import app.services.watchlist as watchlist
+import app.services.telemetry as telemetry
+
+PAGE_TITLE = "Bevakning"
+
+@st.cache_resource(show_spinner=False)
+def get_conn():
+    conn = dbsvc.get_conn()
+    dbsvc.ensure_schema(conn)
+    return conn
+
+@st.fragment(run_every=15.0)
+def _watchlist_table(conn, user: str) -> None:
+    """Ritas om med jämna mellanrum – en lokal fråga, kurserna uppdateras i bakgrunden."""
+    df = watchlist.view(conn, user)
+    if df.empty:
+        st.info("Bevakningslistan är tom – lägg till bolag ovan.")
+        return
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "ticker": "Ticker",
+            "last_price": st.column_config.NumberColumn("Senaste kurs", format="%.2f"),
+            "price_date": "Kursdatum",
+            "fetched_at": st.column_config.DatetimeColumn("Hämtad (UTC)", format="YYYY-MM-DD HH:mm"),
+        },
+    )
+    if df["last_price"].isna().any():
+        st.caption("Kurser som saknas hämtas i bakgrunden.")
+
+def _alerts_section(conn, user: str, watched: list[str]) -> None:
+    """Larmregler för bevakade tickers och innehav; utvärderas när nya kurser läses in."""
+    st.subheader("Kurslarm")
+    held = portfolio.positions(conn, user)["ticker"].tolist()
+    options = sorted(set(watched) | set(held))
+    if not options:
+        st.caption("Bevaka ett bolag eller registrera en affär för att kunna skapa larm.")
+        return
+    with st.form("alert_rule", clear_on_submit=True):
+        c1, c2, c3 = st.columns([2, 2, 1])
+        with c1:
+            ticker = st.selectbox("Ticker", options=options)
+        with c2:
+            kind = st.selectbox("Villkor", options=list(alerts.KINDS), format_func=alerts.KINDS.get)
+        with c3:
+            threshold = st.number_input("Nivå (kurs eller %)", min_value=0.0, value=0.0, step=1.0)
+        if st.form_submit_button("Skapa larm"):
+            try:
+                alerts.add_rule(conn, user, ticker, kind, threshold if kind in alerts.NEEDS_THRESHOLD else None)
+                st.success("Larmet skapat.")
+            except ValueError as e:
+                st.error(str(e))
+
+    rules = alerts.list_rules(conn, user)
+    if rules.empty:
+        return
+    rules["kind"] = rules["kind"].map(alerts.KINDS)
+    st.dataframe(
+        rules[["id", "ticker", "kind", "threshold", "last_ts"]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "id": "Nr", "ticker": "Ticker", "kind": "Villkor",
+            "threshold": st.column_config.NumberColumn("Nivå", format="%.2f"),
+            "last_ts": "Utvärderad t.o.m.",
+        },
+    )
+    a1, a2 = st.columns([4, 1])
+    with a1:
+        drop = st.multiselect("Ta bort larm", options=rules["id"].tolist(), key="alert_remove")
+    with a2:
+        st.write("")
+        if st.button("Ta bort larm", disabled=not drop):
+            alerts.remove_rules(conn, user, drop)
+            st.rerun()
+
+def main():
+    st.set_page_config(page_title=PAGE_TITLE, layout="wide")
+    st.title(PAGE_TITLE)
+
+    if "auth_ok" not in st.session_state or not st.session_state["auth_ok"]:
+        st.warning("Du måste logga in via startsidan.")
+        st.stop()
+
+    user = st.session_state["user"]
+    conn = get_conn()
+    refresher = watchlist.get_refresher(dbsvc.DB_PATH)
+
+    # Lägg till bolag
+    name_to_sym = universe.get_universe().names()  # cachad tills en shard ändras
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        choice = st.selectbox("Bolag", options=list(name_to_sym.keys()), index=None, placeholder="Välj bolag…")
+    with c2:
+        st.write("")
+        if st.button("Bevaka", disabled=choice is None):
+            if watchlist.add(conn, user, name_to_sym[choice]):
+                refresher.kick()
+                st.success(f"{choice} tillagd.")
+            else:
+                st.info(f"{choice} finns redan i listan.")
+
+    st.subheader("Min lista")
+    _watchlist_table(conn, user)
+
+    tickers = watchlist.view(conn, user)["ticker"].tolist()
+    if tickers:
+        r1, r2 = st.columns([4, 1])
+        with r1:
+            drop = st.multiselect("Ta bort", options=tickers, key="watch_remove")
+        with r2:
+            st.write("")
+            if st.button("Ta bort valda", disabled=not drop):
+                watchlist.remove(conn, user, drop)
+                st.rerun()
+
+    _alerts_section(conn, user, tickers)
+
+if __name__ == "__main__":
+    with telemetry.span("page.watchlist", user=st.session_state.get("user")):
+        main()
@@ -0,0 +1,322 @@
+# app/services/alerts.py
+"""
+Kurslarm för innehav och bevakade tickers.
+
+En regel (alert_rules) gäller en ticker och är av typen:
+- above / below: stängningskursen korsar nivån uppåt / nedåt
+- move_pct: dagsrörelse (mot föregående stängning) på minst threshold %
+- new_high / new_low: ny högsta / lägsta stängning (löpande sedan regeln
+  skapades, startvärde ur de senaste LOOKBACK kursdagarna)
+- drawdown: kursen korsar nedåt till threshold % under användarens GAV
+
+Utvärderingen är inkrementell: evaluate() läser bara prices-rader med id
+större än markören i alert_cursor och bara de regler som gäller tickers med
+nya rader. Varje regel bär sitt eget löpande tillstånd (senaste dag, senaste
+stängning, löpande max/min), så ingen historik behöver läsas om. Reglerna
+"kompileras" till platta arrayer (en rad per regel × ny stapel) och varje
+regeltyp är en vektoriserad kontroll över dem. Kostnaden följer antalet nya
+staplar gånger antalet regler på just de tickers som fått dem.
+
+Staplar med datum på eller före regelns senaste dag (t.ex. bakåtfyllning av
+historik) ignoreras. En regel utan tillstånd (ticker saknade kurser när den
+skapades) initieras tyst av de första staplarna.
+
+evaluate() körs efter varje inläsning till prices: etl.load och
+price_fetcher anropar den efter commit. Utlösta larm sparas i alerts
+(UNIQUE per regel och dag) och visas på Dashboard.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services import fx
+from app.services import portfolio
+from app.services import telemetry
+
+LOOKBACK = 252
+
+KINDS = {
+    "above": "Över nivå",
+    "below": "Under nivå",
+    "move_pct": "Dagsrörelse minst %",
+    "new_high": "Ny högsta",
+    "new_low": "Ny lägsta",
+    "drawdown": "Under GAV minst %",
+}
+NEEDS_THRESHOLD = {"above", "below", "move_pct", "drawdown"}
+
+
+# ---------- Regler ----------
+
+def add_rule(conn: sqlite3.Connection, user: str, ticker: str, kind: str, threshold: Optional[float] = None) -> int:
+    """Skapar en regel med tillstånd från senaste kursen; returnerar regelns id."""
+    ticker = (ticker or "").strip().upper()
+    if not ticker:
+        raise ValueError("Ticker saknas.")
+    if kind not in KINDS:
+        raise ValueError(f"Okänd larmtyp: {kind}")
+    if kind in NEEDS_THRESHOLD:
+        if threshold is None or not np.isfinite(threshold) or threshold <= 0:
+            raise ValueError("Nivån måste vara ett positivt tal.")
+    else:
+        threshold = None
+
+    rows = conn.execute(
+        "SELECT ts, close FROM prices WHERE ticker = ? ORDER BY ts DESC LIMIT ?", (ticker, LOOKBACK)
+    ).fetchall()
+    last_ts = last_close = ref = None
+    if rows:
+        last_ts, last_close = rows[0][0][:10], float(rows[0][1])
+        closes = [float(r[1]) for r in rows]
+        ref = max(closes) if kind == "new_high" else min(closes) if kind == "new_low" else None
+    cur = conn.execute(
+        """INSERT INTO alert_rules(user, ticker, kind, threshold, last_ts, last_close, ref)
+           VALUES (?,?,?,?,?,?,?)""",
+        (user, ticker, kind, threshold, last_ts, last_close, ref),
+    )
+    # första regeln: markören börjar vid nuvarande historik (regeln har redan
+    # sitt tillstånd), annars läser första evaluate() igenom hela prices
+    conn.execute("INSERT OR IGNORE INTO alert_cursor(id, price_id) SELECT 1, COALESCE(MAX(id), 0) FROM prices")
+    conn.commit()
+    return int(cur.lastrowid)
+
+
+def remove_rules(conn: sqlite3.Connection, user: str, ids: list[int]) -> int:
+    if not ids:
+        return 0
+    placeholders = ",".join("?" * len(ids))
+    cur = conn.execute(f"DELETE FROM alert_rules WHERE user = ? AND id IN ({placeholders})", [user, *ids])
+    conn.commit()
+    return cur.rowcount
+
+
+def list_rules(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
+    q = """
+    SELECT id, ticker, kind, threshold, last_ts, last_close
+    FROM alert_rules WHERE user = ? AND active = 1
+    ORDER BY ticker, id
+    """
+    return pd.read_sql_query(q, conn, params=(user,))
+
+
+# ---------- Utlösta larm ----------
+
+@telemetry.traced()
+def recent(conn: sqlite3.Connection, user: str, limit: int = 20) -> pd.DataFrame:
+    """Senaste larmen (nyast först) med kolumnerna id, ts, ticker, kind, close, message, seen."""
+    q = """
+    SELECT id, ts, ticker, kind, close, message, seen
+    FROM alerts WHERE user = ?
+    ORDER BY ts DESC, id DESC LIMIT ?
+    """
+    return pd.read_sql_query(q, conn, params=(user, int(limit)))
+
+
+def mark_seen(conn: sqlite3.Connection, user: str) -> int:
+    cur = conn.execute("UPDATE alerts SET seen = 1 WHERE user = ? AND seen = 0", (user,))
+    conn.commit()
+    return cur.rowcount
+
+
+# ---------- Vektoriserade kontroller ----------
+
+def _cross_up(prev: np.ndarray, close: np.ndarray, level: np.ndarray) -> np.ndarray:
+    return (prev <= level) & (close > level)
+
+
+def _cross_down(prev: np.ndarray, close: np.ndarray, level: np.ndarray) -> np.ndarray:
+    return (prev >= level) & (close < level)
+
+
+# typ -> kontroll över staplarna (b: dict med arrayer, en post per regel × stapel)
+CHECKS = {
+    "above": lambda b: _cross_up(b["prev"], b["close"], b["level"]),
+    "below": lambda b: _cross_down(b["prev"], b["close"], b["level"]),
+    "move_pct": lambda b: np.abs(b["close"] / b["prev"] - 1.0) * 100.0 >= b["level"],
+    "new_high": lambda b: b["close"] > b["high"],
+    "new_low": lambda b: b["close"] < b["low"],
+    "drawdown": lambda b: _cross_down(b["prev"], b["close"], b["level"]),
+}
+
+
+def _message(kind: str, ticker: str, close: float, prev: float, level: float, cost: float) -> str:
+    if kind == "above":
+        return f"{ticker} stängde på {close:.2f}, över {level:.2f}"
+    if kind == "below":
+        return f"{ticker} stängde på {close:.2f}, under {level:.2f}"
+    if kind == "move_pct":
+        return f"{ticker} rörde sig {(close / prev - 1.0) * 100.0:+.1f} % till {close:.2f}"
+    if kind == "new_high":
+        return f"{ticker} ny högsta stängning: {close:.2f}"
+    if kind == "new_low":
+        return f"{ticker} ny lägsta stängning: {close:.2f}"
+    return f"{ticker} {(1.0 - close / cost) * 100.0:.1f} % under GAV ({close:.2f})"
+
+
+def _group_shift(values: np.ndarray, first: np.ndarray, start: np.ndarray) -> np.ndarray:
+    """Föregående värde inom gruppen; start (per post) på gruppens första post."""
+    out = np.empty_like(values)
+    out[1:] = values[:-1]
+    return np.where(first, start, out)
+
+
+def _drawdown_costs(conn: sqlite3.Connection, users: np.ndarray, tickers: np.ndarray) -> np.ndarray:
+    """GAV i tickerns valuta per (user, ticker); NaN om det inte finns något innehav."""
+    out = np.full(len(users), np.nan)
+    rates = fx.latest_rates(conn, list(tickers))
+    for u in set(users.tolist()):
+        avg = portfolio.running_avg_costs(conn, u)
+        if avg.empty:
+            continue
+        cost = dict(zip(avg["ticker"], avg["avg_buy_price"]))
+        m = users == u
+        out[m] = [cost.get(t, np.nan) for t in tickers[m]]
+    return out / rates
+
+
+def _read_cursor(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT price_id FROM alert_cursor WHERE id = 1").fetchone()
+    return int(row[0]) if row else 0
+
+
+@telemetry.traced()
+def evaluate(conn: sqlite3.Connection) -> int:
+    """
+    Utvärderar reglerna mot prices-rader som tillkommit sedan förra körningen.
+    Anropas efter commit; returnerar antalet nya larm.
+    """
+    try:
+        conn.execute("BEGIN IMMEDIATE")       # en utvärderare åt gången per DB
+    except sqlite3.OperationalError:
+        return 0
+    try:
+        try:
+            after = _read_cursor(conn)
+        except sqlite3.OperationalError:      # DB utan larmtabeller
+            conn.rollback()
+            return 0
+        fired = _evaluate(conn, after)
+        conn.commit()
+        return fired
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _evaluate(conn: sqlite3.Connection, after: int) -> int:
+    # NOT INDEXED: annars väljer planeraren uq_prices för sorteringen och går
+    # igenom hela historiken i stället för id-intervallet
+    bars = conn.execute(
+        "SELECT id, ticker, ts, close FROM prices NOT INDEXED WHERE id > ? ORDER BY ticker, ts", (after,)
+    ).fetchall()
+    if not bars:
+        return 0
+    _set_cursor(conn, max(b[0] for b in bars))
+    rules = conn.execute(
+        """SELECT id, user, ticker, kind, threshold, last_ts, last_close, ref
+           FROM alert_rules
+           WHERE active = 1 AND ticker IN (SELECT DISTINCT ticker FROM prices NOT INDEXED WHERE id > ?)
+           ORDER BY id""",
+        (after,),
+    ).fetchall()
+    if not rules:
+        return 0
+
+    # staplar: sorterade per ticker, ett segment per ticker
+    b_ticker = np.array([b[1] for b in bars], dtype=object)
+    b_day = np.array([b[2][:10] for b in bars], dtype="datetime64[D]")
+    b_close = np.array([b[3] for b in bars], dtype=float)
+    uniq, seg_start = np.unique(b_ticker, return_index=True)
+    seg_end = np.append(seg_start[1:], len(b_ticker))
+
+    # regler som arrayer
+    r_id = np.array([r[0] for r in rules])
+    r_user = np.array([r[1] for r in rules], dtype=object)
+    r_ticker = np.array([r[2] for r in rules], dtype=object)
+    r_kind = np.array([r[3] for r in rules], dtype=object)
+    r_thr = np.array([np.nan if r[4] is None else r[4] for r in rules], dtype=float)
+    r_day = np.array([r[5][:10] if r[5] else "NaT" for r in rules], dtype="datetime64[D]")
+    r_last = np.array([np.nan if r[6] is None else r[6] for r in rules], dtype=float)
+    r_ref = np.array([np.nan if r[7] is None else r[7] for r in rules], dtype=float)
+    seeded = ~np.isnat(r_day)
+
+    # nivå per regel (drawdown: GAV i tickerns valuta minus threshold %)
+    r_level = r_thr.copy()
+    r_cost = np.full(len(rules), np.nan)
+    dd = r_kind == "drawdown"
+    if dd.any():
+        r_cost[dd] = _drawdown_costs(conn, r_user[dd], r_ticker[dd])
+        r_level[dd] = r_cost[dd] * (1.0 - r_thr[dd] / 100.0)
+
+    # en post per (regel, ny stapel efter regelns senaste dag)
+    seg = np.searchsorted(uniq, r_ticker)
+    n = seg_end[seg] - seg_start[seg]
+    rule = np.repeat(np.arange(len(rules)), n)
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    bar = np.repeat(seg_start[seg], n) + offset
+    keep = ~(b_day[bar] <= r_day[rule])
+    rule, bar = rule[keep], bar[keep]
+    if not len(rule):
+        return 0
+    close = b_close[bar]
+    first = np.r_[True, rule[1:] != rule[:-1]]
+    last = np.r_[rule[1:] != rule[:-1], True]
+    group_max = pd.Series(close).groupby(rule).cummax().to_numpy()
+    group_min = pd.Series(close).groupby(rule).cummin().to_numpy()
+    b = {
+        "close": close,
+        "prev": _group_shift(close, first, r_last[rule]),
+        "level": r_level[rule],
+        "high": np.fmax(_group_shift(group_max, first, np.nan), r_ref[rule]),
+        "low": np.fmin(_group_shift(group_min, first, np.nan), r_ref[rule]),
+    }
+
+    hit = np.zeros(len(rule), dtype=bool)
+    kind = r_kind[rule]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for k, check in CHECKS.items():
+            m = kind == k
+            if m.any():
+                hit[m] = check({key: v[m] for key, v in b.items()})
+    hit &= seeded[rule]
+
+    # nytt tillstånd för reglerna som fått staplar
+    touched = rule[last]
+    new_ref = r_ref[touched]
+    high = r_kind[touched] == "new_high"
+    low = r_kind[touched] == "new_low"
+    new_ref[high] = np.fmax(new_ref[high], group_max[last][high])
+    new_ref[low] = np.fmin(new_ref[low], group_min[last][low])
+    conn.executemany(
+        "UPDATE alert_rules SET last_ts = ?, last_close = ?, ref = ? WHERE id = ?",
+        [
+            (str(d), float(c), None if np.isnan(x) else float(x), int(i))
+            for d, c, x, i in zip(b_day[bar[last]], close[last], new_ref, r_id[touched])
+        ],
+    )
+
+    now = time.time()
+    fired = [
+        (int(r_id[r]), r_user[r], r_ticker[r], str(b_day[j]), r_kind[r], float(c),
+         _message(r_kind[r], r_ticker[r], float(c), float(p), float(r_level[r]), float(r_cost[r])), now)
+        for r, j, c, p in zip(rule[hit], bar[hit], close[hit], b["prev"][hit])
+    ]
+    cur = conn.executemany(
+        """INSERT OR IGNORE INTO alerts(rule_id, user, ticker, ts, kind, close, message, fired_at)
+           VALUES (?,?,?,?,?,?,?,?)""",
+        fired,
+    )
+    return cur.rowcount if fired else 0
+
+
+def _set_cursor(conn: sqlite3.Connection, price_id: int) -> None:
+    conn.execute(
+        """INSERT INTO alert_cursor(id, price_id) VALUES (1, ?)
+           ON CONFLICT(id) DO UPDATE SET price_id = excluded.price_id""",
+        (int(price_id),),
+    )
@@ -0,0 +1,257 @@
+# app/services/backtest.py
+"""
+Backtest av enkla regler (likaviktning, momentum) över prices-panelen
+(datum × ticker).
+
+En strategi är en funktion (kurser, signalrader, parametrar) -> målvikter
+för de raderna. Signalen på rad t använder bara kurser t.o.m. t och handlas
+på stängningskursen rad t+1. Kontoföringen är vektoriserad över tickers:
+per ombalansering räknas målantal (hela aktier), affärer, courtage och
+kassa fram för alla tickers på en gång; mellan ombalanseringarna är
+innehav och kassa konstanta och fylls ut som paneler.
+
+Courtage räknas per affär som max(min_fee, fee_rate × belopp) och bokförs
+som i trades/performance: köp -(belopp + fee), sälj belopp - fee. Affärerna
+har samma kolumner som trades-tabellen (ts, ticker, side, qty, price, fee).
+TWR räknas med performance.twr_index, alltså på samma sätt som Dashboard.
+
+Parametersvep körs i en processpool där panelen skickas en gång per process.
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.config import START_CASH
+from app.services import performance
+from app.services import risk
+
+TRADING_DAYS = 252
+FEE_RATE = 0.0025     # 0,25 % av beloppet
+MIN_FEE = 1.0         # SEK per affär
+
+# (kurser[T × N], signalrader, parametrar) -> målvikter[len(rader) × N]
+Strategy = Callable[[np.ndarray, np.ndarray, dict], np.ndarray]
+
+
+# ---------- Strategier ----------
+
+def equal_weight(prices: np.ndarray, rows: np.ndarray, params: dict) -> np.ndarray:
+    """Lika vikt i alla tickers som har kurs på signaldagen."""
+    listed = np.isfinite(prices[rows])
+    n = listed.sum(axis=1, keepdims=True)
+    return np.divide(listed, n, out=np.zeros(listed.shape), where=n > 0)
+
+
+def momentum(prices: np.ndarray, rows: np.ndarray, params: dict) -> np.ndarray:
+    """
+    Lika vikt i de top_n tickers med högst avkastning över lookback dagar
+    (bara positiv avkastning; resten ligger i kassa).
+    """
+    lookback, top_n = int(params.get("lookback", 126)), int(params.get("top_n", 10))
+    past = rows - lookback
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = prices[rows] / np.where(past[:, None] >= 0, prices[np.maximum(past, 0)], np.nan) - 1.0
+    score = np.where(np.isfinite(score) & (score > 0), score, -np.inf)
+    k = min(top_n, score.shape[1])
+    top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+    picked = np.zeros(score.shape, dtype=bool)
+    np.put_along_axis(picked, top, True, axis=1)
+    picked &= np.isfinite(score)
+    return picked / float(top_n)
+
+
+STRATEGIES: dict[str, Strategy] = {"equal_weight": equal_weight, "momentum": momentum}
+
+
+def signal_rows(prices: np.ndarray, rebalance: int, warmup: int = 0) -> np.ndarray:
+    """Var rebalance:e dag från första dagen med någon kurs (+ warmup)."""
+    has = np.isfinite(prices).any(axis=1)
+    if not has.any():
+        return np.array([], dtype=int)
+    first = int(has.argmax()) + warmup
+    return np.arange(first, prices.shape[0] - 1, max(1, int(rebalance)))
+
+
+def load_panel(conn: sqlite3.Connection, start: Optional[date], end: date,
+               tickers: Optional[list[str]] = None) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """Kurspanel för backtest: bara framåtfyllning, NaN före första kursen."""
+    return performance.load_price_panel(conn, tickers or risk.price_tickers(conn), start, end, fill="ffill")
+
+
+# ---------- Kontoföring ----------
+
+def _fees(gross: np.ndarray, traded: np.ndarray, fee_rate: float, min_fee: float) -> np.ndarray:
+    return np.where(traded, np.maximum(min_fee, fee_rate * gross), 0.0)
+
+
+def simulate(
+    prices: np.ndarray,
+    strategy: str,
+    params: dict,
+    start_cash: float = START_CASH,
+    fee_rate: float = FEE_RATE,
+    min_fee: float = MIN_FEE,
+) -> dict:
+    """
+    Kör strategin och returnerar paneler: exec_rows, qty (per exec-rad),
+    cash, trade_qty (signerat), trade_fee, qty_panel, cash_panel, equity.
+    """
+    T, N = prices.shape
+    warmup = int(params.get("lookback", 0)) if strategy == "momentum" else 0
+    rows = signal_rows(prices, params.get("rebalance", 21), warmup)
+    weights = STRATEGIES[strategy](prices, rows, params) if len(rows) else np.empty((0, N))
+    exec_rows = rows + 1
+
+    Q = np.zeros((len(rows), N))
+    C = np.zeros(len(rows))
+    D = np.zeros((len(rows), N))
+    F = np.zeros((len(rows), N))
+    qty = np.zeros(N)
+    cash = float(start_cash)
+    for k, t in enumerate(exec_rows):
+        p = prices[t]
+        ok = np.isfinite(p) & (p > 0)
+        px = np.where(ok, p, 0.0)
+        equity = cash + qty @ px
+        target = np.where(ok, np.floor(weights[k] * equity / np.where(ok, p, 1.0)), qty)
+        delta = target - qty
+
+        sell = delta < 0
+        gross = np.abs(delta) * px
+        fee = _fees(gross, delta != 0, fee_rate, min_fee)
+        cash += float((gross - fee)[sell].sum())
+
+        # köp som inte ryms i kassan skalas ned (courtagets minimibelopp kan
+        # göra en nedskalning otillräcklig, därför några varv)
+        buy = delta > 0
+        for _ in range(4):
+            need = float((gross + fee)[buy].sum())
+            if need <= cash:
+                break
+            delta[buy] = np.floor(delta[buy] * max(cash, 0.0) / need)
+            gross = np.abs(delta) * px
+            fee = _fees(gross, delta != 0, fee_rate, min_fee)
+            buy = delta > 0
+        if float((gross + fee)[buy].sum()) > cash:
+            delta[buy], fee[buy], buy[:] = 0.0, 0.0, False
+        cash -= float((gross + fee)[buy].sum())
+
+        qty = qty + delta
+        Q[k], C[k], D[k], F[k] = qty, cash, delta, fee
+
+    seg = np.searchsorted(exec_rows, np.arange(T), side="right") - 1
+    qty_panel = np.where(seg[:, None] >= 0, Q[np.maximum(seg, 0)] if len(Q) else 0.0, 0.0)
+    cash_panel = np.where(seg >= 0, C[np.maximum(seg, 0)] if len(C) else 0.0, float(start_cash))
+    equity = cash_panel + (qty_panel * np.nan_to_num(prices)).sum(axis=1)
+    return {
+        "exec_rows": exec_rows, "qty": Q, "cash": C, "trade_qty": D, "trade_fee": F,
+        "qty_panel": qty_panel, "cash_panel": cash_panel, "equity": equity,
+    }
+
+
+def stats(dates: np.ndarray, prices: np.ndarray, sim: dict, start_cash: float = START_CASH) -> dict:
+    equity = sim["equity"]
+    out = {"total_return": np.nan, "cagr": np.nan, "vol_ann": np.nan, "max_drawdown": np.nan,
+           "twr": np.nan, "fees": float(sim["trade_fee"].sum()), "trades": int((sim["trade_qty"] != 0).sum())}
+    if len(equity) < 2:
+        return out
+    years = (dates[-1] - dates[0]) / np.timedelta64(1, "D") / 365.25
+    out["total_return"] = float(equity[-1] / start_cash - 1.0)
+    if years > 0 and equity[-1] > 0:
+        out["cagr"] = float((equity[-1] / start_cash) ** (1.0 / years) - 1.0)
+    ret = equity[1:] / equity[:-1] - 1.0
+    out["vol_ann"] = float(np.std(ret, ddof=1) * np.sqrt(TRADING_DAYS))
+    out["max_drawdown"] = float((equity / np.maximum.accumulate(equity) - 1.0).min())
+    twr = performance.twr_index(np.nan_to_num(prices), sim["qty_panel"])
+    if twr is not None:
+        out["twr"] = float(twr[0][-1] / 100.0 - 1.0)
+    return out
+
+
+def run(
+    dates: np.ndarray,
+    tickers: list[str],
+    prices: np.ndarray,
+    strategy: str,
+    params: dict,
+    start_cash: float = START_CASH,
+    fee_rate: float = FEE_RATE,
+    min_fee: float = MIN_FEE,
+) -> dict:
+    """
+    En körning med resultat för visning: equity (Series), twr (Series, index
+    100), trades (DataFrame som trades-tabellen) och stats.
+    """
+    sim = simulate(prices, strategy, params, start_cash, fee_rate, min_fee)
+    idx = pd.DatetimeIndex(dates)
+    twr = performance.twr_index(np.nan_to_num(prices), sim["qty_panel"])
+    k, j = np.nonzero(sim["trade_qty"])
+    d = sim["trade_qty"][k, j]
+    rows = sim["exec_rows"][k]
+    trades = pd.DataFrame({
+        "ts": idx[rows].strftime("%Y-%m-%d"),
+        "ticker": np.asarray(tickers, dtype=object)[j],
+        "side": np.where(d > 0, "BUY", "SELL"),
+        "qty": np.abs(d),
+        "price": prices[rows, j],
+        "fee": sim["trade_fee"][k, j],
+    })
+    return {
+        "equity": pd.Series(sim["equity"], index=idx, name="Equity"),
+        "twr": pd.Series(twr[0], index=idx[twr[1]:], name="TWR") if twr else pd.Series(dtype="float64", name="TWR"),
+        "trades": trades,
+        "stats": stats(dates, prices, sim, start_cash),
+    }
+
+
+# ---------- Parametersvep ----------
+
+# Sätts i varje arbetsprocess av _init
+_panel: dict = {}
+
+
+def _init(dates: np.ndarray, prices: np.ndarray) -> None:
+    _panel.update(dates=dates, prices=prices)
+
+
+def _sweep_one(strategy: str, params: dict, costs: dict) -> dict:
+    sim = simulate(_panel["prices"], strategy, params, **costs)
+    return stats(_panel["dates"], _panel["prices"], sim, costs.get("start_cash", START_CASH))
+
+
+def param_grid(**values: list) -> list[dict]:
+    """Alla kombinationer: param_grid(lookback=[63, 126], top_n=[5, 10])."""
+    keys = list(values)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(values[k] for k in keys))]
+
+
+def sweep(
+    dates: np.ndarray,
+    prices: np.ndarray,
+    strategy: str,
+    grid: list[dict],
+    workers: Optional[int] = None,
+    **costs,
+) -> pd.DataFrame:
+    """Stats per parameteruppsättning (en rad per grid-element, samma ordning)."""
+    results: list[dict] = [{}] * len(grid)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(grid)))
+    if workers == 1:
+        _init(dates, prices)
+        results = [_sweep_one(strategy, p, costs) for p in grid]
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init, initargs=(dates, prices)) as pool:
+            futures = {pool.submit(_sweep_one, strategy, p, costs): i for i, p in enumerate(grid)}
+            for fut in as_completed(futures):
+                results[futures[fut]] = fut.result()
+    return pd.concat([pd.DataFrame(grid), pd.DataFrame(results)], axis=1)
@@ -0,0 +1,139 @@
+# app/services/covariance.py
+"""
+Kovariansskattningar för optimeraren, per (tickers, fönster i handelsdagar).
+
+Avkastningarna tas från riskmodellens panel (risk.get_model), som redan
+läses inkrementellt från prices. Lagret håller summor över de senaste
+`window` dagarna där alla tickers har avkastning: antal, sum r, sum r r^T
+samt sum |r|^2, sum |r|^4-termer som behövs för Ledoit-Wolf. En ny dag är
+en rank-ett-uppdatering (+ r r^T) och en dag som faller ur fönstret en
+rank-ett-nedräkning (- r r^T); flera dagar åt gången läggs på som en
+summa av sådana (X^T X).
+
+Skattningen krymps mot skalad identitet enligt Ledoit & Wolf (2004), med
+krympningsfaktorn räknad ur samma summor, och anges på årsbasis.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+from typing import Sequence
+
+import numpy as np
+import sqlite3
+
+from app.services import db
+from app.services import risk
+
+TRADING_DAYS = 252
+STORE_CACHE_SIZE = 16
+
+
+class CovarianceStore:
+    """Glidande summor för en fast ticker-uppsättning och ett fönster."""
+
+    def __init__(self, tickers: Sequence[str], window: int) -> None:
+        self.tickers = list(tickers)
+        self.window = int(window)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        p = len(self.tickers)
+        self.n = 0
+        self.s1 = np.zeros(p)           # sum r
+        self.s2 = np.zeros((p, p))      # sum r r^T
+        self.sa = 0.0                   # sum |r|^2
+        self.sa2 = 0.0                  # sum |r|^4
+        self.sar = np.zeros(p)          # sum |r|^2 r
+        self.included: deque[int] = deque()   # radindex i modellens panel
+        self.consumed = 0               # antal modellrader som gåtts igenom
+        self.model_rebuilds = None
+
+    def _apply(self, X: np.ndarray, sign: float) -> None:
+        if not len(X):
+            return
+        a = np.einsum("ij,ij->i", X, X)
+        self.n += int(sign) * len(X)
+        self.s1 += sign * X.sum(axis=0)
+        self.s2 += sign * (X.T @ X)
+        self.sa += sign * float(a.sum())
+        self.sa2 += sign * float(a @ a)
+        self.sar += sign * (a @ X)
+
+    def update(self, model: risk.RiskModel) -> None:
+        """Tar in modellens nya rader; omräkning om modellen själv räknats om."""
+        cols = [model.columns.index(t) for t in self.tickers]
+        with self._lock:
+            if model.rebuilds != self.model_rebuilds or self.consumed > len(model.returns):
+                self._reset()
+                self.model_rebuilds = model.rebuilds
+            new = model.returns[self.consumed:, cols]
+            idx = np.flatnonzero(np.isfinite(new).all(axis=1)) + self.consumed
+            self.consumed = len(model.returns)
+            if len(idx) >= self.window:
+                # hela fönstret byts ut: börja om med bara de sista dagarna
+                self._reset()
+                self.model_rebuilds, self.consumed = model.rebuilds, len(model.returns)
+                idx = idx[-self.window:]
+            self._apply(model.returns[np.ix_(idx, cols)], +1.0)
+            self.included.extend(idx.tolist())
+            drop = [self.included.popleft() for _ in range(max(0, len(self.included) - self.window))]
+            if drop:
+                self._apply(model.returns[np.ix_(drop, cols)], -1.0)
+
+    def estimate(self) -> dict:
+        """
+        {"tickers", "cov" (årlig, krympt), "mean" (årlig medelavkastning),
+        "shrinkage" (0 = stickprov, 1 = skalad identitet), "days"}.
+        """
+        p, T = len(self.tickers), self.n
+        if T < 2:
+            return {"tickers": self.tickers, "cov": np.full((p, p), np.nan), "mean": np.full(p, np.nan),
+                    "shrinkage": np.nan, "days": T}
+        m = self.s1 / T
+        S = self.s2 / T - np.outer(m, m)
+        # sum_t |r_t - m|^4 ur summorna (utvecklat kring medelvärdet)
+        mm = float(m @ m)
+        rm = self.s1 @ m
+        q2 = (self.sa2 + 4 * float(m @ self.s2 @ m) + T * mm * mm
+              - 4 * float(self.sar @ m) + 2 * mm * self.sa - 4 * mm * rm)
+        mu = float(np.trace(S)) / p
+        target = mu * np.eye(p)
+        d2 = float(((S - target) ** 2).sum())
+        b2 = min(max((q2 / T - float((S * S).sum())) / T, 0.0), d2)
+        shrink = b2 / d2 if d2 > 0 else 1.0
+        cov = shrink * target + (1.0 - shrink) * S
+        return {"tickers": self.tickers, "cov": cov * TRADING_DAYS, "mean": m * TRADING_DAYS,
+                "shrinkage": float(shrink), "days": T}
+
+
+# ---------- Processcache ----------
+
+_stores: "OrderedDict[tuple, CovarianceStore]" = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def get_estimate(conn: sqlite3.Connection, tickers: Sequence[str], window: int,
+                 anchor: date | None = None) -> dict:
+    """Krympt kovarians för tickers över de senaste window dagarna, uppdaterad mot prices."""
+    tickers = sorted(set(tickers) - {risk.BENCHMARK})
+    start = risk.lookback_start(anchor or date.today(), window // TRADING_DAYS + 1)
+    model = risk.get_model(conn, tickers, start)
+    key = (db.database_path(conn) or id(conn), tuple(tickers), int(window), start)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = CovarianceStore(tickers, window)
+            while len(_stores) > STORE_CACHE_SIZE:
+                _stores.popitem(last=False)
+        else:
+            _stores.move_to_end(key)
+    store.update(model)
+    return store.estimate()
+
+
+def clear_cache() -> None:
+    with _stores_lock:
+        _stores.clear()
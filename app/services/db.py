@@ -6,14 +6,16 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[2]
 DB_PATH = ROOT / "data" / "data.db"
 
-# Enkel logger
+# Loggningen konfigureras av den som startar processen (etl.py, api.py, Streamlit)
 logger = logging.getLogger(__name__)
-if not logger.handlers:
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Höjs när ensure_schema ändras; lagras i filens PRAGMA user_version så att
+# DDL:en bara körs en gång per databasfil och inte vid varje anslutning.
+SCHEMA_VERSION = 1
 
 def get_conn() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    logger.info("Öppnar SQLite-anslutning mot %s", DB_PATH)
+    logger.debug("Öppnar SQLite-anslutning", extra={"db_path": str(DB_PATH)})
 
     # Viktigt: tillåt användning från flera trådar i Streamlit
     conn = sqlite3.connect(
@@ -32,9 +34,13 @@ def get_conn() -> sqlite3.Connection:
 def ensure_schema(conn: sqlite3.Connection) -> None:
     """
     Skapar nödvändiga tabeller om de saknas.
-    Lämnar eventuell befintlig tabell 'prices' orörd.
+    Lämnar eventuell befintlig tabell 'prices' orörd. Gör ingenting om filen
+    redan har SCHEMA_VERSION.
     """
-    logger.info("Säkerställer schema (trades, watchlist).")
+    (current,) = conn.execute("PRAGMA user_version").fetchone()
+    if current >= SCHEMA_VERSION:
+        return
+    logger.info("Säkerställer schema", extra={"schema_version": SCHEMA_VERSION, "from_version": current})
     conn.executescript(
         """
         CREATE TABLE IF NOT EXISTS trades(
@@ -48,17 +54,90 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
           fee REAL DEFAULT 0.0
         );
 
+        -- Intervall-läsningar per användare och datum (as-of, historik)
+        CREATE INDEX IF NOT EXISTS ix_trades_user_ts ON trades(user, ts, id);
+        CREATE INDEX IF NOT EXISTS ix_trades_user_ticker_ts ON trades(user, ticker, ts, id);
+
         CREATE TABLE IF NOT EXISTS watchlist(
           id INTEGER PRIMARY KEY,
           user TEXT NOT NULL,
           ticker TEXT NOT NULL,
           UNIQUE(user, ticker)
         );
+
+        -- Versionsräknare per datadomän (se versions.py)
+        CREATE TABLE IF NOT EXISTS data_versions(
+          domain TEXT PRIMARY KEY,
+          version INTEGER NOT NULL DEFAULT 0
+        );
+
+        -- Delad kurscache för alla sessioner/processer (se quotes.py)
+        CREATE TABLE IF NOT EXISTS quotes(
+          ticker TEXT PRIMARY KEY,
+          price REAL,
+          ts TEXT,                 -- kursens datum
+          fetched_at REAL,         -- unix-tid för senaste lyckade hämtning
+          refreshing_until REAL    -- lease: ingen annan hämtar före denna tid
+        );
+
+        -- Valuta per värdepapper och växelkurser mot SEK (fylls av ETL, se fx.py)
+        CREATE TABLE IF NOT EXISTS securities(
+          ticker TEXT PRIMARY KEY,
+          currency TEXT NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS fx_rates(
+          ccy TEXT NOT NULL,
+          ts TEXT NOT NULL,
+          rate REAL NOT NULL,      -- SEK per enhet
+          PRIMARY KEY(ccy, ts)
+        );
+
+        -- Kurslarm: regler med löpande tillstånd, utlösta larm och markör i prices (se alerts.py)
+        CREATE TABLE IF NOT EXISTS alert_rules(
+          id INTEGER PRIMARY KEY,
+          user TEXT NOT NULL,
+          ticker TEXT NOT NULL,
+          kind TEXT NOT NULL,      -- above/below/move_pct/new_high/new_low/drawdown
+          threshold REAL,
+          active INTEGER NOT NULL DEFAULT 1,
+          last_ts TEXT,            -- senaste utvärderade kursdag
+          last_close REAL,
+          ref REAL                 -- löpande max/min (new_high/new_low)
+        );
+        CREATE INDEX IF NOT EXISTS ix_alert_rules_ticker ON alert_rules(ticker) WHERE active = 1;
+        CREATE INDEX IF NOT EXISTS ix_alert_rules_user ON alert_rules(user);
+
+        CREATE TABLE IF NOT EXISTS alerts(
+          id INTEGER PRIMARY KEY,
+          rule_id INTEGER NOT NULL,
+          user TEXT NOT NULL,
+          ticker TEXT NOT NULL,
+          ts TEXT NOT NULL,        -- kursdagen som utlöste larmet
+          kind TEXT NOT NULL,
+          close REAL NOT NULL,
+          message TEXT NOT NULL,
+          fired_at REAL NOT NULL,
+          seen INTEGER NOT NULL DEFAULT 0,
+          UNIQUE(rule_id, ts)
+        );
+        CREATE INDEX IF NOT EXISTS ix_alerts_user_ts ON alerts(user, ts);
+
+        CREATE TABLE IF NOT EXISTS alert_cursor(
+          id INTEGER PRIMARY KEY CHECK (id = 1),
+          price_id INTEGER NOT NULL  -- högsta prices.id som utvärderats
+        );
         """
+        f"PRAGMA user_version = {SCHEMA_VERSION};"
     )
     conn.commit()
     logger.info("Schema klart.")
 
+def database_path(conn: sqlite3.Connection) -> str:
+    """Filsökväg för anslutningens main-databas ('' för in-memory)."""
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row and row[2] else ""
+
 # Testsektion (kör bara om man kör filen direkt)
 if __name__ == "__main__":
     conn = get_conn()
@@ -0,0 +1,146 @@
+# app/services/fx.py
+"""
+Valutor och växelkurser. Allt värderas i basvalutan (SEK).
+
+Valuta per värdepapper står i tabellen securities (fylls av ETL:en från
+Yahoos metadata). Saknas raden gäller börssuffixet (.ST -> SEK, .HE -> EUR,
+...) och annars basvalutan. Kurserna ligger i fx_rates som SEK per enhet
+(ccy, ts, rate), också de fyllda av ETL:en.
+
+Omräkning sker som paneler: för en datumaxel byggs en matris datum × valuta
+(senast kända kurs per dag, före första kursen den första) som multipliceras
+in i kurspanelen i ett steg. Kursserierna och korsmatriserna cachas på
+fx-versionen (ETL:en bumpar den när valutor eller växelkurser läses in,
+men inte för vanliga kursrader). Finns
+ingen kurs alls för en valuta blir värdena NaN – hellre ett tomt fält än en
+USD-kurs som räknas som kronor.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.services import versions
+from app.services import telemetry
+
+BASE = "SEK"
+SUFFIX_CURRENCY = {
+    ".ST": "SEK", ".HE": "EUR", ".CO": "DKK", ".OL": "NOK", ".IC": "ISK",
+    ".DE": "EUR", ".PA": "EUR", ".AS": "EUR", ".MI": "EUR", ".L": "GBP",
+    ".SW": "CHF", ".TO": "CAD",
+}
+
+
+def guess_currency(ticker: str) -> str:
+    for suffix, ccy in SUFFIX_CURRENCY.items():
+        if ticker.upper().endswith(suffix):
+            return ccy
+    return BASE
+
+
+def _read_currencies(conn: sqlite3.Connection) -> dict[str, str]:
+    try:
+        return dict(conn.execute("SELECT ticker, currency FROM securities WHERE currency IS NOT NULL"))
+    except sqlite3.OperationalError:   # äldre DB utan tabellen
+        return {}
+
+
+def currencies(conn: sqlite3.Connection, tickers: Sequence[str]) -> list[str]:
+    """Valuta per ticker, i samma ordning."""
+    known = versions.cached(conn, [versions.FX], ("fx_currencies",), lambda: _read_currencies(conn))
+    return [known.get(t) or guess_currency(t) for t in tickers]
+
+
+def all_base(conn: sqlite3.Connection, tickers: Sequence[str]) -> bool:
+    return all(c == BASE for c in currencies(conn, tickers))
+
+
+def _read_series(conn: sqlite3.Connection, ccy: str) -> tuple[np.ndarray, np.ndarray]:
+    try:
+        rows = conn.execute("SELECT ts, rate FROM fx_rates WHERE ccy = ? ORDER BY ts", (ccy,)).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    if not rows:
+        return np.array([], dtype="datetime64[ns]"), np.array([])
+    ts, rate = zip(*rows)
+    dates = pd.to_datetime(pd.Index(ts), format="ISO8601").normalize().to_numpy(dtype="datetime64[ns]")
+    return dates, np.asarray(rate, dtype=float)
+
+
+def series(conn: sqlite3.Connection, ccy: str) -> tuple[np.ndarray, np.ndarray]:
+    """(datum, SEK per enhet) för ccy; cachad på fx-versionen."""
+    return versions.cached(conn, [versions.FX], ("fx_series", ccy), lambda: _read_series(conn, ccy))
+
+
+def _panel(conn: sqlite3.Connection, ccys: tuple[str, ...], dates: np.ndarray) -> np.ndarray:
+    out = np.ones((len(dates), len(ccys)))
+    for j, ccy in enumerate(ccys):
+        if ccy == BASE:
+            continue
+        fx_dates, rates = series(conn, ccy)
+        if not len(rates):
+            out[:, j] = np.nan
+            continue
+        idx = np.searchsorted(fx_dates, dates, side="right") - 1
+        out[:, j] = rates[np.maximum(idx, 0)]
+    return out
+
+
+def rate_panel(conn: sqlite3.Connection, ccys: Sequence[str], dates: np.ndarray) -> np.ndarray:
+    """
+    SEK per enhet, datum × valuta (as-of: senaste kurs <= dagen). Cachad på
+    (valutor, datumaxel, fx-version) – samma axel återkommer mellan körningar.
+    """
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    ccys = tuple(ccys)
+    if not len(dates):
+        return np.ones((0, len(ccys)))
+    key = ("fx_panel", ccys, hashlib.blake2b(dates.tobytes(), digest_size=16).digest())
+    return versions.cached(conn, [versions.FX], key, lambda: _panel(conn, ccys, dates))
+
+
+def cross_rates(conn: sqlite3.Connection, frm: str, to: str, dates: np.ndarray) -> np.ndarray:
+    """Enheter `to` per enhet `frm` per dag (via SEK-kurserna)."""
+    panel = rate_panel(conn, [frm, to], dates)
+    return panel[:, 0] / panel[:, 1]
+
+
+def to_base(conn: sqlite3.Connection, prices: np.ndarray, tickers: Sequence[str], dates: np.ndarray) -> np.ndarray:
+    """Kurspanel (datum × ticker) i lokal valuta -> SEK, en multiplikation."""
+    ccy = currencies(conn, tickers)
+    if all(c == BASE for c in ccy):
+        return prices
+    codes, uniq = pd.factorize(pd.Index(ccy))
+    return prices * rate_panel(conn, list(uniq), dates)[:, codes]
+
+
+def rates_at(conn: sqlite3.Connection, tickers: Sequence[str], ts: Sequence[str]) -> np.ndarray:
+    """SEK per enhet av tickerns valuta vid respektive tidpunkt (t.ex. per trade)."""
+    ccy = currencies(conn, tickers)
+    if all(c == BASE for c in ccy):
+        return np.ones(len(ccy))
+    c_codes, c_uniq = pd.factorize(pd.Index(ccy))
+    day = pd.to_datetime(pd.Index(ts), format="ISO8601").normalize()
+    d_codes, d_uniq = pd.factorize(day, sort=True)
+    panel = _panel(conn, tuple(c_uniq), pd.DatetimeIndex(d_uniq).to_numpy(dtype="datetime64[ns]"))
+    return panel[d_codes, c_codes]
+
+
+def latest_rates(conn: sqlite3.Connection, tickers: Sequence[str]) -> np.ndarray:
+    """Senaste kända kurs (SEK per enhet) per ticker."""
+    out = np.ones(len(tickers))
+    for i, ccy in enumerate(currencies(conn, tickers)):
+        if ccy != BASE:
+            rates = series(conn, ccy)[1]
+            out[i] = rates[-1] if len(rates) else np.nan
+    return out
+
+
+@telemetry.traced()
+def missing(conn: sqlite3.Connection, tickers: Sequence[str]) -> list[str]:
+    """Valutor bland tickers som helt saknar växelkurser."""
+    return sorted({c for c in currencies(conn, tickers) if c != BASE and not len(series(conn, c)[1])})
@@ -0,0 +1,178 @@
+# app/services/montecarlo.py
+"""
+Monte Carlo-simulering av innehavens värde framåt: Value-at-Risk, Expected
+Shortfall och utfallsintervall för en horisont i handelsdagar.
+
+Två lägen:
+- "bootstrap": dagar dras med återläggning ur den historiska avkastnings-
+  panelen (hela rader, så korrelationen mellan tickers följer med).
+- "normal": korrelerade normalfördelade log-avkastningar med historiskt
+  medel och kovarians (Cholesky; egenvärdesfaktorisering om matrisen inte
+  är positivt definit).
+
+Innehaven hålls fasta under horisonten: slutvärdet är sum_i v_i * exp(sum_t
+log(1 + r_ti)). Banorna genereras i block (NumPy, ett block = en uppgift)
+och fördelas över en processpool. Varje block har ett eget frö från
+SeedSequence(seed).spawn(...), så samma seed ger samma resultat oavsett
+antal processer och i vilken ordning blocken blir klara. run() ger
+delresultat efter varje block så att sidan kan visa förlopp.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+import numpy as np
+
+MODES = ("bootstrap", "normal")
+LEVELS = (0.95, 0.99)
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+BLOCK_PATHS = 20_000
+SUMMARY_EVERY = 0.5   # sekunder mellan delresultatens kvantiler
+
+# Sätts i varje arbetsprocess av _init (och lokalt vid workers=1)
+_state: dict = {}
+
+
+def _init(log_returns: np.ndarray, values: np.ndarray, horizon: int, mode: str) -> None:
+    _state.clear()
+    _state.update(values=values, horizon=horizon, mode=mode)
+    if mode == "bootstrap":
+        _state["log_returns"] = log_returns
+    else:
+        cov = np.atleast_2d(np.cov(log_returns, rowvar=False))
+        try:
+            chol = np.linalg.cholesky(cov)
+        except np.linalg.LinAlgError:
+            w, v = np.linalg.eigh(cov)
+            chol = v * np.sqrt(np.clip(w, 0.0, None))
+        _state["mu"] = log_returns.mean(axis=0)
+        _state["chol"] = chol
+
+
+def _block(seed: np.random.SeedSequence, n: int) -> np.ndarray:
+    """Slutvärden för n banor (float64)."""
+    rng = np.random.default_rng(seed)
+    values, horizon = _state["values"], _state["horizon"]
+    if _state["mode"] == "bootstrap":
+        lr = _state["log_returns"]
+        acc = np.zeros((n, lr.shape[1]))
+        for _ in range(horizon):
+            acc += lr[rng.integers(0, len(lr), n)]
+    else:
+        # summan av horisontens dagar är själv normalfördelad: h*mu, h*Sigma
+        z = rng.standard_normal((n, len(values)))
+        acc = horizon * _state["mu"] + np.sqrt(horizon) * (z @ _state["chol"].T)
+    return np.exp(acc) @ values
+
+
+def _summary(terminal: np.ndarray, value0: float) -> dict:
+    loss = value0 - terminal
+    out = {"var": {}, "es": {}}
+    for a in LEVELS:
+        var = float(np.quantile(loss, a))
+        out["var"][a] = var
+        out["es"][a] = float(loss[loss >= var].mean())
+    out["quantiles"] = dict(zip(QUANTILES, np.quantile(terminal, QUANTILES).tolist()))
+    out["mean"] = float(terminal.mean())
+    return out
+
+
+def kept(returns: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Kolumner som prepare() behåller: värde > 0 och minst en avkastning."""
+    r = np.asarray(returns, dtype=float)
+    return (np.asarray(values, dtype=float) > 0) & np.isfinite(r).any(axis=0)
+
+
+def prepare(returns: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Log-avkastningar på dagar där alla tickers har data, och värden som
+    float. Tickers utan någon avkastning alls (eller värde 0) tas bort –
+    se kept() för vilka.
+    """
+    r = np.asarray(returns, dtype=float)
+    v = np.asarray(values, dtype=float)
+    keep = kept(r, v)
+    r, v = r[:, keep], v[keep]
+    r = r[np.isfinite(r).all(axis=1)]
+    return np.log1p(r), v
+
+
+def run(
+    log_returns: np.ndarray,
+    values: np.ndarray,
+    horizon: int = 10,
+    n_paths: int = 1_000_000,
+    mode: str = "bootstrap",
+    seed: int = 0,
+    workers: Optional[int] = None,
+    block: int = BLOCK_PATHS,
+) -> Iterator[dict]:
+    """
+    Simulerar n_paths banor och ger ett delresultat per färdigt block:
+    {"done", "total", "elapsed", "paths_per_sec", "value0", "var", "es",
+    "quantiles", "mean", "final"}. Sista delresultatet har final=True.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Okänt läge: {mode}")
+    if log_returns.ndim != 2 or len(log_returns) < 2 or not len(values):
+        raise ValueError("För lite historik för simulering")
+    values = np.asarray(values, dtype=float)
+    value0 = float(values.sum())
+    sizes = [block] * (n_paths // block) + ([n_paths % block] if n_paths % block else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(sizes)))
+    args = (log_returns, values, horizon, mode)
+
+    t0 = time.perf_counter()
+    parts: list[np.ndarray] = [None] * len(sizes)
+    done = 0
+    stats: dict = {}
+    stats_at = -SUMMARY_EVERY
+
+    def partial(final: bool) -> dict:
+        nonlocal stats, stats_at
+        elapsed = time.perf_counter() - t0
+        # kvantilerna kostar O(n) – räkna om dem högst var SUMMARY_EVERY sekund
+        if final or elapsed - stats_at >= SUMMARY_EVERY:
+            stats = _summary(np.concatenate([p for p in parts if p is not None]), value0)
+            stats_at = elapsed
+        return {
+            "done": done, "total": n_paths, "elapsed": elapsed,
+            "paths_per_sec": done / elapsed if elapsed > 0 else float("nan"),
+            "value0": value0, "final": final, **stats,
+        }
+
+    if workers == 1:
+        _init(*args)
+        for i, (s, n) in enumerate(zip(seeds, sizes)):
+            parts[i] = _block(s, n)
+            done += n
+            yield partial(done == n_paths)
+        return
+
+    # spawn: Streamlit-servern har trådar igång, fork är inte säkert då
+    ctx = mp.get_context("spawn")
+    pool = ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init, initargs=args)
+    try:
+        futures = {pool.submit(_block, s, n): i for i, (s, n) in enumerate(zip(seeds, sizes))}
+        for fut in as_completed(futures):
+            i = futures[fut]
+            parts[i] = fut.result()
+            done += sizes[i]
+            yield partial(done == n_paths)
+    finally:
+        # stängs generatorn i förtid (ny rerun, GeneratorExit) ska köade block
+        # strykas i stället för att köras klart medan anroparen väntar
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def simulate(log_returns: np.ndarray, values: np.ndarray, **kwargs) -> dict:
+    """Kör run() till slut och returnerar slutresultatet."""
+    result = None
+    for result in run(log_returns, values, **kwargs):
+        pass
+    return result
@@ -0,0 +1,235 @@
+# app/services/optimizer.py
+"""
+Portföljoptimering för Models-sidan: minsta varians, max Sharpe och
+riskparitet, alltid long-only med övre viktgräns per ticker (cap).
+
+Lösarna är rena NumPy:
+- minsta varians: accelererad projicerad gradient (FISTA) på mängden
+  {0 <= w <= cap, sum w = 1}; projektionen är exakt (brytpunkter).
+- max Sharpe: samma lösare längs den effektiva fronten (max mu'w/g - 1/2 w'Sw
+  för en följd av g, varmstartad), förfinat med gyllene snittet kring bästa
+  punkten.
+- riskparitet: cyklisk koordinatnedstigning på 1/2 y'Sy - b' log y (ger lika
+  riskbidrag efter normering); vikter över cap låses och resten löses om.
+
+Kovariansen kommer från covariance.get_estimate (krympt, inkrementell).
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.services import covariance
+
+METHODS = {"min_variance": "Minsta varians", "max_sharpe": "Max Sharpe", "risk_parity": "Riskparitet"}
+
+
+def _check_cap(n: int, cap: float) -> float:
+    if n == 0:
+        raise ValueError("Inga tickers att optimera")
+    if cap * n < 1.0 - 1e-12:
+        raise ValueError(f"Viktgränsen {cap:.0%} är för låg för {n} tickers (minst {1 / n:.0%})")
+    return min(cap, 1.0)
+
+
+def project_capped_simplex(v: np.ndarray, cap: float = 1.0) -> np.ndarray:
+    """
+    Närmaste punkt (euklidiskt) i {0 <= w <= cap, sum w = 1}: w = clip(v - tau)
+    där f(tau) = sum clip(v - tau, 0, cap) = 1. f är styckvis linjär med
+    brytpunkter i v och v - cap, så den utvärderas i alla brytpunkter på en
+    gång (sortering + prefixsummor) och tau interpoleras fram.
+    """
+    vs = np.sort(v)
+    cs = np.concatenate([[0.0], np.cumsum(vs)])
+    bp = np.sort(np.concatenate([vs, vs - cap]))
+    lo = np.searchsorted(vs, bp, side="right")          # v_i <= tau bidrar 0
+    hi = np.searchsorted(vs, bp + cap, side="left")     # v_i >= tau + cap bidrar cap
+    f = cap * (len(v) - hi) + (cs[hi] - cs[lo]) - bp * (hi - lo)
+    j = int(np.searchsorted(-f, -1.0, side="right")) - 1    # sista brytpunkt med f >= 1
+    if j < 0:
+        tau = bp[0] - (1.0 - f[0]) / len(v)
+    elif j >= len(bp) - 1 or f[j] == f[j + 1]:
+        tau = bp[j]
+    else:
+        tau = bp[j] + (f[j] - 1.0) * (bp[j + 1] - bp[j]) / (f[j] - f[j + 1])
+    return np.clip(v - tau, 0.0, cap)
+
+
+def _lipschitz(cov: np.ndarray) -> float:
+    L = float(np.linalg.eigvalsh(cov)[-1]) if len(cov) > 1 else float(cov[0, 0])
+    return L if L > 0 else 1.0
+
+
+def _qp(Q: np.ndarray, c: np.ndarray, cap: float, L: float, w0: Optional[np.ndarray] = None,
+        iters: int = 3000, tol: float = 1e-10) -> np.ndarray:
+    """
+    min 1/2 w'Qw - c'w över den kapade simplexen: FISTA med steg 1/L och
+    omstart när farten pekar uppför (konvergerar betydligt snabbare nära hörn).
+    """
+    n = len(c)
+    w = project_capped_simplex(np.full(n, 1.0 / n) if w0 is None else w0, cap)
+    y, t = w.copy(), 1.0
+    for _ in range(iters):
+        w_next = project_capped_simplex(y - (Q @ y - c) / L, cap)
+        if np.abs(w_next - w).max() < tol:
+            return w_next
+        if (y - w_next) @ (w_next - w) > 0:
+            y, t = w_next.copy(), 1.0
+        else:
+            t_next = 0.5 * (1.0 + np.sqrt(1.0 + 4.0 * t * t))
+            y = w_next + (t - 1.0) / t_next * (w_next - w)
+            t = t_next
+        w = w_next
+    return w
+
+
+def min_variance(cov: np.ndarray, cap: float = 1.0) -> np.ndarray:
+    cap = _check_cap(len(cov), cap)
+    return _qp(cov, np.zeros(len(cov)), cap, _lipschitz(cov))
+
+
+def max_sharpe(mean: np.ndarray, cov: np.ndarray, cap: float = 1.0, rf: float = 0.0,
+               points: int = 16, refine: int = 20) -> np.ndarray:
+    cap = _check_cap(len(cov), cap)
+    excess = mean - rf
+    L = _lipschitz(cov)
+    # längs fronten från minsta varians mot ren avkastningsmaximering ...
+    scale = float(np.abs(excess).max()) / L
+    logs = np.linspace(np.log(1e3), np.log(1e-2), points) + np.log(scale)
+    w = _qp(cov, np.zeros(len(cov)), cap, L)
+    path = [(np.inf, w, _sharpe(w, excess, cov))]
+    for lg in logs:
+        w = _qp(cov, excess * np.exp(-lg), cap, L, w0=w)
+        path.append((lg, w, _sharpe(w, excess, cov)))
+    i = max(range(len(path)), key=lambda k: path[k][2])
+    if i == 0 or refine == 0:
+        return path[i][1]
+    # ... och gyllene snittet mellan grannpunkterna runt den bästa
+    lo = path[i - 1][0] if i > 1 else logs[0] + (logs[0] - logs[1])
+    hi = path[i + 1][0] if i + 1 < len(path) else logs[-1]
+    best_w, best_sr = path[i][1], path[i][2]
+
+    def at(lg: float) -> tuple[np.ndarray, float]:
+        x = _qp(cov, excess * np.exp(-lg), cap, L, w0=best_w)
+        return x, _sharpe(x, excess, cov)
+
+    r = (np.sqrt(5.0) - 1.0) / 2.0
+    a, b = lo + (1 - r) * (hi - lo), lo + r * (hi - lo)
+    (wa, sa), (wb, sb) = at(a), at(b)
+    for _ in range(refine):
+        if sa >= sb:
+            hi, b, wb, sb = b, a, wa, sa
+            a = lo + (1 - r) * (hi - lo)
+            wa, sa = at(a)
+        else:
+            lo, a, wa, sa = a, b, wb, sb
+            b = lo + r * (hi - lo)
+            wb, sb = at(b)
+    for x, sr in ((wa, sa), (wb, sb)):
+        if sr > best_sr:
+            best_w, best_sr = x, sr
+    return best_w
+
+
+def _sharpe(w: np.ndarray, excess: np.ndarray, cov: np.ndarray) -> float:
+    vol = float(np.sqrt(max(w @ cov @ w, 0.0)))
+    return float(w @ excess) / vol if vol > 0 else -np.inf
+
+
+def _erc(cov: np.ndarray, budget: np.ndarray, iters: int = 500, tol: float = 1e-12) -> np.ndarray:
+    """
+    Lika riskbidrag (enligt budget) utan tak: koordinatnedstigning, normerat
+    till summa 1. Tickers utan varians (t.ex. oförändrad kurs i hela fönstret)
+    saknar riskbidrag och får vikt 0; har ingen varians fördelas efter budget.
+    """
+    d = np.diag(cov)
+    live = d > 0
+    if not live.any():
+        return budget / budget.sum()
+    if not live.all():
+        w = np.zeros(len(d))
+        w[live] = _erc(cov[np.ix_(live, live)], budget[live], iters, tol)
+        return w
+    y = budget / np.sqrt(d)
+    for _ in range(iters):
+        y_old = y.copy()
+        for i in range(len(y)):
+            a = cov[i] @ y - d[i] * y[i]
+            y[i] = (-a + np.sqrt(a * a + 4.0 * d[i] * budget[i])) / (2.0 * d[i])
+        if np.abs(y - y_old).max() < tol * y.max():
+            break
+    return y / y.sum()
+
+
+def risk_parity(cov: np.ndarray, cap: float = 1.0) -> np.ndarray:
+    n = len(cov)
+    cap = _check_cap(n, cap)
+    w = np.zeros(n)
+    free = np.ones(n, dtype=bool)
+    left = 1.0
+    while free.any():
+        idx = np.flatnonzero(free)
+        sub = _erc(cov[np.ix_(idx, idx)], np.full(len(idx), 1.0 / n)) * left
+        over = sub > cap + 1e-12
+        if not over.any():
+            w[idx] = sub
+            break
+        w[idx[over]] = cap
+        free[idx[over]] = False
+        left = 1.0 - w[~free].sum()
+    return w
+
+
+def risk_contributions(w: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    """Andel av portföljvariansen per ticker (summerar till 1)."""
+    var = float(w @ cov @ w)
+    return w * (cov @ w) / var if var > 0 else np.zeros_like(w)
+
+
+def optimize(
+    conn: sqlite3.Connection,
+    tickers: Sequence[str],
+    method: str = "min_variance",
+    window: int = 252,
+    cap: float = 1.0,
+    current: Optional[dict[str, float]] = None,
+    rf: float = 0.0,
+) -> dict:
+    """
+    Föreslagna vikter för tickers: {"weights" (DataFrame ticker, current,
+    weight, change, risk_contribution), "vol", "current_vol", "expected_return",
+    "shrinkage", "days"}.
+    """
+    est = covariance.get_estimate(conn, tickers, window)
+    cov, mean, names = est["cov"], est["mean"], est["tickers"]
+    if est["days"] < max(20, len(names) // 2) or not np.isfinite(cov).all():
+        raise ValueError("För lite gemensam kurshistorik för att skatta kovariansen")
+    if method == "min_variance":
+        w = min_variance(cov, cap)
+    elif method == "max_sharpe":
+        w = max_sharpe(mean, cov, cap, rf)
+    elif method == "risk_parity":
+        w = risk_parity(cov, cap)
+    else:
+        raise ValueError(f"Okänd metod: {method}")
+
+    cur = np.array([(current or {}).get(t, 0.0) for t in names], dtype=float)
+    cur = cur / cur.sum() if cur.sum() > 0 else np.full(len(names), np.nan)
+    df = pd.DataFrame({
+        "ticker": names,
+        "current": cur,
+        "weight": w,
+        "change": w - cur,
+        "risk_contribution": risk_contributions(w, cov),
+    })
+    return {
+        "weights": df,
+        "vol": float(np.sqrt(w @ cov @ w)),
+        "current_vol": float(np.sqrt(cur @ cov @ cur)) if np.isfinite(cur).all() else np.nan,
+        "expected_return": float(w @ mean),
+        "shrinkage": est["shrinkage"],
+        "days": est["days"],
+    }
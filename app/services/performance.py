@@ -0,0 +1,249 @@
+# app/services/performance.py
+"""
+Tidsserieberäkningar för Dashboard: kvantitets-/kassapaneler, TWR-index och
+fallback med statisk korg. Allt räknas som NumPy-matriser (datum × ticker)
+utan radvisa Python-loopar, och resultatet memoiseras processgemensamt på
+(user, period, anchor, dataversioner) så att alla sessioner delar det.
+"""
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.config import START_CASH
+from app.services import fx
+from app.services import portfolio
+from app.services import versions
+from app.services import telemetry
+
+PERIOD_OPTIONS = ["1 dag", "1 vecka", "3 månader", "6 månader", "YTD", "1 år", "Allt"]
+PERIOD_DAYS = {"1 dag": 1, "1 vecka": 7, "3 månader": 90, "6 månader": 180, "1 år": 365}
+
+
+def period_start_for(anchor: date, period: str) -> date | None:
+    if period == "Allt":
+        return None
+    if period == "YTD":
+        return date(anchor.year, 1, 1)
+    return anchor - timedelta(days=PERIOD_DAYS[period])
+
+
+# ---------- Inläsning ----------
+
+def load_price_panel(
+    conn: sqlite3.Connection,
+    tickers: list[str],
+    start_date: date | None,
+    end_date: date,
+    fill: str = "interpolate",
+) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    (datum[datetime64], tickers, kurser[datum × ticker]). Kolumner utan data
+    tas bort, luckor interpoleras linjärt och kanterna fylls med närmaste värde.
+    fill="ffill" fyller bara framåt (senast kända kurs) och lämnar dagarna före
+    första kursen som NaN – för backtest, där framtida kurser inte får läcka in.
+    """
+    empty = (np.array([], dtype="datetime64[ns]"), [], np.empty((0, 0)))
+    if not tickers:
+        return empty
+    placeholders = ",".join(["?"] * len(tickers))
+    params: list = list(tickers) + [end_date.isoformat()]
+    sql = f"SELECT ts, ticker, close FROM prices WHERE ticker IN ({placeholders}) AND ts <= ?"
+    if start_date is not None:
+        sql += " AND ts >= ?"
+        params.append(start_date.isoformat())
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return empty
+    ts, tick, close = zip(*rows)
+    # datetime först: "YYYY-MM-DD" och "YYYY-MM-DD 00:00:00" blir samma dag
+    ts_codes, ts_uniques = pd.factorize(pd.to_datetime(pd.Series(ts), format="ISO8601"), sort=True)
+    tk_codes, tk_uniques = pd.factorize(pd.Series(tick), sort=True)
+    panel = np.full((len(ts_uniques), len(tk_uniques)), np.nan)
+    panel[ts_codes, tk_codes] = np.asarray(close, dtype=float)
+    dates = pd.DatetimeIndex(ts_uniques).to_numpy(dtype="datetime64[ns]")
+    keep = ~np.isnan(panel).all(axis=0)
+    filled = _ffill(panel[:, keep]) if fill == "ffill" else _interpolate(panel[:, keep])
+    return dates, [str(t) for t in tk_uniques[keep]], filled
+
+
+def _ffill(panel: np.ndarray) -> np.ndarray:
+    """Senast kända värde per kolumn; NaN före första värdet."""
+    if panel.size == 0:
+        return panel
+    valid = ~np.isnan(panel)
+    idx = np.maximum.accumulate(np.where(valid, np.arange(panel.shape[0])[:, None], 0), axis=0)
+    return panel[idx, np.arange(panel.shape[1])]
+
+
+def _interpolate(panel: np.ndarray) -> np.ndarray:
+    """Linjär interpolation per kolumn (positionsbaserad), konstant utanför kanterna."""
+    if panel.size == 0 or not np.isnan(panel).any():
+        return panel
+    n = panel.shape[0]
+    rows = np.arange(n)[:, None]
+    valid = ~np.isnan(panel)
+    prev_i = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    next_i = np.minimum.accumulate(np.where(valid, rows, n)[::-1], axis=0)[::-1]
+    first_valid = valid.argmax(axis=0)
+    last_valid = n - 1 - valid[::-1].argmax(axis=0)
+    prev_i = np.where(prev_i < 0, first_valid, prev_i)
+    next_i = np.where(next_i >= n, last_valid, next_i)
+    cols = np.arange(panel.shape[1])
+    p0 = panel[prev_i, cols]
+    p1 = panel[next_i, cols]
+    span = (next_i - prev_i).astype(float)
+    w = np.divide(rows - prev_i, span, out=np.zeros_like(span), where=span > 0)
+    return np.where(valid, panel, p0 + (p1 - p0) * w)
+
+
+def load_trades(conn: sqlite3.Connection, user: str, end_date: date) -> pd.DataFrame:
+    """
+    Trades t.o.m. end_date med kolumnerna ts, ticker, side, qty, price, fee,
+    qty_signed, cash_flow. Pris och avgift i SEK (växelkurs på affärsdagen).
+    """
+    sql = """
+      SELECT ts, ticker, side, qty, price, fee
+      FROM trades
+      WHERE user = ? AND ts <= ?
+      ORDER BY ts, id
+    """
+    df = pd.read_sql_query(sql, conn, params=[user, end_date.isoformat()])
+    if df.empty:
+        return df
+    rate = fx.rates_at(conn, df["ticker"].tolist(), df["ts"].tolist())
+    df["price"] = df["price"].astype(float) * rate
+    df["fee"] = df["fee"].fillna(0.0).astype(float) * rate
+    df["ts"] = pd.to_datetime(df["ts"], format="ISO8601")  # blandat datum/datum+tid
+    buy = (df["side"] == "BUY").to_numpy()
+    qty = df["qty"].to_numpy(dtype=float)
+    gross = df["price"].to_numpy(dtype=float) * qty
+    fee = df["fee"].fillna(0.0).to_numpy(dtype=float)
+    df["qty_signed"] = np.where(buy, qty, -qty)                 # + vid köp, - vid sälj
+    df["cash_flow"] = np.where(buy, -(gross + fee), gross - fee)
+    return df
+
+
+# ---------- Paneler ----------
+
+def _day_index(trade_ts: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """Index för första kursdag >= tradens tidpunkt (len(dates) om efter sista dagen)."""
+    return np.searchsorted(dates, trade_ts, side="left")
+
+
+def positions_qty_panel(trades: pd.DataFrame, dates: np.ndarray, tickers: list[str]) -> np.ndarray:
+    """
+    Kvantitet per (datum, ticker): summan av alla trades med ts <= datum.
+    Trades före periodens första dag hamnar på första dagen.
+    """
+    qty = np.zeros((len(dates), len(tickers)))
+    if trades.empty or not len(dates):
+        return qty
+    col = pd.Index(tickers).get_indexer(trades["ticker"])
+    row = _day_index(trades["ts"].to_numpy(dtype="datetime64[ns]"), dates)
+    ok = (col >= 0) & (row < len(dates))
+    np.add.at(qty, (row[ok], col[ok]), trades["qty_signed"].to_numpy(dtype=float)[ok])
+    return np.cumsum(qty, axis=0)
+
+
+def cash_series(trades: pd.DataFrame, dates: np.ndarray) -> np.ndarray:
+    """Likvida medel per kursdag (START_CASH + kumulerade kassaflöden t.o.m. dagen)."""
+    flows = np.zeros(len(dates))
+    if not trades.empty and len(dates):
+        row = _day_index(trades["ts"].to_numpy(dtype="datetime64[ns]"), dates)
+        ok = row < len(dates)
+        np.add.at(flows, row[ok], trades["cash_flow"].to_numpy(dtype=float)[ok])
+    return START_CASH + np.cumsum(flows)
+
+
+def twr_index(prices: np.ndarray, qty: np.ndarray) -> tuple[np.ndarray, int, float] | None:
+    """
+    Time-weighted return: dagens vikter = gårdagens innehavsvärde per ticker.
+    Returnerar (index=100 från första dagen med innehav, startrad, startvärde)
+    eller None om inget innehav finns i perioden.
+    """
+    n = prices.shape[0]
+    if n == 0:
+        return None
+    ret = np.zeros_like(prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret[1:] = prices[1:] / prices[:-1] - 1.0
+    ret[~np.isfinite(ret)] = 0.0
+
+    hold = np.zeros_like(prices)
+    hold[1:] = qty[:-1] * prices[:-1]
+    tot = hold.sum(axis=1)
+    have = tot > 0
+    if not have.any():
+        return None
+    first = int(have.argmax())
+    hold, ret, tot = hold[first:], ret[first:], tot[first:]
+    weights = np.divide(hold, tot[:, None], out=np.zeros_like(hold), where=tot[:, None] != 0)
+    port_ret = (weights * ret).sum(axis=1)
+    return np.cumprod(1.0 + port_ret) * 100.0, first, float(tot[0])
+
+
+def static_basket_index(prices: np.ndarray, qty_now: np.ndarray) -> tuple[np.ndarray, float] | None:
+    """Fallback: dagens innehav värderat bakåt i tiden (dagar med värde > 0)."""
+    pv = prices @ qty_now
+    keep = pv > 0
+    if not keep.any():
+        return None
+    pv = pv[keep]
+    return pv / pv[0] * 100.0, float(pv[0])
+
+
+# ---------- Dashboard-serien ----------
+
+MIN_TWR_POINTS = 5
+
+
+def _nav_series(conn: sqlite3.Connection, user: str, period: str, anchor: date) -> tuple[pd.Series, float, str]:
+    pos = portfolio.positions(conn, user)
+    tickers = pos["ticker"].tolist()
+    dates, cols, prices = load_price_panel(conn, tickers, period_start_for(anchor, period), anchor)
+    if not len(dates):
+        return pd.Series(dtype="float64", name="Portfölj"), float("nan"), "no_prices"
+    # tickers i valutor utan växelkurs kan inte värderas i SEK och lämnas utanför
+    no_fx = set(fx.missing(conn, cols))
+    if no_fx:
+        keep = [c not in no_fx for c in fx.currencies(conn, cols)]
+        cols, prices = [c for c, k in zip(cols, keep) if k], prices[:, keep]
+        if not cols:
+            return pd.Series(dtype="float64", name="Portfölj"), float("nan"), "no_prices"
+    prices = fx.to_base(conn, prices, cols, dates)
+
+    trades = load_trades(conn, user, anchor)
+    qty = positions_qty_panel(trades, dates, cols)
+    twr = twr_index(prices, qty)
+    if twr is not None and len(twr[0]) >= MIN_TWR_POINTS:
+        idx, first, base = twr
+        return pd.Series(idx, index=pd.DatetimeIndex(dates[first:]), name="Portfölj"), base, "twr"
+
+    qty_now = pos.set_index("ticker")["qty"].reindex(cols).fillna(0.0).to_numpy(dtype=float)
+    basket = static_basket_index(prices, qty_now)
+    if basket is None:
+        return pd.Series(dtype="float64", name="Portfölj"), float("nan"), "empty"
+    idx, base = basket
+    keep = (prices @ qty_now) > 0
+    return pd.Series(idx, index=pd.DatetimeIndex(dates[keep]), name="Portfölj"), base, "static"
+
+
+@telemetry.traced()
+def nav_series(conn: sqlite3.Connection, user: str, period: str, anchor: date) -> tuple[pd.Series, float, str]:
+    """
+    Portföljens indexserie (100 = start) för perioden, aktieinnehav utan cash.
+    Returnerar (serie, startvärde i SEK, metod) där metod är "twr", "static"
+    (statisk korg av dagens innehav), "no_prices" eller "empty".
+    Memoiserat på (user, period, anchor, prices-/trades-version); resultatet
+    delas mellan sessioner och ska inte muteras.
+    """
+    return versions.cached(
+        conn,
+        [versions.PRICES, versions.trades_domain(user)],
+        ("nav_series", user, period, anchor),
+        lambda: _nav_series(conn, user, period, anchor),
+    )
@@ -1,6 +1,33 @@
 import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+import numpy as np
 import pandas as pd
 from app.config import START_CASH
+from app.services import db
+from app.services import fx
+from app.services import versions
+from app.services import telemetry
+
+# Belopp (GAV, värde, kassa, P&L) räknas i SEK: trades pris och avgift är i
+# värdepapprets valuta och räknas om med växelkursen på affärsdagen, kurser
+# med senaste (eller as-of-dagens) växelkurs. Se fx.py.
+
+def _in_base(conn: sqlite3.Connection, rows: list, i_ticker: int, i_ts: int, i_price: int, i_fee: int) -> list:
+    """Trade-rader med pris och avgift i SEK; oförändrade om allt redan är i SEK."""
+    if not rows:
+        return rows
+    rates = fx.rates_at(conn, [r[i_ticker] for r in rows], [r[i_ts] for r in rows])
+    if (rates == 1.0).all():
+        return rows
+    out = []
+    for r, k in zip(rows, rates):
+        r = list(r)
+        r[i_price] = float(r[i_price]) * k
+        r[i_fee] = float(r[i_fee] or 0.0) * k
+        out.append(tuple(r))
+    return out
 
 def positions(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
     # qty per ticker (BUY - SELL)
@@ -22,7 +49,7 @@ def running_avg_costs(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
     WHERE user=?
     ORDER BY ticker, ts, id
     """
-    rows = conn.execute(q, (user,)).fetchall()
+    rows = _in_base(conn, conn.execute(q, (user,)).fetchall(), 0, 1, 5, 6)
     state = {}
     for ticker, ts, _id, side, qty, price, fee in rows:
         qty = float(qty); price = float(price); fee = float(fee)
@@ -58,8 +85,17 @@ def latest_prices(conn: sqlite3.Connection, tickers: list[str]) -> pd.DataFrame:
     """
     return pd.read_sql_query(q, conn, params=tickers)
 
+@telemetry.traced()
 def cash_balance(conn: sqlite3.Connection, user: str) -> float:
     # START_CASH + (sum SELL - sum BUY - fees)
+    tickers = [r[0] for r in conn.execute("SELECT DISTINCT ticker FROM trades WHERE user=?", (user,))]
+    if not fx.all_base(conn, tickers):
+        rows = conn.execute("SELECT ticker, ts, side, qty, price, fee FROM trades WHERE user=?", (user,)).fetchall()
+        rows = _in_base(conn, rows, 0, 1, 4, 5)
+        side = np.array([r[2] for r in rows])
+        gross = np.array([float(r[3]) * r[4] for r in rows])
+        fee = np.array([r[5] or 0.0 for r in rows], dtype=float)
+        return float(START_CASH + np.where(side == "SELL", gross, -gross).sum() - fee.sum())
     q = """
     SELECT
       COALESCE(SUM(CASE WHEN side='SELL' THEN qty*price ELSE 0 END),0)
@@ -86,7 +122,7 @@ def realized_pnl_avgcost(conn: sqlite3.Connection, user: str) -> float:
     ORDER BY ticker, ts, id
     """
     import math
-    rows = conn.execute(q, (user,)).fetchall()
+    rows = _in_base(conn, conn.execute(q, (user,)).fetchall(), 0, 1, 5, 6)
     realized = 0.0
     state = {}  # ticker -> (qty, avg_cost)
 
@@ -109,10 +145,17 @@ def realized_pnl_avgcost(conn: sqlite3.Connection, user: str) -> float:
 
     return float(realized)
 
+OVERVIEW_COLS = ["ticker","qty","avg_buy_price","last_close","market_value","unreal_pnl","currency","fx_rate"]
+
+@telemetry.traced()
 def overview(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
+    """
+    Innehav med GAV (SEK), senaste kurs (i värdepapprets valuta), valuta,
+    växelkurs (SEK per enhet) samt marknadsvärde och orealiserad P&L i SEK.
+    """
     pos  = positions(conn, user)
     if pos.empty:
-        return pd.DataFrame(columns=["ticker","qty","avg_buy_price","last_close","market_value","unreal_pnl"])
+        return pd.DataFrame(columns=OVERVIEW_COLS)
 
     costs = running_avg_costs(conn, user)
     last  = latest_prices(conn, pos["ticker"].tolist())
@@ -121,10 +164,241 @@ def overview(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
              .merge(last, on="ticker", how="left")
              .rename(columns={"avg_cost":"avg_buy_price"}))
 
-    df["market_value"] = df["qty"] * df["last_close"]
-    df["unreal_pnl"]   = (df["last_close"] - df["avg_buy_price"]) * df["qty"]
-    cols = ["ticker","qty","avg_buy_price","last_close","market_value","unreal_pnl"]
-    return df[cols].sort_values("ticker").reset_index(drop=True)
+    tickers = df["ticker"].tolist()
+    df["currency"] = fx.currencies(conn, tickers)
+    df["fx_rate"] = fx.latest_rates(conn, tickers)
+    df["market_value"] = df["qty"] * df["last_close"] * df["fx_rate"]
+    df["unreal_pnl"]   = (df["last_close"] * df["fx_rate"] - df["avg_buy_price"]) * df["qty"]
+    return df[OVERVIEW_COLS].sort_values("ticker").reset_index(drop=True)
+
+# ---------- Point-in-time (as-of) ----------
+#
+# Läget "per datum" byggs från periodiska snapshots (månadsskiften) som hålls
+# i en liten LRU-cache. En fråga läser snapshoten närmast före as-of-datumet
+# och spelar bara upp trades därefter via indexet ix_trades_user_ts.
+
+SNAPSHOT_CACHE_SIZE = 512
+_snapshots: OrderedDict = OrderedDict()  # (bas-nyckel, gräns) -> (state, cash_delta, realized)
+_snapshots_lock = threading.Lock()
+
+
+def _asof_bound(asof: date | str) -> str:
+    """Exklusiv övre gräns för ts: allt t.o.m. as-of-dagen, även rader med klockslag."""
+    d = pd.Timestamp(asof).date()
+    return (d + timedelta(days=1)).isoformat()
+
+
+def _month_start(bound: str) -> str:
+    return bound[:8] + "01"
+
+
+def _apply_trade(state: dict, ticker: str, side: str, qty: float, price: float, fee: float) -> tuple[float, float]:
+    """
+    Uppdaterar state[ticker] = (qty, avg_cost) enligt samma regler som
+    running_avg_costs/realized_pnl_avgcost. Returnerar (cash_delta, realized_delta).
+    """
+    q0, c0 = state.get(ticker, (0.0, 0.0))
+    if side == "BUY":
+        q1 = q0 + qty
+        c1 = (q0 * c0 + qty * price + fee) / q1 if q1 > 0 else 0.0
+        state[ticker] = (q1, c1)
+        return -(qty * price) - fee, 0.0
+    realized = 0.0
+    if q0 > 0:
+        sell_qty = min(qty, q0)
+        realized = (price - c0) * sell_qty
+        state[ticker] = (q0 - sell_qty, c0)
+    return qty * price - fee, realized
+
+
+def _replay(conn: sqlite3.Connection, user: str, start: str, end: str, snap: tuple,
+            on_boundary=None) -> tuple:
+    """Spelar upp trades med start <= ts < end ovanpå snap. on_boundary(gräns, snap) anropas vid varje nytt månadsskifte."""
+    state, cash, realized = dict(snap[0]), snap[1], snap[2]
+    rows = conn.execute(
+        """
+        SELECT ticker, ts, side, qty, price, fee
+        FROM trades
+        WHERE user=? AND ts >= ? AND ts < ?
+        ORDER BY ts, id
+        """,
+        (user, start, end),
+    ).fetchall()
+    rows = _in_base(conn, rows, 0, 1, 4, 5)
+    month = None
+    for ticker, ts, side, qty, price, fee in rows:
+        m = _month_start(ts)
+        if on_boundary is not None and month is not None and m != month:
+            on_boundary(m, (dict(state), cash, realized))
+        month = m
+        d_cash, d_real = _apply_trade(state, ticker, side, float(qty), float(price), float(fee or 0.0))
+        cash += d_cash
+        realized += d_real
+    return state, cash, realized
+
+
+def _snapshot_base(conn: sqlite3.Connection, user: str) -> tuple:
+    # count + max(id) ändras vid varje insert/delete -> gamla snapshots blir oåtkomliga.
+    # Snapshots är i SEK, så nya valutor/växelkurser (fx-versionen) gör dem också inaktuella;
+    # vanliga kursrader påverkar dem inte.
+    n, max_id = conn.execute(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM trades WHERE user=?", (user,)
+    ).fetchone()
+    (fx_ver,) = versions.get(conn, versions.FX)
+    return (db.database_path(conn) or id(conn), user, int(n), int(max_id), fx_ver)
+
+
+def _put_snapshot(base: tuple, bound: str, snap: tuple) -> None:
+    with _snapshots_lock:
+        _snapshots[(base, bound)] = snap
+        _snapshots.move_to_end((base, bound))
+        while len(_snapshots) > SNAPSHOT_CACHE_SIZE:
+            _snapshots.popitem(last=False)
+
+
+def _nearest_snapshot(base: tuple, bound: str) -> tuple[str, tuple]:
+    """Senaste cachade snapshot med gräns <= bound (eller tomt läge)."""
+    with _snapshots_lock:
+        best = None
+        for (b, sb) in _snapshots:
+            if b == base and sb <= bound and (best is None or sb > best):
+                best = sb
+        if best is None:
+            return "", ({}, 0.0, 0.0)
+        _snapshots.move_to_end((base, best))
+        return best, _snapshots[(base, best)]
+
+
+def clear_snapshot_cache() -> None:
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def _ledger_asof(conn: sqlite3.Connection, user: str, asof: date | str) -> tuple[dict, float, float]:
+    """(state, cash_delta, realized) för user per as-of-datum."""
+    bound = _asof_bound(asof)
+    snap_bound = _month_start(bound)
+    base = _snapshot_base(conn, user)
+
+    start, snap = _nearest_snapshot(base, snap_bound)
+    if start != snap_bound:
+        # Bygg upp månadssnapshots längs vägen så att nästa datum blir billigt
+        snap = _replay(conn, user, start, snap_bound, snap,
+                       on_boundary=lambda b, s: _put_snapshot(base, b, s))
+        _put_snapshot(base, snap_bound, snap)
+    if snap_bound == bound:
+        return dict(snap[0]), snap[1], snap[2]
+    return _replay(conn, user, snap_bound, bound, snap)
+
+
+def prices_asof(conn: sqlite3.Connection, tickers: list[str], asof: date | str) -> pd.DataFrame:
+    """Senaste stängningskurs per ticker med ts <= as-of (indexsökning på uq_prices)."""
+    bound = _asof_bound(asof)
+    rows = []
+    for t in dict.fromkeys(tickers):
+        r = conn.execute(
+            "SELECT close, ts FROM prices WHERE ticker=? AND ts < ? ORDER BY ts DESC LIMIT 1",
+            (t, bound),
+        ).fetchone()
+        if r is not None:
+            rows.append((t, r[0], r[1]))
+    return pd.DataFrame(rows, columns=["ticker", "last_close", "last_ts"])
+
+
+def positions_asof(conn: sqlite3.Connection, user: str, asof: date | str) -> pd.DataFrame:
+    """Innehav (qty, GAV) per ticker som de såg ut vid slutet av as-of-dagen."""
+    state, _, _ = _ledger_asof(conn, user, asof)
+    out = [(t, q, avg) for t, (q, avg) in sorted(state.items()) if q > 1e-12]
+    return pd.DataFrame(out, columns=["ticker", "qty", "avg_buy_price"])
+
+
+def cash_balance_asof(conn: sqlite3.Connection, user: str, asof: date | str) -> float:
+    _, cash, _ = _ledger_asof(conn, user, asof)
+    return float(START_CASH + cash)
+
+
+def realized_pnl_asof(conn: sqlite3.Connection, user: str, asof: date | str) -> float:
+    _, _, realized = _ledger_asof(conn, user, asof)
+    return float(realized)
+
+
+def overview_asof(conn: sqlite3.Connection, user: str, asof: date | str) -> pd.DataFrame:
+    """Som overview(), men med innehav, kurser och växelkurser per as-of-datum."""
+    pos = positions_asof(conn, user, asof)
+    if pos.empty:
+        return pd.DataFrame(columns=OVERVIEW_COLS)
+    last = prices_asof(conn, pos["ticker"].tolist(), asof)
+    df = pos.merge(last, on="ticker", how="left")
+    tickers = df["ticker"].tolist()
+    df["currency"] = fx.currencies(conn, tickers)
+    df["fx_rate"] = fx.rates_at(conn, tickers, [str(pd.Timestamp(asof).date())] * len(tickers))
+    df["market_value"] = df["qty"] * df["last_close"] * df["fx_rate"]
+    df["unreal_pnl"]   = (df["last_close"] * df["fx_rate"] - df["avg_buy_price"]) * df["qty"]
+    return df[OVERVIEW_COLS].sort_values("ticker").reset_index(drop=True)
+
+# ---------- Batch (alla användare) ----------
+
+# Pseudo-ticker för likvida medel i overview_all()
+CASH_TICKER = "CASH"
+
+
+def overview_all(conn: sqlite3.Connection, users: list[str] | None = None) -> pd.DataFrame:
+    """
+    Innehav, GAV, kurs, värde och realiserad P&L för alla (eller valda) användare
+    i ett svep: en sorterad läsning av trades + en kursfråga för alla tickers.
+    Resultatet är nycklat på (user, ticker). Likvida medel ligger som en rad per
+    användare med ticker=CASH_TICKER (qty=saldo, kurs 1.0), så att
+    market_value summerat per användare ger totalt värde.
+    Stängda innehav med realiserad P&L finns kvar med qty=0.
+    """
+    cols = ["user","ticker","qty","avg_buy_price","last_close","market_value","unreal_pnl","realized_pnl"]
+    sql = "SELECT user, ticker, side, qty, price, fee, ts FROM trades"
+    params: list = []
+    if users is not None:
+        if not users:
+            return pd.DataFrame(columns=cols)
+        sql += f" WHERE user IN ({','.join('?' * len(users))})"
+        params = list(users)
+    sql += " ORDER BY user, ts, id"
+
+    state: dict = {}     # (user, ticker) -> (qty, avg_cost)
+    realized: dict = {}  # (user, ticker) -> realiserad P&L
+    cash: dict = {u: 0.0 for u in (users or [])}
+    for user, ticker, side, qty, price, fee, _ts in _in_base(conn, conn.execute(sql, params).fetchall(), 1, 6, 4, 5):
+        key = (user, ticker)
+        d_cash, d_real = _apply_trade(state, key, side, float(qty), float(price), float(fee or 0.0))
+        cash[user] = cash.get(user, 0.0) + d_cash
+        if d_real:
+            realized[key] = realized.get(key, 0.0) + d_real
+
+    rows = [
+        (u, t, q, avg if q > 1e-12 else float("nan"), realized.get((u, t), 0.0))
+        for (u, t), (q, avg) in state.items()
+        if q > 1e-12 or realized.get((u, t), 0.0) != 0.0
+    ]
+    df = pd.DataFrame(rows, columns=["user","ticker","qty","avg_buy_price","realized_pnl"])
+    last = latest_prices(conn, sorted(df.loc[df["qty"] > 1e-12, "ticker"].unique().tolist()))
+    df = df.merge(last[["ticker","last_close"]], on="ticker", how="left")
+    rate = fx.latest_rates(conn, df["ticker"].tolist())
+    df["market_value"] = df["qty"] * df["last_close"] * rate
+    df["unreal_pnl"]   = (df["last_close"] * rate - df["avg_buy_price"]) * df["qty"]
+    df.loc[df["qty"] <= 1e-12, ["qty","market_value","unreal_pnl"]] = 0.0
+
+    cash_df = pd.DataFrame({
+        "user": list(cash.keys()),
+        "ticker": CASH_TICKER,
+        "qty": [START_CASH + c for c in cash.values()],
+        "avg_buy_price": 1.0,
+        "last_close": 1.0,
+        "unreal_pnl": 0.0,
+        "realized_pnl": 0.0,
+    })
+    cash_df["market_value"] = cash_df["qty"]
+    frames = [f for f in (df[cols], cash_df[cols]) if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=cols)
+    out = pd.concat(frames, ignore_index=True)
+    return out.sort_values(["user","ticker"]).reset_index(drop=True)
 
 # ---------- Testkörning ----------
 if __name__ == "__main__":
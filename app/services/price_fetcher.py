@@ -0,0 +1,220 @@
+# app/services/price_fetcher.py
+"""
+Bakgrundshämtning av saknade kurser från Yahoo Finance.
+
+Sidor anropar request() med de tickers som saknar pris i DB och får direkt
+tillbaka ett FetchJob – ingen sida väntar på nätverket. Hämtningarna körs
+parallellt i en trådpool under en gemensam tidsbudget; det som hunnit komma
+in skrivs till prices (INSERT OR IGNORE) och prices-versionen bumpas i samma
+transaktion, så att cachade läsningar räknas om vid nästa körning. Därefter
+utvärderas kurslarmen mot de nya raderna (alerts.evaluate).
+Samma (ticker, startdatum) hämtas inte igen förrän efter retry_after, oavsett
+om förra försöket gav något – annars skulle en sida som väntar på data som
+Yahoo inte har starta en ny hämtning vid varje körning.
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from app.services import alerts
+from app.services import db
+from app.services import versions
+
+logger = logging.getLogger(__name__)
+
+# (ticker, start, end) -> [(ts "YYYY-MM-DD", close), ...]
+Download = Callable[[str, date, date], list[tuple[str, float]]]
+
+
+def yf_closes(ticker: str, start: date, end: date, timeout: float = 10.0) -> list[tuple[str, float]]:
+    """Dagliga stängningskurser i [start, end] från Yahoo (tom lista om inget finns)."""
+    import yfinance as yf  # tung import, laddas först vid första hämtningen
+    hist = yf.download(
+        ticker, start=start, end=end + timedelta(days=1),
+        interval="1d", auto_adjust=False, progress=False, threads=False, timeout=timeout,
+    )
+    if hist is None or hist.empty:
+        return []
+    s = hist["Adj Close"] if "Adj Close" in hist.columns else hist["Close"]
+    if hasattr(s, "columns"):  # MultiIndex-kolumner från nyare yfinance
+        s = s.iloc[:, 0]
+    s = s.dropna()
+    return [(ts.date().isoformat(), float(v)) for ts, v in s.items()]
+
+
+def yf_last_closes(tickers: list[str], timeout: float = 10.0) -> dict[str, tuple[str, float]]:
+    """Senaste stängningskurs för flera tickers i ETT anrop: {ticker: (ts, close)}."""
+    if not tickers:
+        return {}
+    import yfinance as yf
+    hist = yf.download(
+        list(tickers), period="5d", interval="1d", group_by="column",
+        auto_adjust=False, progress=False, threads=True, timeout=timeout,
+    )
+    if hist is None or hist.empty:
+        return {}
+    close = hist["Adj Close"] if "Adj Close" in hist.columns.get_level_values(0) else hist["Close"]
+    if not hasattr(close, "columns"):  # en ticker utan MultiIndex
+        close = close.to_frame(tickers[0])
+    out = {}
+    for t in close.columns:
+        s = close[t].dropna()
+        if not s.empty:
+            out[str(t)] = (s.index[-1].date().isoformat(), float(s.iloc[-1]))
+    return out
+
+
+class FetchJob:
+    """En bakgrundshämtning för ett antal tickers."""
+
+    def __init__(self, tickers: list[str]) -> None:
+        self.tickers = tickers
+        self.prices: dict[str, list[tuple[str, float]]] = {}   # ticker -> [(ts, close)]
+        self.failed: list[str] = []                      # inget pris / fel
+        self.timed_out: list[str] = []                   # över tidsbudgeten
+        self.written = 0                                 # nya rader i prices
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+
+class PriceFetcher:
+    def __init__(
+        self,
+        db_path: Union[Path, str] = db.DB_PATH,
+        max_workers: int = 8,
+        budget: float = 10.0,
+        retry_after: float = 900.0,
+        download: Optional[Download] = None,
+    ) -> None:
+        self.db_path = str(db_path)
+        self.budget = budget
+        self.retry_after = retry_after
+        self._download = download or (lambda t, s, e: yf_closes(t, s, e, timeout=budget))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="price-fetch")
+        self._lock = threading.Lock()
+        self._inflight: dict[str, FetchJob] = {}   # ticker -> pågående jobb
+        self._tried_at: dict[tuple[str, date], float] = {}  # (ticker, start) -> monotonic tid
+
+    # ---------- API ----------
+
+    def request(self, tickers: Iterable[str], start: date, end: date) -> Optional[FetchJob]:
+        """
+        Startar (eller återanvänder) bakgrundshämtning av kurser i [start, end]
+        och returnerar direkt. None om inget behöver hämtas just nu.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # utgångna försök behövs inte längre – annars växer mappen med
+            # varje nytt startdatum så länge processen lever
+            stale = [k for k, at in self._tried_at.items() if now - at >= self.retry_after]
+            for k in stale:
+                del self._tried_at[k]
+            wanted = []
+            running: Optional[FetchJob] = None
+            for t in dict.fromkeys(tickers):
+                if t in self._inflight:
+                    running = self._inflight[t]
+                elif (t, start) not in self._tried_at:
+                    wanted.append(t)
+            if not wanted:
+                return running
+            job = FetchJob(wanted)
+            for t in wanted:
+                self._inflight[t] = job
+                self._tried_at[(t, start)] = now
+        threading.Thread(
+            target=self._run, args=(job, start, end),
+            name="price-fetch-job", daemon=True,
+        ).start()
+        return job
+
+    # ---------- Bakgrund ----------
+
+    def _fetch_one(self, ticker: str, start: date, end: date) -> list[tuple[str, float]]:
+        try:
+            return self._download(ticker, start, end)
+        except Exception as e:
+            logger.warning("Kunde inte hämta kurs för %s: %s", ticker, e)
+            return []
+
+    def _run(self, job: FetchJob, start: date, end: date) -> None:
+        try:
+            futs = {self._pool.submit(self._fetch_one, t, start, end): t for t in job.tickers}
+            done, not_done = wait(futs, timeout=self.budget)
+            for f in not_done:
+                f.cancel()
+                job.timed_out.append(futs[f])
+            for f in done:
+                rows = f.result()
+                if rows:
+                    job.prices[futs[f]] = rows
+                else:
+                    job.failed.append(futs[f])
+            if job.prices:
+                job.written = self._store(job.prices)
+            if job.timed_out:
+                logger.info("Tidsbudget %.1fs slut, hoppar över %s", self.budget, job.timed_out)
+        except Exception:
+            logger.exception("Bakgrundshämtning av kurser misslyckades")
+        finally:
+            with self._lock:
+                for t in job.tickers:
+                    self._inflight.pop(t, None)
+            job._done.set()
+
+    def _store(self, prices: dict[str, list[tuple[str, float]]]) -> int:
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        try:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS prices(
+                      id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      ticker TEXT NOT NULL,
+                      ts TEXT NOT NULL,
+                      close REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_prices ON prices(ticker, ts)")
+                db.ensure_schema(conn)
+                cur = conn.executemany(
+                    "INSERT OR IGNORE INTO prices(ticker, ts, close) VALUES (?,?,?)",
+                    [(t, ts, close) for t, rows in prices.items() for ts, close in rows],
+                )
+                written = cur.rowcount
+                if written > 0:
+                    versions.bump(conn, versions.PRICES)
+            if written > 0:
+                try:
+                    alerts.evaluate(conn)
+                except Exception:
+                    # kurserna är redan sparade; ett fel i larmen ska inte fälla hämtningen
+                    logger.exception("Utvärdering av kurslarm misslyckades")
+            return written
+        finally:
+            conn.close()
+
+
+_fetchers: dict[str, PriceFetcher] = {}
+_fetchers_lock = threading.Lock()
+
+
+def get_fetcher(db_path: Union[Path, str] = db.DB_PATH) -> PriceFetcher:
+    """Processgemensam hämtare per databasfil."""
+    key = str(Path(db_path).resolve())
+    with _fetchers_lock:
+        f = _fetchers.get(key)
+        if f is None:
+            f = _fetchers[key] = PriceFetcher(key)
+        return f
@@ -0,0 +1,190 @@
+# app/services/quotes.py
+"""
+Delad kurscache (tabellen quotes) med stale-while-revalidate.
+
+get() svarar alltid direkt ur databasen: cachad kurs om den finns, annars
+senaste stängningskurs ur prices. Är kursen äldre än max_age (eller saknas)
+startas en uppdatering i bakgrunden. Bara en hämtning per ticker åt gången
+i alla sessioner och processer: den som lyckas sätta leasen refreshing_until
+gör hämtningen, övriga fortsätter servera det gamla värdet. Leasen tas bara
+när en hämtning verkligen schemaläggs, och en ticker som aldrig gett någon
+kurs lämnar ingen rad efter sig (backoff hålls då i processen).
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional, Union
+
+from app.services import db
+from app.services import portfolio
+from app.services import price_fetcher
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = 300.0        # sekunder innan en kurs räknas som gammal
+LEASE = 30.0           # max tid en hämtning får hålla leasen
+FAIL_BACKOFF = 60.0    # vänta så här länge efter misslyckad hämtning
+
+
+class QuoteCache:
+    def __init__(
+        self,
+        db_path: Union[Path, str] = db.DB_PATH,
+        max_age: float = MAX_AGE,
+        lease: float = LEASE,
+        max_workers: int = 4,
+        download: Optional[price_fetcher.Download] = None,
+    ) -> None:
+        self.db_path = str(db_path)
+        self.max_age = max_age
+        self.lease = lease
+        self._download = download or (lambda t, s, e: price_fetcher.yf_closes(t, s, e, timeout=lease))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quote-refresh")
+        self._lock = threading.Lock()
+        self._pending: set[str] = set()          # hämtningar som pågår i denna process
+        self._retry_at: dict[str, float] = {}    # backoff för tickers utan rad i quotes
+        self.refreshes = 0   # startade hämtningar i denna process (för mätning)
+
+    # ---------- API ----------
+
+    def get(self, conn: sqlite3.Connection, ticker: str) -> Optional[dict]:
+        """
+        {"last_close", "ts", "source": "quote"|"db", "stale"} eller None om
+        varken cache eller prices har något. Blockerar aldrig på nätverket.
+        """
+        now = time.time()
+        row = conn.execute(
+            "SELECT price, ts, fetched_at FROM quotes WHERE ticker = ?", (ticker,)
+        ).fetchone()
+        if row and row[0] is not None:
+            stale = now - (row[2] or 0.0) > self.max_age
+            if stale:
+                self.refresh(ticker)
+            return {"last_close": float(row[0]), "ts": row[1], "source": "quote", "stale": stale}
+
+        self.refresh(ticker)
+        return self._from_prices(conn, ticker)
+
+    def refresh(self, ticker: str) -> bool:
+        """Startar bakgrundshämtning om ingen annan håller leasen. True om den startades."""
+        with self._lock:
+            # pågår redan här eller i backoff: ingen skrivning mot databasen
+            if ticker in self._pending or self._retry_at.get(ticker, 0.0) > time.time():
+                return False
+            self._pending.add(ticker)
+        claimed = False
+        try:
+            claimed = self._claim(ticker)
+        finally:
+            if not claimed:
+                with self._lock:
+                    self._pending.discard(ticker)
+        if claimed:
+            self.refreshes += 1
+            self._pool.submit(self._refresh, ticker)
+        return claimed
+
+    # ---------- Internt ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        return conn
+
+    def _claim(self, ticker: str) -> bool:
+        """Sätter leasen i en enda sats; raden skapas bara tillsammans med leasen."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    """
+                    INSERT INTO quotes(ticker, refreshing_until) VALUES (?, ?)
+                    ON CONFLICT(ticker) DO UPDATE SET refreshing_until = excluded.refreshing_until
+                    WHERE (refreshing_until IS NULL OR refreshing_until < ?)
+                      AND (fetched_at IS NULL OR fetched_at <= ?)  -- någon annan kan just ha hämtat
+                    """,
+                    (ticker, now + self.lease, now, now - self.max_age),
+                )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def _refresh(self, ticker: str) -> None:
+        today = date.today()
+        try:
+            rows = self._download(ticker, today - timedelta(days=14), today)
+        except Exception as e:
+            logger.warning("Kunde inte hämta kurs för %s: %s", ticker, e)
+            rows = []
+        try:
+            self._store(ticker, rows)
+        finally:
+            with self._lock:
+                self._pending.discard(ticker)
+
+    def _store(self, ticker: str, rows: list[tuple[str, float]]) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                if rows:
+                    ts, price = rows[-1]
+                    conn.execute(
+                        """
+                        UPDATE quotes SET price = ?, ts = ?, fetched_at = ?, refreshing_until = NULL
+                        WHERE ticker = ?
+                        """,
+                        (float(price), ts, time.time(), ticker),
+                    )
+                    return
+                # ingen kurs: en rad som aldrig haft något värde tas bort igen
+                # (backoff i processen) om den inte är bevakad; annars behålls
+                # gammalt värde och nästa försök sker först efter FAIL_BACKOFF
+                cur = conn.execute(
+                    """
+                    DELETE FROM quotes
+                    WHERE ticker = ? AND price IS NULL AND ticker NOT IN (SELECT ticker FROM watchlist)
+                    """,
+                    (ticker,),
+                )
+                if cur.rowcount:
+                    with self._lock:
+                        self._retry_at[ticker] = time.time() + FAIL_BACKOFF
+                else:
+                    conn.execute(
+                        "UPDATE quotes SET refreshing_until = ? WHERE ticker = ?",
+                        (time.time() + FAIL_BACKOFF, ticker),
+                    )
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _from_prices(conn: sqlite3.Connection, ticker: str) -> Optional[dict]:
+        try:
+            lp = portfolio.latest_prices(conn, [ticker])
+        except Exception:  # t.ex. ingen prices-tabell innan första ETL-körningen
+            return None
+        if lp.empty:
+            return None
+        return {"last_close": float(lp["last_close"].iloc[0]), "ts": str(lp["last_ts"].iloc[0])[:10],
+                "source": "db", "stale": True}
+
+
+_caches: dict[str, QuoteCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_quotes(db_path: Union[Path, str] = db.DB_PATH) -> QuoteCache:
+    """Processgemensam kurscache per databasfil."""
+    key = str(Path(db_path).resolve())
+    with _caches_lock:
+        c = _caches.get(key)
+        if c is None:
+            c = _caches[key] = QuoteCache(key)
+        return c
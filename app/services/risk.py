@@ -0,0 +1,279 @@
+# app/services/risk.py
+"""
+Riskmått för Models-sidan: volatilitet (hel period och rullande), max
+drawdown, beta och tracking error mot OMXSPI samt korrelationsmatris.
+
+Allt räknas på en panel datum × ticker med enkla dagsavkastningar. I stället
+för att spara avkastningarna och räkna om från början hålls tillräcklig
+statistik (summor, kvadratsummor och korsprodukter per tickerpar, samt
+löpande topp/drawdown) som bara adderas när nya dagar kommer in. Saknade
+värden (t.ex. före en notering) hanteras med par-visa antal så att varje
+par räknas på de dagar där båda har data.
+
+Modellen cachas per (databas, tickers, startdatum) och följer prices-
+versionen: nya dagar läses inkrementellt, ändrad historik ger omräkning.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import sqlite3
+
+from app.services import db
+from app.services import versions
+
+TRADING_DAYS = 252
+BENCHMARK = "^OMXSPI"
+MODEL_CACHE_SIZE = 8
+
+
+def lookback_start(anchor: date, years: int) -> date:
+    """Start på årsskifte så att startdatumet (och cachenyckeln) inte flyttas varje dag."""
+    return date(anchor.year - years, 1, 1)
+
+
+def _ffill(raw: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    """Fyll NaN framåt per kolumn, med prev som värdet före första raden."""
+    stacked = np.vstack([prev[None, :], raw])
+    valid = ~np.isnan(stacked)
+    idx = np.where(valid, np.arange(len(stacked))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return stacked[idx, np.arange(stacked.shape[1])][1:]
+
+
+def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Rullande standardavvikelse per kolumn via kumulativa summor (NaN hoppas
+    över; kräver minst window/2 observationer i fönstret). Samma längd som x.
+    """
+    valid = np.isfinite(x)
+    x0 = np.where(valid, x, 0.0)
+    pad = np.zeros((1,) + x.shape[1:])
+    c1 = np.concatenate([pad, np.cumsum(x0, axis=0)])
+    c2 = np.concatenate([pad, np.cumsum(x0 * x0, axis=0)])
+    cn = np.concatenate([pad, np.cumsum(valid, axis=0)])
+    lo = np.maximum(np.arange(1, len(x) + 1) - window, 0)
+    hi = np.arange(1, len(x) + 1)
+    s1, s2, n = c1[hi] - c1[lo], c2[hi] - c2[lo], cn[hi] - cn[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+    var[n < max(2, window // 2)] = np.nan
+    return np.sqrt(np.maximum(var, 0.0))
+
+
+class RiskModel:
+    """Inkrementell riskstatistik för en fast uppsättning tickers (+ benchmark sist)."""
+
+    def __init__(self, tickers: Sequence[str], start: date) -> None:
+        self.tickers = [t for t in dict.fromkeys(tickers) if t != BENCHMARK]
+        self.columns = self.tickers + [BENCHMARK]
+        self.start = start
+        self.version: Optional[int] = None
+        self.rebuilds = 0   # antal omräkningar från början (för mätning/test)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        k = len(self.columns)
+        self.rows = 0                                  # DB-rader t.o.m. last_date
+        self.dates = np.array([], dtype="datetime64[ns]")
+        self.prices = np.empty((0, k))
+        self.returns = np.empty((0, k))
+        self.n = np.zeros((k, k))                      # antal dagar där båda har avkastning
+        self.sx = np.zeros((k, k))                     # sum x_i över dagar där j finns
+        self.sxx = np.zeros((k, k))
+        self.sxy = np.zeros((k, k))
+        self.peak = np.full(k, np.nan)
+        self.mdd = np.zeros(k)
+
+    # ---------- Uppdatering ----------
+
+    def _next_day(self) -> str:
+        if not len(self.dates):
+            return self.start.isoformat()
+        last = pd.Timestamp(self.dates[-1]).date()
+        return (last + timedelta(days=1)).isoformat()
+
+    def _load(self, conn: sqlite3.Connection, since: str) -> tuple[np.ndarray, np.ndarray]:
+        placeholders = ",".join("?" * len(self.columns))
+        rows = conn.execute(
+            f"SELECT ts, ticker, close FROM prices WHERE ticker IN ({placeholders}) AND ts >= ?",
+            [*self.columns, since],
+        ).fetchall()
+        if not rows:
+            return np.array([], dtype="datetime64[ns]"), np.empty((0, len(self.columns)))
+        ts, tick, close = zip(*rows)
+        # faktorisera strängarna först: bara de unika värdena behöver tolkas
+        s_codes, s_uniq = pd.factorize(np.asarray(ts, dtype=object))
+        day = pd.to_datetime(pd.Index(s_uniq), format="ISO8601").normalize()
+        d_codes, d_uniq = pd.factorize(day, sort=True)
+        k_codes, k_uniq = pd.factorize(np.asarray(tick, dtype=object))
+        col = pd.Index(self.columns).get_indexer(k_uniq)[k_codes]
+        raw = np.full((len(d_uniq), len(self.columns)), np.nan)
+        raw[d_codes[s_codes], col] = np.asarray(close, dtype=float)
+        self.rows += len(rows)
+        return pd.DatetimeIndex(d_uniq).to_numpy(dtype="datetime64[ns]"), raw
+
+    def _count_until(self, conn: sqlite3.Connection, before: str) -> int:
+        placeholders = ",".join("?" * len(self.columns))
+        return conn.execute(
+            f"SELECT COUNT(*) FROM prices WHERE ticker IN ({placeholders}) AND ts >= ? AND ts < ?",
+            [*self.columns, self.start.isoformat(), before],
+        ).fetchone()[0]
+
+    def update(self, conn: sqlite3.Connection) -> bool:
+        """Läser in nya dagar om prices-versionen ändrats. True om något ändrades."""
+        with self._lock:
+            ver = versions.get(conn, versions.PRICES)[0]
+            if ver == self.version:
+                return False
+            if self.rows and self._count_until(conn, self._next_day()) != self.rows:
+                self._reset()   # historiken har ändrats (t.ex. bakåtfyllning) -> från början
+            if not self.rows:
+                self.rebuilds += 1
+            dates, raw = self._load(conn, self._next_day())
+            if len(dates):
+                self._append(dates, raw)
+            self.version = ver
+            return bool(len(dates))
+
+    def _append(self, dates: np.ndarray, raw: np.ndarray) -> None:
+        prev = self.prices[-1] if len(self.prices) else np.full(raw.shape[1], np.nan)
+        px = _ffill(raw, prev)
+        before = np.vstack([prev[None, :], px[:-1]])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ret = px / before - 1.0
+        ret[~np.isfinite(ret)] = np.nan
+
+        valid = np.isfinite(ret)
+        r0 = np.where(valid, ret, 0.0)
+        m = valid.astype(float)
+        self.n += m.T @ m
+        self.sx += r0.T @ m
+        self.sxx += (r0 * r0).T @ m
+        self.sxy += r0.T @ r0
+
+        peaks = np.fmax.accumulate(np.vstack([self.peak[None, :], px]), axis=0)[1:]
+        with np.errstate(invalid="ignore"):
+            dd = px / peaks - 1.0
+        self.mdd = np.fmin(self.mdd, np.nanmin(np.where(np.isnan(dd), 0.0, dd), axis=0))
+        self.peak = peaks[-1]
+
+        self.dates = np.concatenate([self.dates, dates])
+        self.prices = np.vstack([self.prices, px])
+        self.returns = np.vstack([self.returns, ret])
+
+    # ---------- Mått ----------
+
+    def _pairwise(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(kovarians, varians x, varians y) per par, på dagar där båda har data."""
+        n, sx, sy = self.n, self.sx, self.sx.T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = (self.sxy - sx * sy / n) / (n - 1)
+            varx = (self.sxx - sx * sx / n) / (n - 1)
+            vary = (self.sxx.T - sy * sy / n) / (n - 1)
+        return cov, varx, vary
+
+    def ticker_metrics(self, window: int = 20) -> pd.DataFrame:
+        """Per ticker: årlig vol, rullande vol (senaste window dagar), max drawdown, beta, TE."""
+        cov, varx, vary = self._pairwise()
+        k = len(self.tickers)
+        b = len(self.columns) - 1
+        var = np.diag(varx)[:k]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            beta = cov[:k, b] / vary[:k, b]
+            te = np.sqrt(np.maximum(varx[:k, b] + vary[:k, b] - 2 * cov[:k, b], 0.0) * TRADING_DAYS)
+        tail = self.returns[-(window + 1):, :k]
+        roll = rolling_std(tail, window)[-1] if len(tail) else np.full(k, np.nan)
+        return pd.DataFrame({
+            "ticker": self.tickers,
+            "vol_ann": np.sqrt(var * TRADING_DAYS),
+            f"vol_{window}d": roll * np.sqrt(TRADING_DAYS),
+            "max_drawdown": self.mdd[:k],
+            "beta": beta,
+            "tracking_error": te,
+            "days": np.diag(self.n)[:k].astype(int),
+        })
+
+    def correlation(self, tickers: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        cov, varx, vary = self._pairwise()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov / np.sqrt(varx * vary)
+        df = pd.DataFrame(corr, index=self.columns, columns=self.columns)
+        keep = list(tickers) if tickers is not None else self.tickers
+        return df.loc[keep, keep]
+
+    def portfolio(self, weights: dict[str, float], window: int = 20) -> dict:
+        """
+        Portföljens mått för fasta vikter (t.ex. dagens marknadsvärden):
+        vol, max drawdown, beta, TE och rullande vol som serie.
+        """
+        k = len(self.tickers)
+        w = np.array([weights.get(t, 0.0) for t in self.tickers], dtype=float)
+        out = {"vol_ann": np.nan, "max_drawdown": np.nan, "beta": np.nan, "tracking_error": np.nan,
+               "rolling_vol": pd.Series(dtype="float64")}
+        if not len(self.returns) or w.sum() <= 0:
+            return out
+        r = self.returns[:, :k]
+        valid = np.isfinite(r)
+        wsum = (valid * w).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            port = np.where(wsum > 0, (np.where(valid, r, 0.0) * w).sum(axis=1) / wsum, np.nan)
+        bench = self.returns[:, -1]
+        ok = np.isfinite(port)
+        both = ok & np.isfinite(bench)
+
+        value = np.cumprod(1.0 + np.where(ok, port, 0.0))
+        out["max_drawdown"] = float((value / np.maximum.accumulate(value) - 1.0).min())
+        if ok.sum() > 1:
+            out["vol_ann"] = float(np.std(port[ok], ddof=1) * np.sqrt(TRADING_DAYS))
+        if both.sum() > 1:
+            c = np.cov(port[both], bench[both])
+            out["beta"] = float(c[0, 1] / c[1, 1])
+            out["tracking_error"] = float(np.std(port[both] - bench[both], ddof=1) * np.sqrt(TRADING_DAYS))
+        out["rolling_vol"] = pd.Series(
+            rolling_std(port[:, None], window)[:, 0] * np.sqrt(TRADING_DAYS),
+            index=pd.DatetimeIndex(self.dates), name="Rullande vol",
+        )
+        return out
+
+    @property
+    def has_benchmark(self) -> bool:
+        return bool(self.n[-1, -1] > 1)
+
+
+# ---------- Processcache ----------
+
+_models: "OrderedDict[tuple, RiskModel]" = OrderedDict()
+_models_lock = threading.Lock()
+
+
+def get_model(conn: sqlite3.Connection, tickers: Sequence[str], start: date) -> RiskModel:
+    """Cachad modell för (databas, tickers, start), uppdaterad till aktuell prices-version."""
+    key = (db.database_path(conn) or id(conn), tuple(sorted(set(tickers))), start)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = RiskModel(key[1], start)
+            while len(_models) > MODEL_CACHE_SIZE:
+                _models.popitem(last=False)
+        else:
+            _models.move_to_end(key)
+    model.update(conn)
+    return model
+
+
+def clear_cache() -> None:
+    with _models_lock:
+        _models.clear()
+
+
+def price_tickers(conn: sqlite3.Connection) -> list[str]:
+    """Alla tickers med kurser i DB (utom benchmark)."""
+    rows = conn.execute("SELECT DISTINCT ticker FROM prices WHERE ticker <> ? ORDER BY ticker", (BENCHMARK,))
+    return [r[0] for r in rows]
@@ -0,0 +1,252 @@
+# app/services/search_index.py
+"""
+Förbyggt sökindex för universet.
+
+Byggs en gång när universet laddas och ger samma träffar och ordning som
+den tidigare pandas-sökningen i universe.search_by_name:
+  1. namn som börjar med sökordet
+  2. ticker som börjar med sökordet
+  3. position för sökordet i namnet (saknas = 9999)
+  4. name_display (sedan ursprunglig radordning)
+Endast rader där search_blob innehåller sökordet räknas som träff.
+
+Prefixdelen är en kompakt trie: sorterade nyckellistor över namn och tickers
+där ett prefix motsvarar ett sammanhängande intervall (bisect). Delsträngar
+hittas via ett trigram-inverterat index. Om inget matchar exakt används
+trigram-överlapp som stavfelstolerant reserv (t.ex. "ericson" -> Ericsson).
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+_MAX_CHAR = "\U0010ffff"
+_NOT_FOUND = 9999
+FUZZY_MIN_SHARE = 0.6  # andel av sökordets trigram som måste finnas i träffen
+
+
+def _trigrams(s: str) -> set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class SearchIndex:
+    def __init__(
+        self,
+        names: Sequence[str],
+        tickers: Sequence[str],
+        blobs: Sequence[str],
+        segments: Sequence[str],
+    ) -> None:
+        self.n = len(names)
+        self.names = list(names)
+        self.names_lower = [s.lower() for s in self.names]
+        self.blobs = list(blobs)
+        self.segments = np.array([s.lower() for s in segments], dtype=object)
+
+        # Ordning för sista sorteringsnyckeln: (name_display, radnummer)
+        order = sorted(range(self.n), key=lambda i: (self.names[i], i))
+        self.name_rank = np.empty(self.n, dtype=np.int64)
+        self.name_rank[order] = np.arange(self.n)
+
+        # Prefix-"trie": sorterade (nyckel, id)
+        self._name_keys, self._name_ids = self._sorted_keys(self.names_lower)
+        self._ticker_keys, self._ticker_ids = self._sorted_keys([t.lower() for t in tickers])
+
+        # Trigram -> sorterad array av rad-id:n
+        postings: dict[str, list[int]] = {}
+        for i, blob in enumerate(self.blobs):
+            for g in _trigrams(blob):
+                postings.setdefault(g, []).append(i)
+        self._postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+
+        # 1-2 teckens n-gram byggs lazy vid första sökningen (få möjliga värden)
+        self._short_postings: dict[str, np.ndarray] = {}
+        self._segment_masks: dict[frozenset, np.ndarray] = {}
+
+    @classmethod
+    def from_frame(cls, df) -> "SearchIndex":
+        return cls(
+            df["name_display"].tolist(),
+            df["yf_symbol"].tolist(),
+            df["search_blob"].tolist(),
+            df["segment"].tolist(),
+        )
+
+    @staticmethod
+    def _sorted_keys(keys: list[str]) -> tuple[list[str], np.ndarray]:
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return [keys[i] for i in order], np.asarray(order, dtype=np.int64)
+
+    @staticmethod
+    def _prefix_range(keys: list[str], ids: np.ndarray, q: str) -> np.ndarray:
+        lo = bisect_left(keys, q)
+        hi = bisect_left(keys, q + _MAX_CHAR, lo)
+        return ids[lo:hi]
+
+    def segment_mask(self, segments: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if not segments:
+            return None
+        key = frozenset(s.lower() for s in segments)
+        mask = self._segment_masks.get(key)
+        if mask is None:
+            mask = np.isin(self.segments, list(key))
+            self._segment_masks[key] = mask
+        return mask
+
+    # ---------- Sökning ----------
+
+    def _top_by_rank(self, ids: np.ndarray, k: int) -> np.ndarray:
+        """De k första id:na sorterade på name_rank (partiell sortering)."""
+        if len(ids) > k:
+            part = np.argpartition(self.name_rank[ids], k - 1)[:k]
+            ids = ids[part]
+        return ids[np.argsort(self.name_rank[ids], kind="stable")]
+
+    def _by_pos(self, ids: np.ndarray, q: str, k: int) -> list[int]:
+        """De k första id:na sorterade på (position i namnet, name_rank)."""
+        if not len(ids):
+            return []
+        names = self.names_lower
+        pos = np.fromiter((names[i].find(q) for i in ids), dtype=np.int64, count=len(ids))
+        pos[pos < 0] = _NOT_FOUND
+        return self._by_pos_arrays(ids, pos, k)
+
+    def _postings_for(self, q: str) -> list[np.ndarray]:
+        if len(q) < 3:
+            p = self._short_postings.get(q)
+            if p is None:
+                p = np.asarray([i for i, b in enumerate(self.blobs) if q in b], dtype=np.int32)
+                self._short_postings[q] = p
+            return [p]
+        lists = []
+        for g in _trigrams(q):
+            p = self._postings.get(g)
+            if p is None:
+                return []
+            lists.append(p)
+        return lists
+
+    def _substring_candidates(self, q: str, allowed: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Rader vars blob innehåller alla sökordets trigram (för längre sökord
+        kan det ge falska träffar – verifieras i _tier3).
+        """
+        lists = self._postings_for(q)
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        lists.sort(key=len)
+        cand = lists[0]
+        for p in lists[1:]:
+            mark = np.zeros(self.n, dtype=bool)
+            mark[p] = True
+            cand = cand[mark[cand]]
+            if not len(cand):
+                break
+        if allowed is not None:
+            cand = cand[allowed[cand]]
+        return cand.astype(np.int64)
+
+    def _tier3(self, cand: np.ndarray, q: str, k: int) -> list[int]:
+        """Delsträngsträffar rankade på (position i namnet, name_rank)."""
+        if not len(cand):
+            return []
+        names = self.names_lower
+        pos = np.fromiter((names[i].find(q) for i in cand), dtype=np.int64, count=len(cand))
+        in_name = pos >= 0  # namnet ingår i blob:en -> verifierad träff
+        out = self._by_pos_arrays(cand[in_name], pos[in_name], k)
+        if len(out) < k and not in_name.all():
+            blobs = self.blobs
+            rest = cand[~in_name]
+            if len(q) > 3:
+                rest = rest[np.fromiter((q in blobs[i] for i in rest), dtype=bool, count=len(rest))]
+            out += self._by_pos_arrays(rest, np.full(len(rest), _NOT_FOUND), k - len(out))
+        return out
+
+    def _by_pos_arrays(self, ids: np.ndarray, pos: np.ndarray, k: int) -> list[int]:
+        order = np.lexsort((self.name_rank[ids], pos))[:k]
+        return ids[order].tolist()
+
+    def _fuzzy(self, q: str, allowed: Optional[np.ndarray], k: int) -> list[tuple[int, int]]:
+        grams = [self._postings[g] for g in _trigrams(q) if g in self._postings]
+        n_grams = max(len(q) - 2, 1)
+        if not grams:
+            return []
+        counts = np.bincount(np.concatenate(grams), minlength=self.n)
+        if allowed is not None:
+            counts[~allowed] = 0
+        need = max(1, int(np.ceil(FUZZY_MIN_SHARE * n_grams)))
+        hits = np.flatnonzero(counts >= need)
+        order = np.lexsort((self.name_rank[hits], -counts[hits]))[:k]
+        return [(int(hits[j]), int(counts[hits[j]])) for j in order]
+
+    def ranked(
+        self,
+        q: Optional[str],
+        segments: Optional[Iterable[str]] = None,
+        limit: Optional[int] = 50,
+    ) -> list[tuple[tuple, int]]:
+        """
+        Träffar som (sorteringsnyckel, rad-id) i rankad ordning. Nyckeln är
+        jämförbar mellan index (används när flera index slås ihop).
+        q ska vara normaliserad och i gemener; None = ingen sökning (radordning).
+        """
+        k = self.n if limit is None else int(limit)
+        allowed = self.segment_mask(segments)
+        if k <= 0:
+            return []
+        if q is None:
+            ids = np.arange(self.n) if allowed is None else np.flatnonzero(allowed)
+            return [((0, 0, 0, "", int(i)), int(i)) for i in ids[:k]]
+
+        taken = np.zeros(self.n, dtype=bool)
+        out: list[int] = []
+
+        name_hits = self._prefix_range(self._name_keys, self._name_ids, q)
+        ticker_hits = self._prefix_range(self._ticker_keys, self._ticker_ids, q)
+        if allowed is not None:
+            name_hits = name_hits[allowed[name_hits]]
+            ticker_hits = ticker_hits[allowed[ticker_hits]]
+        ticker_mask = np.zeros(self.n, dtype=bool)
+        ticker_mask[ticker_hits] = True
+
+        # 1) namn börjar med q – först de vars ticker också gör det
+        both = name_hits[ticker_mask[name_hits]]
+        name_only = name_hits[~ticker_mask[name_hits]]
+        for ids in (both, name_only):
+            if len(out) < k and len(ids):
+                out.extend(self._top_by_rank(ids, k - len(out)).tolist())
+        taken[name_hits] = True
+
+        # 2) ticker börjar med q (men inte namnet)
+        if len(out) < k:
+            rest = ticker_hits[~taken[ticker_hits]]
+            out.extend(self._by_pos(rest, q, k - len(out)))
+        taken[ticker_hits] = True
+
+        # 3) övriga delsträngsträffar
+        if len(out) < k:
+            cand = self._substring_candidates(q, allowed)
+            out.extend(self._tier3(cand[~taken[cand]], q, k - len(out)))
+
+        if out:
+            return [(self._key(i, q, ticker_mask), i) for i in out]
+
+        # 4) inga exakta träffar: stavfelstolerant reserv på trigram-överlapp
+        return [((2, 2, -shared, self.names[i], int(self.name_rank[i])), i)
+                for i, shared in self._fuzzy(q, allowed, k)]
+
+    def _key(self, i: int, q: str, ticker_mask: np.ndarray) -> tuple:
+        pos = self.names_lower[i].find(q)
+        return (
+            0 if pos == 0 else 1,
+            0 if ticker_mask[i] else 1,
+            pos if pos >= 0 else _NOT_FOUND,
+            self.names[i],
+            int(self.name_rank[i]),
+        )
+
+    def search(self, q: Optional[str], segments: Optional[Iterable[str]] = None, limit: Optional[int] = 50) -> np.ndarray:
+        """Rankade rad-id:n för q (normaliserad, gemener)."""
+        return np.asarray([i for _, i in self.ranked(q, segments, limit)], dtype=np.int64)
@@ -0,0 +1,267 @@
+# app/services/telemetry.py
+"""
+Loggning och tidsspann.
+
+setup() kopplar rotloggern till en QueueHandler: anropande tråd lägger bara
+posten på en kö, och en QueueListener-tråd skriver till fil (JSON, en post
+per rad) och konsol. Fältet extra={...} följer med som egna nycklar i JSON.
+
+span() mäter ett kodblock och nästlas via contextvars: varje spann har
+trace_id, span_id och parent_id, så att en sidkörning eller ETL-körning blir
+ett träd. Avslutade spann loggas på loggern "trace" (bara filen, inte
+konsolen) och samlas av collect(). traced() är samma sak som dekorator för
+tjänstefunktioner. Utan setup() kostar ett spann bara tidtagningen.
+
+    python -m app.services.telemetry logs/app.log            # senaste körningen som träd
+    python -m app.services.telemetry logs/etl.log --folded   # indata till flamegraph.pl
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+CONSOLE_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+trace_logger = logging.getLogger("trace")
+
+_current: ContextVar[Optional[dict]] = ContextVar("telemetry_span", default=None)
+_collector: ContextVar[Optional[list]] = ContextVar("telemetry_collector", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_lock = threading.Lock()
+
+# LogRecord-attribut som inte är extra-fält
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+# ---------- JSON-poster ----------
+
+class JsonFormatter(logging.Formatter):
+    """En JSON-rad per post: ts, level, logger, msg, aktuell trace/span och extra-fälten."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in _STANDARD and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _SpanContext(logging.Filter):
+    """Sätter trace_id/span_id för pågående spann; körs i anropande tråd (före kön)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        s = _current.get()
+        if s is not None and not hasattr(record, "span"):
+            record.trace_id = s["trace_id"]
+            record.span_id = s["span_id"]
+        return True
+
+
+def setup(path: Union[Path, str, None] = None, level: int = logging.INFO,
+          console: bool = True) -> logging.handlers.QueueListener:
+    """
+    Köbaserad loggning för processen (idempotent): JSON till path och
+    läsbar text till stderr. Spann skrivs bara till filen.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return _listener
+        handlers: list[logging.Handler] = []
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            fh = logging.FileHandler(path, encoding="utf-8")
+            fh.setFormatter(JsonFormatter())
+            handlers.append(fh)
+        if console:
+            sh = logging.StreamHandler()
+            sh.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            sh.addFilter(lambda r: r.name != trace_logger.name)
+            handlers.append(sh)
+
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(q)
+        _queue_handler.addFilter(_SpanContext())
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        return _listener
+
+
+def shutdown() -> None:
+    """Tömmer kön och kopplar bort hanterarna (körs även vid processens slut)."""
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener, _queue_handler = None, None
+
+
+# ---------- Spann ----------
+
+def _new_id() -> str:
+    return os.urandom(8).hex()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """Tidsspann runt ett block; attrs följer med i posten."""
+    parent = _current.get()
+    s = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else _new_id(),
+        "span_id": _new_id(),
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time(),
+        **attrs,
+    }
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except Exception as e:
+        s["error"] = type(e).__name__
+        raise
+    finally:
+        s["duration_ms"] = (time.perf_counter() - t0) * 1000
+        _current.reset(token)
+        spans = _collector.get()
+        if spans is not None:
+            spans.append(s)
+        if trace_logger.isEnabledFor(logging.INFO):
+            trace_logger.info(name, extra={"span": s})
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Dekorator: hela anropet som ett spann, som standard "<modul>.<funktion>"."""
+    def deco(fn: Callable) -> Callable:
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+@contextmanager
+def collect() -> Iterator[list]:
+    """Samlar avslutade spann i blocket (samma tråd) i en lista."""
+    spans: list = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+# ---------- Rapport ----------
+
+def _children(spans: list[dict]) -> tuple[list[dict], dict[Optional[str], list[dict]]]:
+    ids = {s["span_id"] for s in spans}
+    kids: dict[Optional[str], list[dict]] = {}
+    for s in sorted(spans, key=lambda s: s["start"]):
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        kids.setdefault(parent, []).append(s)
+    return kids.get(None, []), kids
+
+
+def self_ms(s: dict, kids: dict[Optional[str], list[dict]]) -> float:
+    return max(0.0, s["duration_ms"] - sum(c["duration_ms"] for c in kids.get(s["span_id"], [])))
+
+
+def format_tree(spans: list[dict]) -> str:
+    """Indenterat träd: namn, total tid och egen tid (utan barnen)."""
+    roots, kids = _children(spans)
+    lines = []
+
+    def walk(s: dict, depth: int) -> None:
+        err = f"  [{s['error']}]" if s.get("error") else ""
+        lines.append(f"{'  ' * depth}{s['name']:<{max(1, 48 - 2 * depth)}} "
+                     f"{s['duration_ms']:>9.1f} ms  (egen {self_ms(s, kids):.1f}){err}")
+        for c in kids.get(s["span_id"], []):
+            walk(c, depth + 1)
+
+    for r in roots:
+        walk(r, 0)
+    return "\n".join(lines)
+
+
+def folded(spans: list[dict]) -> list[str]:
+    """Hopvikta stackar "rot;barn;barnbarn <egen tid i µs>", summerade per stack."""
+    roots, kids = _children(spans)
+    totals: dict[str, int] = {}
+
+    def walk(s: dict, prefix: str) -> None:
+        stack = f"{prefix};{s['name']}" if prefix else s["name"]
+        totals[stack] = totals.get(stack, 0) + round(self_ms(s, kids) * 1000)
+        for c in kids.get(s["span_id"], []):
+            walk(c, stack)
+
+    for r in roots:
+        walk(r, "")
+    return [f"{k} {v}" for k, v in totals.items()]
+
+
+def read_spans(path: Union[Path, str]) -> dict[str, list[dict]]:
+    """Spann ur en JSON-loggfil, grupperade per trace_id i filens ordning."""
+    traces: dict[str, list[dict]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                s = json.loads(line).get("span")
+            except (json.JSONDecodeError, AttributeError):
+                continue
+            if s:
+                traces.setdefault(s["trace_id"], []).append(s)
+    return traces
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Spann ur en JSON-logg som träd eller hopvikta stackar")
+    ap.add_argument("log", type=Path)
+    ap.add_argument("--trace", help="trace_id (standard: senaste)")
+    ap.add_argument("--folded", action="store_true", help="format för flamegraph.pl / speedscope")
+    args = ap.parse_args()
+
+    traces = read_spans(args.log)
+    if not traces:
+        print("Inga spann i loggen", file=sys.stderr)
+        return 1
+    spans = traces[args.trace] if args.trace else traces[next(reversed(traces))]
+    print("\n".join(folded(spans)) if args.folded else format_tree(spans))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,13 +3,16 @@ from __future__ import annotations
 
 import logging
 import sqlite3
-from datetime import date, datetime
-from typing import Optional
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import IO, Mapping, Optional, Union
+import numpy as np
 import pandas as pd
 
+from app.services import versions
+from app.services import telemetry
+
 logger = logging.getLogger(__name__)
-if not logger.handlers:
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 def _validate_inputs(user: str, ticker: str, side: str, qty: float, price: float, ts: str, fee: float) -> tuple[str, str]:
     assert isinstance(user, str) and user.strip(), "user måste vara en icke-tom sträng"
@@ -37,22 +40,14 @@ def current_qty(conn: sqlite3.Connection, user: str, ticker: str) -> float:
     (qty_now,) = cur.fetchone()
     return float(qty_now or 0.0)
 
-def record_trade(
-    conn: sqlite3.Connection,
-    user: str,
-    ticker: str,
-    side: str,
-    qty: float,
-    price: float,
-    ts: str,
-    fee: float = 0.0,
-) -> int:
-    user, side_norm = _validate_inputs(user, ticker, side, qty, price, ts, fee)
+def _check_sell(conn: sqlite3.Connection, user: str, ticker: str, side_norm: str, qty: float) -> None:
     if side_norm == "SELL":
         qty_now = current_qty(conn, user, ticker)
         if qty > qty_now + 1e-12:
             raise ValueError("Kan inte sälja fler än du äger")
 
+def _insert_trade(conn: sqlite3.Connection, user: str, ticker: str, side_norm: str,
+                  qty: float, price: float, ts: str, fee: float) -> int:
     cur = conn.execute(
         """
         INSERT INTO trades(user, ticker, ts, side, qty, price, fee)
@@ -60,9 +55,30 @@ def record_trade(
         """,
         (user, ticker, ts, side_norm, float(qty), float(price), float(fee)),
     )
-    conn.commit()
+    versions.bump(conn, versions.trades_domain(user))
     return int(cur.lastrowid)
 
+@telemetry.traced()
+def record_trade(
+    conn: sqlite3.Connection,
+    user: str,
+    ticker: str,
+    side: str,
+    qty: float,
+    price: float,
+    ts: str,
+    fee: float = 0.0,
+) -> int:
+    """
+    Enkel skrivväg på en given anslutning. Kontroll och insert är separata
+    satser – för samtidiga sessioner, använd app.services.writer.TradeWriter.
+    """
+    user, side_norm = _validate_inputs(user, ticker, side, qty, price, ts, fee)
+    _check_sell(conn, user, ticker, side_norm, qty)
+    _id = _insert_trade(conn, user, ticker, side_norm, qty, price, ts, fee)
+    conn.commit()
+    return _id
+
 def list_trades(conn: sqlite3.Connection, user: str, ticker: Optional[str] = None) -> pd.DataFrame:
     sql = """
         SELECT id, user, ticker, ts, side, qty, price, fee
@@ -83,6 +99,255 @@ def list_trades(conn: sqlite3.Connection, user: str, ticker: Optional[str] = Non
         })
     return df
 
+# ---------- Historik (keyset-paginering) ----------
+
+HISTORY_COLS = ["id", "user", "ticker", "ts", "side", "qty", "price", "fee"]
+
+def _history_where(
+    user: str,
+    ticker: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[Union[date, str]] = None,
+    end: Optional[Union[date, str]] = None,
+) -> tuple[str, list]:
+    conds, params = ["user = ?"], [user]
+    if ticker:
+        conds.append("ticker = ?"); params.append(ticker)
+    if side:
+        conds.append("side = ?"); params.append(side.strip().upper())
+    if start is not None:
+        conds.append("ts >= ?"); params.append(pd.Timestamp(start).date().isoformat())
+    if end is not None:
+        # t.o.m. slutdagen, även rader med klockslag
+        conds.append("ts < ?"); params.append((pd.Timestamp(end).date() + timedelta(days=1)).isoformat())
+    return " AND ".join(conds), params
+
+@telemetry.traced()
+def list_trades_page(
+    conn: sqlite3.Connection,
+    user: str,
+    *,
+    ticker: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[Union[date, str]] = None,
+    end: Optional[Union[date, str]] = None,
+    cursor: Optional[tuple[str, int]] = None,
+    limit: int = 50,
+    newest_first: bool = True,
+) -> tuple[pd.DataFrame, Optional[tuple[str, int]]]:
+    """
+    En sida historik sorterad på (ts, id). cursor är (ts, id) för sista raden på
+    föregående sida; returnerar (sida, cursor för nästa sida eller None).
+    Läser bara limit+1 rader via indexen på (user, ts, id) / (user, ticker, ts, id).
+    """
+    where, params = _history_where(user, ticker, side, start, end)
+    op, order = ("<", "DESC") if newest_first else (">", "ASC")
+    if cursor is not None:
+        where += f" AND (ts, id) {op} (?, ?)"
+        params += [cursor[0], int(cursor[1])]
+    sql = f"""
+        SELECT {", ".join(HISTORY_COLS)}
+        FROM trades
+        WHERE {where}
+        ORDER BY ts {order}, id {order}
+        LIMIT ?
+    """
+    rows = conn.execute(sql, params + [int(limit) + 1]).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    df = pd.DataFrame.from_records(rows, columns=HISTORY_COLS)
+    nxt = (rows[-1][3], rows[-1][0]) if has_more else None
+    return df, nxt
+
+@telemetry.traced()
+def count_trades(
+    conn: sqlite3.Connection,
+    user: str,
+    *,
+    ticker: Optional[str] = None,
+    side: Optional[str] = None,
+    start: Optional[Union[date, str]] = None,
+    end: Optional[Union[date, str]] = None,
+) -> int:
+    where, params = _history_where(user, ticker, side, start, end)
+    (n,) = conn.execute(f"SELECT COUNT(*) FROM trades WHERE {where}", params).fetchone()
+    return int(n)
+
+def traded_tickers(conn: sqlite3.Connection, user: str) -> list[str]:
+    rows = conn.execute("SELECT DISTINCT ticker FROM trades WHERE user = ? ORDER BY ticker", (user,))
+    return [r[0] for r in rows]
+
+# ---------- Bulkimport (mäklar-CSV) ----------
+
+# Kolumnnamn i vanliga mäklarexporter -> standardnamn (jämförs i gemener)
+BROKER_ALIASES = {
+    "ts": "ts", "date": "ts", "datum": "ts", "affärsdag": "ts", "transaktionsdag": "ts",
+    "ticker": "ticker", "symbol": "ticker", "yf_symbol": "ticker", "värdepapper": "ticker",
+    "värdepapper/beskrivning": "ticker", "instrument": "ticker",
+    "side": "side", "typ": "side", "type": "side", "typ av transaktion": "side",
+    "transaktionstyp": "side", "action": "side",
+    "qty": "qty", "antal": "qty", "quantity": "qty", "shares": "qty",
+    "price": "price", "kurs": "price", "pris": "price",
+    "fee": "fee", "courtage": "fee", "avgift": "fee", "commission": "fee",
+}
+SIDE_ALIASES = {
+    "BUY": "BUY", "KÖP": "BUY", "KÖPT": "BUY", "B": "BUY",
+    "SELL": "SELL", "SÄLJ": "SELL", "SÅLT": "SELL", "S": "SELL",
+}
+IMPORT_COLS = ["row", "ts", "ticker", "side", "qty", "price", "fee"]
+
+
+def _to_number(s: pd.Series) -> pd.Series:
+    # "1 234,50" / "1.234,50" / "1,234.50" / "1234.5" -> float, ogiltigt/tvetydigt -> NaN.
+    # Sista avgränsaren är decimaltecknet om den förekommer en gång; flera gånger är
+    # den tusentalsavgränsare ("1.234.567") och då får den andra inte förekomma.
+    # En ensam avgränsare följd av exakt tre siffror ("1,000", "1.234") kan vara
+    # båda och blir NaN, så att validate_trades() stoppar raden.
+    s = s.astype("string").str.replace(r"[\s\u00a0]", "", regex=True).fillna("")
+    ambiguous = s.str.fullmatch(r"[+-]?[1-9]\d{0,2}[.,]\d{3}").astype(bool)
+    n_comma, n_dot = s.str.count(","), s.str.count(r"\.")
+    comma_last = (s.str.rfind(",") > s.str.rfind(".")).astype(bool)
+    n_dec = n_comma.where(comma_last, n_dot)
+    n_other = n_dot.where(comma_last, n_comma)
+    decimal = s.str.replace(",", "", regex=False).where(
+        ~comma_last, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    thousands_only = s.str.replace(r"[.,]", "", regex=True).where(n_other == 0)
+    return pd.to_numeric(decimal.where(n_dec <= 1, thousands_only).mask(ambiguous), errors="coerce")
+
+
+def parse_broker_csv(
+    source: Union[Path, str, IO],
+    symbols: Optional[Mapping[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Läser en mäklar-CSV (valfri avgränsare, svenska eller engelska kolumnnamn)
+    till kolumnerna row, ts, ticker, side, qty, price, fee. Ingen validering görs
+    här – ogiltiga värden blir NaN/tomma och fångas av validate_trades().
+    symbols översätter t.ex. bolagsnamn ('Investor B') till Yahoo-ticker.
+    """
+    raw = pd.read_csv(source, dtype=str, keep_default_na=False, sep=None, engine="python", encoding="utf-8-sig")
+    rename = {}
+    for c in raw.columns:
+        target = BROKER_ALIASES.get(str(c).strip().lower())
+        if target and target not in rename.values():
+            rename[c] = target
+    df = raw.rename(columns=rename)
+    missing = [c for c in ("ts", "ticker", "side", "qty", "price") if c not in df.columns]
+    if missing:
+        raise ValueError(f"Saknar kolumner i CSV: {missing}. Hittade: {list(raw.columns)}")
+
+    out = pd.DataFrame({
+        "row": np.arange(2, len(df) + 2),  # radnummer i filen (rubrik = rad 1)
+        "ts": df["ts"].str.strip(),
+        "ticker": df["ticker"].str.strip(),
+        "side": df["side"].str.strip().str.upper().map(SIDE_ALIASES),
+        "qty": _to_number(df["qty"]).abs(),  # vissa mäklare har negativt antal vid sälj
+        "price": _to_number(df["price"]),
+        "fee": _to_number(df["fee"]).abs() if "fee" in df.columns else 0.0,
+    })
+    if symbols:
+        out["ticker"] = out["ticker"].map(lambda t: symbols.get(t, t))
+    return out[IMPORT_COLS]
+
+
+def validate_trades(conn: sqlite3.Connection, user: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validerar alla rader vektoriserat och returnerar dem i tidsordning med
+    kolumnen 'error' (None = ok). Samma regler som record_trade: blankningskontrollen
+    görs som en löpande kvantitet per ticker i minnet, med startvärdet från
+    användarens nuvarande innehav (en grupperad fråga).
+    """
+    df = df.copy()
+    if "row" not in df.columns:
+        df.insert(0, "row", np.arange(1, len(df) + 1))
+    df["fee"] = pd.to_numeric(df.get("fee", 0.0), errors="coerce").fillna(0.0)
+    for c in ("qty", "price"):
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df["ticker"] = df["ticker"].fillna("").astype(str).str.strip()
+    df["side"] = df["side"].fillna("").astype(str).str.strip().str.upper()
+
+    dt = pd.to_datetime(df["ts"], format="ISO8601", errors="coerce")
+    has_time = dt.dt.normalize() != dt
+    df["ts"] = np.where(has_time, dt.dt.strftime("%Y-%m-%dT%H:%M:%S"), dt.dt.strftime("%Y-%m-%d"))
+
+    error = pd.Series(None, index=df.index, dtype="object")
+    checks = [
+        (df["fee"] >= 0, "fee måste vara ≥ 0"),
+        (df["price"] > 0, "price måste vara > 0"),
+        (df["qty"] > 0, "qty måste vara > 0"),
+        (df["side"].isin(["BUY", "SELL"]), "side måste vara 'BUY' eller 'SELL'"),
+        (dt.notna(), "ts måste vara ISO8601 (YYYY-MM-DD)"),
+        (df["ticker"] != "", "ticker måste vara en icke-tom sträng"),
+    ]
+    for ok, msg in checks:  # sista fel vinner -> samma prioritet som _validate_inputs
+        error = error.mask(~ok, msg)
+    user = user.strip() if isinstance(user, str) else ""
+    if not user:
+        error[:] = "user måste vara en icke-tom sträng"
+    df["error"] = error
+
+    df = df.sort_values(["ts", "row"], kind="stable").reset_index(drop=True)
+
+    # Löpande kvantitet per ticker (endast giltiga rader påverkar innehavet)
+    held = dict(conn.execute(
+        """
+        SELECT ticker, SUM(CASE WHEN side='BUY' THEN qty ELSE -qty END)
+        FROM trades WHERE user = ? GROUP BY ticker
+        """,
+        (user,),
+    ).fetchall())
+    valid = df["error"].isna().to_numpy()
+    signed = np.where(df["side"].to_numpy() == "BUY", 1.0, -1.0) * df["qty"].to_numpy()
+    for ticker, idx in df.index[valid].groupby(df.loc[valid, "ticker"]).items():
+        running = float(held.get(ticker) or 0.0)
+        for i in idx:
+            if signed[i] < 0 and -signed[i] > running + 1e-12:
+                df.at[i, "error"] = "Kan inte sälja fler än du äger"
+            else:
+                running += signed[i]
+    return df
+
+
+def import_trades(conn: sqlite3.Connection, user: str, df: pd.DataFrame) -> tuple[int, pd.DataFrame]:
+    """
+    Validerar och lägger in alla giltiga rader med en executemany i en enda
+    transaktion. Returnerar (antal inlagda, avvisade rader med 'error').
+    Transaktionen tar skrivlåset (BEGIN IMMEDIATE) före valideringen, så att
+    blankningskontrollen inte kan racea med andra skrivare.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        checked = validate_trades(conn, user, df)
+        ok = checked[checked["error"].isna()]
+        rows = list(zip(
+            [str(user).strip()] * len(ok), ok["ticker"], ok["ts"], ok["side"],
+            ok["qty"].astype(float), ok["price"].astype(float), ok["fee"].astype(float),
+        ))
+        if rows:
+            conn.executemany(
+                """
+                INSERT INTO trades(user, ticker, ts, side, qty, price, fee)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            versions.bump(conn, versions.trades_domain(str(user).strip()))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    rejects = checked.loc[checked["error"].notna(), IMPORT_COLS + ["error"]]
+    return len(rows), rejects.sort_values("row").reset_index(drop=True)
+
+
+def import_trades_csv(
+    conn: sqlite3.Connection,
+    user: str,
+    source: Union[Path, str, IO],
+    symbols: Optional[Mapping[str, str]] = None,
+) -> tuple[int, pd.DataFrame]:
+    return import_trades(conn, user, parse_broker_csv(source, symbols))
+
 #  Testkörning 
 if __name__ == "__main__":
     print("Startar trades self-test…")
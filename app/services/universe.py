@@ -1,9 +1,20 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Union, Iterable, Optional
+from typing import Union, Iterable, Mapping, Optional
+import heapq
+import logging
+import os
+import pickle
 import re
+import threading
+import weakref
 import pandas as pd
 
+from app.services import versions
+from app.services.search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
 # Primära kolumnnamn som appen använder
 REQUIRED_COLS = ["yf_symbol", "name_display", "segment"]
 
@@ -22,12 +33,76 @@ def _normalize_text(s: str) -> str:
     s = re.sub(r"\s+", " ", s)
     return s.strip()
 
-def load_universe(path: Union[Path, str]) -> pd.DataFrame:
+# Processgemensam cache: sökväg -> ((mtime_ns, storlek), frame)
+_universes: dict[str, tuple[tuple[int, int], pd.DataFrame]] = {}
+_universes_lock = threading.Lock()
+
+# Höjs när frame/index ändrar format -> gamla snapshots ignoreras
+SNAPSHOT_FORMAT = 1
+
+def snapshot_path(csv_path: Union[Path, str]) -> Path:
+    p = Path(csv_path)
+    return p.with_name(p.name + ".snapshot.pkl")
+
+def load_universe(path: Union[Path, str], default_segment: Optional[str] = None) -> pd.DataFrame:
+    """
+    Universum med förbyggt sökindex. Cachas per process och invalideras när
+    filens mtime/storlek ändras. Vid kallstart läses en binär snapshot
+    (<csv>.snapshot.pkl) bredvid CSV:n om den matchar filen, annars parsas
+    CSV:n och snapshoten skrivs om. Frame:n delas – behandla den som read-only.
+    default_segment används om filen saknar segment-kolumn (en fil per segment).
+    """
+    csv_path = Path(path).resolve()
+    key = str(csv_path)
+    sig = versions.file_version(csv_path)
+    with _universes_lock:
+        hit = _universes.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+
+    df, index = _read_snapshot(csv_path, sig)
+    if df is None:
+        df = _parse_universe(csv_path, default_segment)
+        index = SearchIndex.from_frame(df)
+        _write_snapshot(csv_path, sig, df, index)
+    _register_index(df, index)
+    with _universes_lock:
+        _universes[key] = (sig, df)
+    return df
+
+def clear_cache() -> None:
+    with _universes_lock:
+        _universes.clear()
+
+def _read_snapshot(csv_path: Path, sig: tuple[int, int]):
+    try:
+        with open(snapshot_path(csv_path), "rb") as f:
+            snap = pickle.load(f)
+        if snap.get("format") == SNAPSHOT_FORMAT and tuple(snap.get("source")) == sig:
+            return snap["frame"], snap["index"]
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("Kunde inte läsa universum-snapshot för %s, parsar CSV.", csv_path, exc_info=True)
+    return None, None
+
+def _write_snapshot(csv_path: Path, sig: tuple[int, int], df: pd.DataFrame, index: SearchIndex) -> None:
+    target = snapshot_path(csv_path)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump({"format": SNAPSHOT_FORMAT, "source": sig, "frame": df, "index": index},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)  # atomiskt: andra processer ser aldrig en halv fil
+    except OSError:
+        logger.warning("Kunde inte skriva universum-snapshot %s.", target, exc_info=True)
+        tmp.unlink(missing_ok=True)
+
+def _parse_universe(csv_path: Path, default_segment: Optional[str] = None) -> pd.DataFrame:
     """
     Läser CSV, mappar ev. alias-kolumner, säkerställer str-datatyp,
     och bygger en 'search_blob' som vi söker i.
     """
-    csv_path = Path(path)
     df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, sep=None, engine="python", encoding="utf-8-sig")
 
     # Mappar alias → standardnamn
@@ -35,6 +110,8 @@ def load_universe(path: Union[Path, str]) -> pd.DataFrame:
     for alias, target in ALIASES.items():
         if alias in cols_lower and target not in df.columns:
             df = df.rename(columns={cols_lower[alias]: target})
+    if "segment" not in df.columns and default_segment:
+        df["segment"] = default_segment
 
     # Säkerställer nödvändiga kolumner
     missing = [c for c in REQUIRED_COLS if c not in df.columns]
@@ -45,9 +122,9 @@ def load_universe(path: Union[Path, str]) -> pd.DataFrame:
     for col in REQUIRED_COLS:
         df[col] = df[col].astype(str).map(_normalize_text)
 
-    # search_blob: (gemener) av namn + ticker + variant utan .ST. Detta gör att man kan hitta samma aktie med olika inmatningar. 
+    # search_blob: (gemener) av namn + ticker + variant utan börssuffix (.ST, .OL, ...). Detta gör att man kan hitta samma aktie med olika inmatningar. 
     # Detta är hela anledningen till att jag tog in CSV-filen för universe så att man inte ska vara tvungen att söka på specifika Yahoo-tickers.
-    base = df["yf_symbol"].str.replace(".ST", "", regex=False)
+    base = df["yf_symbol"].str.replace(r"\.[A-Za-z]{1,3}$", "", regex=True)
     df["search_blob"] = (
         (df["name_display"] + " " + df["yf_symbol"] + " " + base)
         .str.lower()
@@ -57,7 +134,27 @@ def load_universe(path: Union[Path, str]) -> pd.DataFrame:
     df["display"] = df["name_display"] + " — " + df["yf_symbol"]
 
     # Behåller ordning & relevanta kolumner
-    return df[REQUIRED_COLS + ["search_blob", "display"]].copy()
+    return df[REQUIRED_COLS + ["search_blob", "display"]].reset_index(drop=True)
+
+# Sökindex per universum-DataFrame (byggs vid laddning, släpps när frame:n släpps)
+_indexes: dict[int, tuple[weakref.ref, SearchIndex]] = {}
+_indexes_lock = threading.Lock()
+
+def _register_index(df: pd.DataFrame, index: SearchIndex) -> None:
+    key = id(df)
+    ref = weakref.ref(df, lambda _r, k=key: _indexes.pop(k, None))
+    with _indexes_lock:
+        _indexes[key] = (ref, index)
+
+def get_index(df: pd.DataFrame) -> SearchIndex:
+    """Sökindex för df; byggs och registreras om df inte kommer från load_universe."""
+    with _indexes_lock:
+        entry = _indexes.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    index = SearchIndex.from_frame(df)
+    _register_index(df, index)
+    return index
 
 def search_by_name(
     df: pd.DataFrame,
@@ -68,38 +165,156 @@ def search_by_name(
     """
     Sök i namn + ticker (case-insensitive).
     Sorterar så att namn som *börjar* med sökordet kommer överst.
+    Använder det förbyggda sökindexet (se search_index.py); segmentfiltret
+    tillämpas under matchningen.
     """
-    if not query:
-        out = df.copy()
-    else:
-        q = _normalize_text(query).lower()
-        mask = df["search_blob"].str.contains(q, na=False)
-        out = df.loc[mask].copy()
-
-        # enkel relevanssortering:
-        startswith_name = df["name_display"].str.lower().str.startswith(q)
-        startswith_ticker = df["yf_symbol"].str.lower().str.startswith(q)
-        contains_name_pos = df["name_display"].str.lower().str.find(q)
-
-        out = out.assign(
-            _rank_name_starts=startswith_name.astype(int),
-            _rank_ticker_starts=startswith_ticker.astype(int),
-            _rank_pos=contains_name_pos.where(contains_name_pos >= 0, 9999),
-        ).sort_values(
-            by=["_rank_name_starts", "_rank_ticker_starts", "_rank_pos", "name_display"],
-            ascending=[False, False, True, True],
-        ).drop(columns=["_rank_name_starts", "_rank_ticker_starts", "_rank_pos"])
-
-    # Segmentfilter om angivet
-    if segments:
-        segset = {s.lower() for s in segments}
-        out = out[out["segment"].str.lower().isin(segset)]
-
-    # Begränsa antal träffar
-    if limit is not None:
-        out = out.head(limit)
-
-    return out.reset_index(drop=True)
+    q = _normalize_text(query).lower() if query else None
+    ids = get_index(df).search(q, segments=segments, limit=limit)
+    return df.iloc[ids].reset_index(drop=True)
+
+# ---------- Flera börser (shardat universum) ----------
+
+class ShardedUniverse:
+    """
+    Universum fördelat på börser och segment. Varje källa är antingen
+      - en CSV-fil (med segment-kolumn) som delas upp per segment när den
+        laddas första gången, eller
+      - en katalog med en CSV per segment (<katalog>/<segment>.csv) där varje
+        fil laddas först när just det segmentet efterfrågas.
+    Varje shard (börs, segment) har ett eget sökindex, och segment-/börsfiltret
+    väljer shards INNAN matchningen – kostnaden följer de segment som frågas.
+    """
+
+    def __init__(self, sources: Mapping[str, Union[Path, str]]) -> None:
+        self.sources = {ex: Path(p) for ex, p in sources.items()}
+        self._split: dict[str, tuple[pd.DataFrame, dict[str, pd.DataFrame]]] = {}  # fil -> (frame, segment -> frame)
+        self._views: dict[tuple, dict] = {}  # (börser, segment) -> {"shards", "frame", "names"}
+        self._lock = threading.Lock()
+
+    def exchanges(self) -> list[str]:
+        return list(self.sources)
+
+    def segments(self, exchange: str) -> list[str]:
+        """Segment för en börs (laddar en enfilskälla, men inte katalogkällor)."""
+        src = self.sources[exchange]
+        if src.is_dir():
+            return sorted(p.stem for p in src.glob("*.csv"))
+        return list(self._file_shards(src))
+
+    def _file_shards(self, path: Path) -> dict[str, pd.DataFrame]:
+        df = load_universe(path)
+        with self._lock:
+            hit = self._split.get(str(path))
+            if hit is not None and hit[0] is df:
+                return hit[1]
+        shards = {seg: part.reset_index(drop=True) for seg, part in df.groupby("segment", sort=False)}
+        with self._lock:
+            self._split[str(path)] = (df, shards)
+        return shards
+
+    def _shard_frames(
+        self,
+        exchanges: Optional[Iterable[str]] = None,
+        segments: Optional[Iterable[str]] = None,
+    ) -> list[tuple[str, str, pd.DataFrame]]:
+        wanted = {s.lower() for s in segments} if segments else None
+        out = []
+        for ex in (exchanges or self.sources):
+            src = self.sources[ex]
+            if src.is_dir():
+                for f in sorted(src.glob("*.csv")):
+                    if wanted is None or f.stem.lower() in wanted:
+                        out.append((ex, f.stem, load_universe(f, default_segment=f.stem)))
+            else:
+                for seg, part in self._file_shards(src).items():
+                    if wanted is None or seg.lower() in wanted:
+                        out.append((ex, seg, part))
+        return out
+
+    def frame(
+        self,
+        exchanges: Optional[Iterable[str]] = None,
+        segments: Optional[Iterable[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Valda shards som en frame med kolumnen 'exchange'. Cachas per urval så
+        länge samma shard-frames gäller (load_universe ger nytt objekt när en
+        fil ändras) – behandla den som read-only.
+        """
+        return self._view(exchanges, segments)["frame"]
+
+    def names(
+        self,
+        exchanges: Optional[Iterable[str]] = None,
+        segments: Optional[Iterable[str]] = None,
+    ) -> dict[str, str]:
+        """name_display -> yf_symbol för valda shards (cachas som frame())."""
+        view = self._view(exchanges, segments)
+        if view["names"] is None:
+            df = view["frame"]
+            view["names"] = dict(zip(df["name_display"], df["yf_symbol"]))
+        return view["names"]
+
+    def _view(
+        self,
+        exchanges: Optional[Iterable[str]],
+        segments: Optional[Iterable[str]],
+    ) -> dict:
+        key = (tuple(exchanges) if exchanges else None,
+               tuple(sorted({s.lower() for s in segments})) if segments else None)
+        shards = self._shard_frames(exchanges, segments)
+        with self._lock:
+            hit = self._views.get(key)
+        if (hit is not None and len(hit["shards"]) == len(shards)
+                and all(a is b for a, (_, _, b) in zip(hit["shards"], shards))):
+            return hit
+        parts = [df.assign(exchange=ex) for ex, _, df in shards]
+        if parts:
+            frame = pd.concat(parts, ignore_index=True)
+        else:
+            frame = pd.DataFrame(columns=REQUIRED_COLS + ["search_blob", "display", "exchange"])
+        view = {"shards": [df for _, _, df in shards], "frame": frame, "names": None}
+        with self._lock:
+            self._views[key] = view
+        return view
+
+    def search(
+        self,
+        query: str,
+        segments: Optional[Iterable[str]] = None,
+        exchanges: Optional[Iterable[str]] = None,
+        limit: Optional[int] = 50,
+    ) -> pd.DataFrame:
+        """Som search_by_name, men över valda shards; träffarna slås ihop på rangnyckeln."""
+        q = _normalize_text(query).lower() if query else None
+        shards = self._shard_frames(exchanges, segments)
+        streams = [
+            [(key[:4], n, key[4:], i) for key, i in get_index(df).ranked(q, limit=limit)]
+            for n, (_, _, df) in enumerate(shards)
+        ]
+        merged = list(heapq.merge(*streams))
+        if limit is not None:
+            merged = merged[:limit]
+        parts = []
+        for n, (ex, _, df) in enumerate(shards):
+            picks = [(order, i) for order, (_, sn, _, i) in enumerate(merged) if sn == n]
+            if picks:
+                ords, ids = zip(*picks)
+                parts.append(df.iloc[list(ids)].assign(exchange=ex, _ord=ords))
+        if not parts:
+            return pd.DataFrame(columns=REQUIRED_COLS + ["search_blob", "display", "exchange"])
+        return pd.concat(parts).sort_values("_ord").drop(columns="_ord").reset_index(drop=True)
+
+
+_default_universe: Optional[ShardedUniverse] = None
+
+def get_universe() -> ShardedUniverse:
+    """Processgemensamt universum över config.UNIVERSE_SOURCES."""
+    global _default_universe
+    if _default_universe is None:
+        from app.config import UNIVERSE_SOURCES
+        _default_universe = ShardedUniverse(UNIVERSE_SOURCES)
+    return _default_universe
 
 if __name__ == "__main__":
     # Snabbtest
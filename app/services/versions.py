@@ -0,0 +1,98 @@
+# app/services/versions.py
+"""
+Versionsräknare per datadomän för exakt cache-invalidering.
+
+Tabellen data_versions håller en monotont växande räknare per domän:
+  - "prices"          bumpas av etl.load när nya rader läggs in (även nya
+                      växelkurser och valutor, se fx.py)
+  - "fx"              bumpas av etl.load_securities och etl.load_fx – bara
+                      valutor och växelkurser, inte vanliga kursrader
+  - "trades:<user>"   bumpas vid varje insert av en trade för användaren
+Bumpen görs i SAMMA transaktion som skrivningen, så en läsare ser aldrig ny
+data med gammal version (eller tvärtom). Resultat kan sedan cachas på
+(nyckel, versioner) – oförändrad data ger cacheträff, ändrad data ger miss.
+
+Universumet är en CSV-fil och versioneras på filens mtime/storlek (file_version).
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable, Iterable, TypeVar, Union
+
+from app.services import db
+
+PRICES = "prices"
+FX = "fx"
+
+T = TypeVar("T")
+
+
+def trades_domain(user: str) -> str:
+    return f"trades:{user}"
+
+
+def bump(conn: sqlite3.Connection, *domains: str) -> None:
+    """Ökar räknarna. Committar inte – anropas inne i skrivarens transaktion."""
+    conn.executemany(
+        """
+        INSERT INTO data_versions(domain, version) VALUES (?, 1)
+        ON CONFLICT(domain) DO UPDATE SET version = version + 1
+        """,
+        [(d,) for d in domains],
+    )
+
+
+def get(conn: sqlite3.Connection, *domains: str) -> tuple[int, ...]:
+    """Aktuella versioner i samma ordning som domains (0 om domänen aldrig skrivits)."""
+    if not domains:
+        return ()
+    try:
+        rows = conn.execute(
+            f"SELECT domain, version FROM data_versions WHERE domain IN ({','.join('?' * len(domains))})",
+            domains,
+        ).fetchall()
+    except sqlite3.OperationalError:  # äldre DB utan tabellen
+        return (0,) * len(domains)
+    found = dict(rows)
+    return tuple(int(found.get(d, 0)) for d in domains)
+
+
+def file_version(path: Union[Path, str]) -> tuple[int, int]:
+    """Version för filbaserade domäner (universumet): (mtime_ns, storlek)."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+# ---------- Processgemensam resultatcache ----------
+
+CACHE_SIZE = 256
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached(conn: sqlite3.Connection, domains: Iterable[str], key: Hashable, fn: Callable[[], T]) -> T:
+    """
+    Returnerar fn() cachat på (databas, key, versioner för domains).
+    Värdet delas mellan sessioner/trådar och ska behandlas som read-only.
+    """
+    domains = tuple(domains)
+    k = (db.database_path(conn) or id(conn), key, domains, get(conn, *domains))
+    with _cache_lock:
+        if k in _cache:
+            _cache.move_to_end(k)
+            return _cache[k]
+    value = fn()
+    with _cache_lock:
+        _cache[k] = value
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
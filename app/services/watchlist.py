@@ -0,0 +1,168 @@
+# app/services/watchlist.py
+"""
+Bevakningslistor per användare.
+
+Kurser hämtas inte per användare utan i en gemensam uppdateringscykel:
+alla bevakade tickers (över alla användare, deduplicerade) vars kurs i
+quotes är gammal tas i EN lease-uppdatering och hämtas i chunkar om
+chunk_size tickers per anrop till Yahoo. Trafiken skalar därmed med antalet
+distinkta tickers, inte med antalet användare. Att visa en lista är en
+enda lokal fråga (watchlist LEFT JOIN quotes).
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import pandas as pd
+
+from app.services import db
+from app.services import price_fetcher
+from app.services import quotes
+from app.services import telemetry
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = 60.0
+CHUNK_SIZE = 50
+
+# [tickers] -> {ticker: (ts, close)}
+DownloadMany = Callable[[list[str]], dict[str, tuple[str, float]]]
+
+
+# ---------- Lista per användare ----------
+
+def add(conn: sqlite3.Connection, user: str, ticker: str) -> bool:
+    """Lägger till ticker; False om den redan fanns."""
+    ticker = (ticker or "").strip().upper()
+    if not ticker:
+        raise ValueError("Ticker saknas.")
+    cur = conn.execute("INSERT OR IGNORE INTO watchlist(user, ticker) VALUES (?, ?)", (user, ticker))
+    conn.commit()
+    return cur.rowcount == 1
+
+
+def remove(conn: sqlite3.Connection, user: str, tickers: list[str]) -> int:
+    if not tickers:
+        return 0
+    placeholders = ",".join("?" * len(tickers))
+    cur = conn.execute(f"DELETE FROM watchlist WHERE user = ? AND ticker IN ({placeholders})", [user, *tickers])
+    conn.commit()
+    return cur.rowcount
+
+
+@telemetry.traced()
+def view(conn: sqlite3.Connection, user: str) -> pd.DataFrame:
+    """Användarens lista med senaste kurs ur quotes (en fråga, ingen nätverkstrafik)."""
+    q = """
+    SELECT w.ticker, q.price AS last_price, q.ts AS price_date, q.fetched_at
+    FROM watchlist w
+    LEFT JOIN quotes q ON q.ticker = w.ticker
+    WHERE w.user = ?
+    ORDER BY w.ticker
+    """
+    df = pd.read_sql_query(q, conn, params=(user,))
+    df["fetched_at"] = pd.to_datetime(df["fetched_at"], unit="s", utc=True)
+    return df
+
+
+# ---------- Gemensam uppdatering ----------
+
+def _claim_stale(conn: sqlite3.Connection, max_age: float, lease: float) -> list[str]:
+    """Tar leasen för alla bevakade tickers med gammal kurs (samma lease som quotes.py)."""
+    now = time.time()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO quotes(ticker) SELECT DISTINCT ticker FROM watchlist")
+        rows = conn.execute(
+            """
+            UPDATE quotes SET refreshing_until = ?
+            WHERE ticker IN (SELECT DISTINCT ticker FROM watchlist)
+              AND (refreshing_until IS NULL OR refreshing_until < ?)
+              AND (fetched_at IS NULL OR fetched_at <= ?)
+            RETURNING ticker
+            """,
+            (now + lease, now, now - max_age),
+        ).fetchall()
+    return sorted(r[0] for r in rows)
+
+
+def refresh_cycle(
+    db_path: Union[Path, str] = db.DB_PATH,
+    chunk_size: int = CHUNK_SIZE,
+    max_age: float = quotes.MAX_AGE,
+    download_many: Optional[DownloadMany] = None,
+) -> dict:
+    """En uppdateringscykel. Returnerar {"tickers", "calls", "updated"} för mätning."""
+    download_many = download_many or price_fetcher.yf_last_closes
+    conn = sqlite3.connect(str(db_path), timeout=5.0)
+    try:
+        tickers = _claim_stale(conn, max_age, quotes.LEASE)
+        calls = updated = 0
+        for i in range(0, len(tickers), chunk_size):
+            chunk = tickers[i:i + chunk_size]
+            try:
+                got = download_many(chunk)
+            except Exception as e:
+                logger.warning("Kunde inte hämta kurser för %d tickers: %s", len(chunk), e)
+                got = {}
+            calls += 1
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    """
+                    UPDATE quotes SET price = ?, ts = ?, fetched_at = ?, refreshing_until = NULL
+                    WHERE ticker = ?
+                    """,
+                    [(float(p), ts, now, t) for t, (ts, p) in got.items()],
+                )
+                missing = [t for t in chunk if t not in got]
+                conn.executemany(
+                    "UPDATE quotes SET refreshing_until = ? WHERE ticker = ?",
+                    [(now + quotes.FAIL_BACKOFF, t) for t in missing],
+                )
+            updated += len(got)
+        return {"tickers": len(tickers), "calls": calls, "updated": updated}
+    finally:
+        conn.close()
+
+
+class WatchlistRefresher:
+    """Bakgrundstråd som kör refresh_cycle var interval:e sekund (eller direkt vid kick())."""
+
+    def __init__(self, db_path: Union[Path, str] = db.DB_PATH, interval: float = REFRESH_SECONDS) -> None:
+        self.db_path = str(db_path)
+        self.interval = interval
+        self.last: Optional[dict] = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watchlist-refresh", daemon=True)
+        self._thread.start()
+
+    def kick(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.last = refresh_cycle(self.db_path)
+            except Exception:
+                logger.exception("Uppdatering av bevakningslistor misslyckades")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+_refreshers: dict[str, WatchlistRefresher] = {}
+_refreshers_lock = threading.Lock()
+
+
+def get_refresher(db_path: Union[Path, str] = db.DB_PATH) -> WatchlistRefresher:
+    """Processgemensam uppdaterare per databasfil (startas vid första anropet)."""
+    key = str(Path(db_path).resolve())
+    with _refreshers_lock:
+        r = _refreshers.get(key)
+        if r is None or not r._thread.is_alive():
+            r = _refreshers[key] = WatchlistRefresher(key)
+        return r
@@ -0,0 +1,179 @@
+# app/services/writer.py
+"""
+Seriell skrivväg för trades med gruppcommit.
+
+Alla skrivningar går genom en kö till en enda skrivtråd med egen anslutning.
+Tråden samlar ihop det som hunnit köas (högst max_batch eller max_delay sekunder
+efter första posten), kör kontroll + insert för varje post inom samma
+BEGIN IMMEDIATE-transaktion och gör EN commit för hela gruppen. Blankningskontrollen
+ser därmed alltid tidigare poster i samma grupp och kan inte racea med andra
+anslutningar som också tar skrivlåset. Varje post körs i en egen SAVEPOINT, så
+att ett fel i en post bara avvisar den posten och inte resten av gruppen.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Union
+
+from app.services import db
+from app.services import trades
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class TradeWriter:
+    def __init__(
+        self,
+        db_path: Union[Path, str] = db.DB_PATH,
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+    ) -> None:
+        self.db_path = str(db_path)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.commits = 0   # antal gruppcommits (för mätning)
+        self.written = 0   # antal inlagda trades
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._error: Exception | None = None   # satt när tråden slutat ta emot poster
+        self._thread = threading.Thread(target=self._run, name="trade-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- API ----------
+
+    def submit(self, user: str, ticker: str, side: str, qty: float, price: float,
+               ts: str, fee: float = 0.0) -> Future:
+        """
+        Köar en trade. Future ger rad-id, eller ValueError/AssertionError
+        (samma meddelanden som record_trade) om traden avvisas.
+        """
+        fut: Future = Future()
+        with self._lock:
+            if self._error is not None or not self._thread.is_alive():
+                fut.set_exception(self._error or RuntimeError("TradeWriter är stängd"))
+                return fut
+            self._queue.put((fut, (user, ticker, side, qty, price, ts, fee)))
+        return fut
+
+    def record(self, user: str, ticker: str, side: str, qty: float, price: float,
+               ts: str, fee: float = 0.0, timeout: float | None = 30.0) -> int:
+        """Blockerande variant av submit(): returnerar rad-id eller kastar avvisningen."""
+        return self.submit(user, ticker, side, qty, price, ts, fee).result(timeout=timeout)
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ---------- Skrivtråd ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None)  # explicita transaktioner
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000;")
+            conn.execute("PRAGMA journal_mode = WAL;")
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            db.ensure_schema(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _fail_pending(self, error: Exception) -> None:
+        """Tar inte emot fler poster och avvisar allt som redan köats."""
+        with self._lock:
+            self._error = error
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[0].set_exception(error)
+
+    def _run(self) -> None:
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.exception("TradeWriter kunde inte öppna %s", self.db_path)
+            self._fail_pending(e)
+            return
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stop = True
+                        break
+                    batch.append(nxt)
+                self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+            self._fail_pending(RuntimeError("TradeWriter är stängd"))
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        results: list[tuple[Future, int | None, Exception | None]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fut, (user, ticker, side, qty, price, ts, fee) in batch:
+                conn.execute("SAVEPOINT trade")
+                try:
+                    user, side_norm = trades._validate_inputs(user, ticker, side, qty, price, ts, fee)
+                    trades._check_sell(conn, user, ticker, side_norm, qty)
+                    _id = trades._insert_trade(conn, user, ticker, side_norm, qty, price, ts, fee)
+                except Exception as e:   # bara den här posten avvisas
+                    conn.execute("ROLLBACK TO trade")
+                    conn.execute("RELEASE trade")
+                    results.append((fut, None, e))
+                    continue
+                conn.execute("RELEASE trade")
+                results.append((fut, _id, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.exception("Gruppcommit misslyckades (%d trades)", len(batch))
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for fut, _ in batch:
+                fut.set_exception(e)
+            return
+
+        self.commits += 1
+        for fut, _id, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                self.written += 1
+                fut.set_result(_id)
+
+
+_writers: dict[str, TradeWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path: Union[Path, str] = db.DB_PATH) -> TradeWriter:
+    """Processgemensam skrivare per databasfil."""
+    key = str(Path(db_path).resolve())
+    with _writers_lock:
+        w = _writers.get(key)
+        if w is None or not w._thread.is_alive():
+            w = _writers[key] = TradeWriter(key)
+        return w
@@ -4,6 +4,10 @@ from __future__ import annotations
 import streamlit as st
 from app.config import DEMO_USER, DEMO_PASS
 from app.services import db as dbsvc
+from app.services import telemetry
+
+# Loggning konfigureras här i startpunkten (en gång per process): JSON och spann till logs/app.log
+telemetry.setup(dbsvc.ROOT / "logs" / "app.log")
 
 # Delad helper. cachar DB-anslutning för hela appen
 @st.cache_resource(show_spinner=False)
@@ -0,0 +1,62 @@
+# benchmarks/bench_alerts.py
+"""
+Mäter kurslarmen: tid för alerts.evaluate efter en ny handelsdag, med
+olika lång historik i prices och olika många regler. Utvärderingen ska
+följa antalet nya staplar (och reglerna på de tickers som fått dem), inte
+historikens längd.
+
+    python benchmarks/bench_alerts.py [--tickers 400] [--rules 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import synthetic  # lägger ROOT och src på sys.path
+import etl
+from app.services import alerts, db
+
+
+def _run(years: int, n_tickers: int, n_rules: int) -> dict:
+    days, tickers, px = synthetic.price_panel(n_tickers, years, seed=4, extra_days=1)
+    kinds = list(alerts.KINDS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        etl.load(synthetic.price_frame(days[:-1], tickers, px[:-1]), db_path=path)
+        conn = sqlite3.connect(path)
+        db.ensure_schema(conn)
+        for i in range(n_rules):
+            t = tickers[i % n_tickers]
+            alerts.add_rule(conn, f"u{i % 50}", t, kinds[i % len(kinds)], float(px[-2, i % n_tickers]))
+        alerts.evaluate(conn)
+
+        # en ny dag, inläst utan larm så att utvärderingen kan tidtas separat
+        hook = etl._evaluate_alerts
+        etl._evaluate_alerts = lambda c: None
+        try:
+            etl.load(synthetic.price_frame(days[-1:], tickers, px[-1:]), db_path=path)
+        finally:
+            etl._evaluate_alerts = hook
+        ms, fired = synthetic.timed(lambda: alerts.evaluate(conn))
+        conn.close()
+    return {"years": years, "rules": n_rules, "history_rows": (len(days) - 1) * n_tickers,
+            "new_rows": n_tickers, "fired": fired, "evaluate_ms": ms}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=400)
+    ap.add_argument("--rules", type=int, default=2000)
+    args = ap.parse_args()
+
+    runs = [_run(years, args.tickers, rules) for years, rules in
+            ((1, args.rules), (5, args.rules), (5, args.rules // 10))]
+    print(json.dumps(runs, indent=2))
+
+
+if __name__ == "__main__":
+    main()
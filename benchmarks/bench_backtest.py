@@ -0,0 +1,51 @@
+# benchmarks/bench_backtest.py
+"""
+Mäter backtest-motorn på syntetisk data: en enskild körning och ett
+momentum-svep (lookback × top_n × ombalansering) över en processpool.
+
+    python benchmarks/bench_backtest.py [--tickers 300] [--years 20] [--workers N]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import synthetic  # lägger ROOT och src på sys.path
+from app.services import backtest
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=300)
+    ap.add_argument("--years", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    days, tickers, prices = synthetic.price_panel(args.tickers, args.years, seed=3)
+    dates = days.to_numpy(dtype="datetime64[ns]")
+    rng = np.random.default_rng(3)
+    for j in range(0, args.tickers, 5):    # var femte noteras någon gång under perioden
+        prices[: rng.integers(0, len(days) // 2), j] = np.nan
+
+    single_ms, _ = synthetic.timed(lambda: backtest.run(dates, tickers, prices, "momentum",
+                                                        {"lookback": 126, "top_n": 20, "rebalance": 21}))
+
+    grid = backtest.param_grid(lookback=[21, 63, 126, 252], top_n=[5, 10, 20, 40, 80], rebalance=[5, 21, 63])
+    sweep_ms, _ = synthetic.timed(lambda: backtest.sweep(dates, prices, "momentum", grid, workers=args.workers))
+
+    print(json.dumps({
+        "tickers": args.tickers,
+        "days": len(days),
+        "single_run_ms": single_ms,
+        "sweep_params": len(grid),
+        "workers": args.workers,
+        "sweep_s": sweep_ms / 1000,
+        "per_param_ms": sweep_ms / len(grid),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
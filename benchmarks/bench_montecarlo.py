@@ -0,0 +1,40 @@
+# benchmarks/bench_montecarlo.py
+"""
+Mäter Monte Carlo-motorn (montecarlo.run) på syntetisk historik: banor/s
+för båda lägena med 1 process respektive alla kärnor.
+
+    python benchmarks/bench_montecarlo.py [--tickers 20] [--paths 1000000] [--horizon 10]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+import synthetic  # lägger ROOT och src på sys.path
+from app.services import montecarlo as mc
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=20)
+    ap.add_argument("--paths", type=int, default=1_000_000)
+    ap.add_argument("--horizon", type=int, default=10)
+    args = ap.parse_args()
+
+    _, _, px = synthetic.price_panel(args.tickers, 5, seed=4)
+    returns = px[1:] / px[:-1] - 1
+    log_ret, values = mc.prepare(returns, np.full(args.tickers, 10_000.0))
+
+    out = {"tickers": args.tickers, "paths": args.paths, "horizon": args.horizon, "cpus": os.cpu_count()}
+    for mode in mc.MODES:
+        for workers in sorted({1, os.cpu_count() or 1}):
+            res = mc.simulate(log_ret, values, horizon=args.horizon, n_paths=args.paths, mode=mode, workers=workers)
+            out[f"{mode}_w{workers}_paths_per_sec"] = round(res["paths_per_sec"])
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
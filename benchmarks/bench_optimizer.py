@@ -0,0 +1,56 @@
+# benchmarks/bench_optimizer.py
+"""
+Mäter kovarianslagret och lösarna på syntetisk data (400 tickers × 3 år):
+första skattningen, skattning efter en ny handelsdag (rank-ett-uppdatering)
+och tid per optimeringsmetod.
+
+    python benchmarks/bench_optimizer.py [--tickers 400] [--window 252]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import synthetic  # lägger ROOT och src på sys.path
+from etl import load
+from app.services import covariance, optimizer
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=400)
+    ap.add_argument("--window", type=int, default=252)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(5)
+    days = pd.bdate_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=3 * 261)
+    tickers = [f"T{i:03d}.ST" for i in range(args.tickers)]
+    market = rng.normal(0.0003, 0.01, (len(days), 1))
+    px = 100 * np.cumprod(1 + market * rng.uniform(0.5, 1.5, args.tickers) + rng.normal(0, 0.012, (len(days), args.tickers)), axis=0)
+
+    out = {"tickers": args.tickers, "window": args.window}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        load(synthetic.price_frame(days[:-1], tickers, px[:-1]), db_path=path)
+        conn = sqlite3.connect(path)
+        out["estimate_cold_ms"], _ = synthetic.timed(lambda: covariance.get_estimate(conn, tickers, args.window))
+        out["estimate_warm_ms"], _ = synthetic.timed(lambda: covariance.get_estimate(conn, tickers, args.window))
+        load(synthetic.price_frame(days[-1:], tickers, px[-1:]), db_path=path)
+        out["estimate_new_day_ms"], est = synthetic.timed(lambda: covariance.get_estimate(conn, tickers, args.window))
+        conn.close()
+
+    cap = max(0.02, 2.0 / args.tickers)
+    out["min_variance_ms"], _ = synthetic.timed(lambda: optimizer.min_variance(est["cov"], cap))
+    out["max_sharpe_ms"], _ = synthetic.timed(lambda: optimizer.max_sharpe(est["mean"], est["cov"], cap))
+    out["risk_parity_ms"], _ = synthetic.timed(lambda: optimizer.risk_parity(est["cov"], cap))
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_performance.py
+"""
+Mäter Dashboard-beräkningen (performance.nav_series) på syntetisk data:
+50 tickers × 20 år dagskurser och en köp/sälj-historik per ticker.
+
+    python benchmarks/bench_performance.py [--tickers 50] [--years 20] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+import synthetic  # lägger ROOT och src på sys.path
+from etl import load
+from app.services import db, performance, versions
+
+
+def build_db(path: Path, n_tickers: int, years: int, seed: int = 1) -> date:
+    days, tickers, px = synthetic.price_panel(n_tickers, years, seed)
+    load(synthetic.price_frame(days, tickers, px), db_path=path)
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for j, t in enumerate(tickers):
+        for k in rng.choice(len(days) - 1, size=20, replace=False):
+            rows.append(("bench", t, days[k].date().isoformat(), "BUY", 10.0, float(px[k, j]), 0.0))
+    rows.sort(key=lambda r: r[2])
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    synthetic.insert_trades(conn, rows)
+    conn.close()
+    return days[-1].date()
+
+
+def _time(fn, repeat: int) -> dict:
+    runs = [synthetic.timed(fn)[0] for _ in range(repeat)]
+    return {"min_ms": min(runs), "median_ms": float(np.median(runs))}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=50)
+    ap.add_argument("--years", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        anchor = build_db(path, args.tickers, args.years)
+        conn = sqlite3.connect(path)
+
+        def cold():
+            versions.clear_cache()
+            performance.nav_series(conn, "bench", "Allt", anchor)
+
+        result = {
+            "tickers": args.tickers,
+            "years": args.years,
+            "nav_series_cold": _time(cold, args.repeat),
+            "nav_series_cached": _time(lambda: performance.nav_series(conn, "bench", "Allt", anchor), args.repeat),
+        }
+        conn.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
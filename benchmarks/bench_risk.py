@@ -0,0 +1,59 @@
+# benchmarks/bench_risk.py
+"""
+Mäter riskmodellen (risk.get_model + mått) på syntetisk data: 400 tickers
+× 5 år dagskurser plus ^OMXSPI. Kalla = första bygget, varm = oförändrad
+prices-version, inkrementell = en ny handelsdag har lagts till.
+
+    python benchmarks/bench_risk.py [--tickers 400] [--years 5]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import synthetic  # lägger ROOT och src på sys.path
+from etl import load
+from app.services import risk
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=400)
+    ap.add_argument("--years", type=int, default=5)
+    args = ap.parse_args()
+
+    days, tickers, px = synthetic.price_panel(args.tickers + 1, args.years, seed=2, extra_days=1)
+    tickers = tickers[:-1] + [risk.BENCHMARK]
+    start = date(days[0].year, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        load(synthetic.price_frame(days[:-1], tickers, px[:-1]), db_path=path)
+        conn = sqlite3.connect(path)
+        names = tickers[:-1]
+
+        def report():
+            model = risk.get_model(conn, names, start)
+            return model.ticker_metrics(20), model.correlation(names[:40]), model.portfolio({t: 1.0 for t in names[:20]})
+
+        cold, _ = synthetic.timed(report)
+        warm, _ = synthetic.timed(report)
+        load(synthetic.price_frame(days[-1:], tickers, px[-1:]), db_path=path)
+        incremental, _ = synthetic.timed(report)
+        conn.close()
+
+    print(json.dumps({
+        "tickers": args.tickers,
+        "days": len(days),
+        "cold_ms": cold,
+        "warm_ms": warm,
+        "incremental_ms": incremental,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
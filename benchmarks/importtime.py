@@ -0,0 +1,133 @@
+# benchmarks/importtime.py
+"""
+Importtid vid kallstart per sida, mätt med `python -X importtime`.
+
+För varje sida (app/streamlit_app.py och app/pages/*.py) körs sidans
+modulnivå-importer i en ny interpretator; rapporten ger total tid, de
+tyngsta modulerna (egen tid) och om någon modul i LAZY laddats – de ska
+bara importeras vid första användning (yfinance vid nätverkshämtning,
+altair när en graf ritas).
+
+    python benchmarks/importtime.py --budget-ms 3000
+
+Avslutas med kod 1 om en sida tar längre än budgeten eller laddar en LAZY-
+modul. suite.py tar med samma mätning (import.<sida>) så att --compare
+även fångar relativa regressioner.
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PAGES = [ROOT / "app" / "streamlit_app.py", *sorted((ROOT / "app" / "pages").glob("[0-9]*.py"))]
+LAZY = ("yfinance", "altair")
+DEFAULT_BUDGET_MS = 3000.0
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def page_imports(path: Path) -> list[str]:
+    """Sidans import-satser på modulnivå (som källtext), utan __future__."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    out = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module == "__future__":
+            continue
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            out.append(ast.unparse(node))
+    return out
+
+
+def parse(stderr: str) -> list[dict]:
+    """Rader från -X importtime: [{module, self_us, cumulative_us, depth}] i importordning."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(4),
+                "self_us": int(m.group(1)),
+                "cumulative_us": int(m.group(2)),
+                "depth": (len(m.group(3)) - 1) // 2,
+            })
+    return rows
+
+
+def run_once(statements: list[str]) -> list[dict]:
+    paths = [str(ROOT), str(ROOT / "src"), os.environ.get("PYTHONPATH", "")]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in paths if p)}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(statements)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return parse(proc.stderr)
+
+
+def measure(path: Path, repeat: int = 3, top: int = 10) -> dict:
+    """Bästa av repeat kallstarter för sidans importer."""
+    statements = page_imports(path)
+    best = None
+    totals = []
+    for _ in range(repeat):
+        rows = run_once(statements)
+        total = sum(r["cumulative_us"] for r in rows if r["depth"] == 0) / 1000
+        totals.append(total)
+        if best is None or total <= min(totals):
+            best = rows
+    loaded = {r["module"] for r in best}
+    return {
+        "page": path.name,
+        "min_ms": min(totals),
+        "median_ms": sorted(totals)[len(totals) // 2],
+        "runs": repeat,
+        "modules": len(best),
+        "lazy_violations": sorted(m for m in LAZY if m in loaded),
+        "top_self_ms": [
+            {"module": r["module"], "self_ms": r["self_us"] / 1000}
+            for r in sorted(best, key=lambda r: r["self_us"], reverse=True)[:top]
+        ],
+    }
+
+
+def run(repeat: int = 3, top: int = 10) -> dict[str, dict]:
+    return {f"import.{p.stem}": measure(p, repeat, top) for p in PAGES}
+
+
+def failures(report: dict[str, dict], budget_ms: float) -> list[str]:
+    out = []
+    for name, r in report.items():
+        if r["min_ms"] > budget_ms:
+            out.append(f"{name}: {r['min_ms']:.0f} ms > budget {budget_ms:.0f} ms")
+        if r["lazy_violations"]:
+            out.append(f"{name}: laddar {', '.join(r['lazy_violations'])} vid import")
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Importtid vid kallstart per sida")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    report = run(args.repeat, args.top)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    print(text)
+    problems = failures(report, args.budget_ms)
+    for p in problems:
+        print(p, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# benchmarks/loadtest.py
+"""
+Lasttest av tjänstelagret med samtidiga sessioner, utan webbläsare.
+
+Varje simulerad session kör samma anropssekvens som sidorna gör (se PAGES)
+mot en syntetisk databas (synthetic.py) och lägger in trades mellan
+sidvisningarna. Sessionerna körs som trådar i flera processer; inom en
+process delar trådarna EN anslutning, precis som st.cache_resource-
+anslutningen i appen (--conn per-session ger en egen per tråd i stället).
+Trades skrivs som i Trades-sidan via writer.get_writer (--writes direct
+använder trades.record_trade på sessionens anslutning). Med --etl-interval
+läser en tråd i huvudprocessen in en ny handelsdag med etl.load med jämna
+mellanrum medan sessionerna kör, som vid stängning.
+
+    python benchmarks/loadtest.py --processes 2 --threads 25 --iterations 20
+
+Rapporten (JSON) har latens-percentiler per steg, genomströmning och
+andelen "database is locked"-fel.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src", Path(__file__).resolve().parent):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import etl
+import synthetic
+from app.services import alerts, db, performance, portfolio, trades, versions, watchlist, writer
+
+PERIODS = ["1 vecka", "3 månader", "YTD", "1 år", "Allt"]
+
+
+# ---------- Sidornas anropssekvenser ----------
+
+def _dashboard(conn: sqlite3.Connection, s: dict) -> None:
+    versions.get(conn, versions.PRICES, versions.trades_domain(s["user"]))
+    portfolio.overview(conn, s["user"])
+    portfolio.cash_balance(conn, s["user"])
+    alerts.recent(conn, s["user"])
+    performance.nav_series(conn, s["user"], s["rng"].choice(PERIODS), s["anchor"])
+
+
+def _trades_page(conn: sqlite3.Connection, s: dict) -> None:
+    trades.traded_tickers(conn, s["user"])
+    trades.count_trades(conn, s["user"])
+    trades.list_trades_page(conn, s["user"], limit=50)
+
+
+def _watchlist_page(conn: sqlite3.Connection, s: dict) -> None:
+    watchlist.view(conn, s["user"])
+
+
+PAGES: dict[str, tuple[Callable, float]] = {   # namn -> (sekvens, sannolikhet)
+    "dashboard": (_dashboard, 0.6),
+    "trades": (_trades_page, 0.25),
+    "watchlist": (_watchlist_page, 0.15),
+}
+
+
+def _write(conn: sqlite3.Connection, s: dict) -> None:
+    ticker = s["rng"].choice(s["tickers"])
+    args = (s["user"], ticker, "BUY", 1.0, 100.0, s["anchor"].isoformat(), 1.0)
+    if s["writes"] == "writer":
+        writer.get_writer(s["db_path"]).record(*args)
+    else:
+        trades.record_trade(conn, *args)
+
+
+# ---------- Arbetsprocess ----------
+
+def _error_kind(e: Exception) -> str:
+    msg = str(e).lower()
+    if "locked" in msg or "busy" in msg:
+        return "locked"
+    return type(e).__name__
+
+
+def _session(conn_for: Callable[[], sqlite3.Connection], s: dict, iterations: int, write_every: int,
+             out: list, think: float) -> None:
+    conn = conn_for()
+    names, weights = zip(*[(n, w) for n, (_, w) in PAGES.items()])
+    for i in range(iterations):
+        steps = [(page := s["rng"].choices(names, weights)[0], PAGES[page][0])]
+        if write_every and (i + 1) % write_every == 0:
+            steps.append(("write", _write))
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            err = None
+            try:
+                fn(conn, s)
+            except Exception as e:   # räknas, avbryter inte sessionen
+                err = _error_kind(e)
+            out.append((name, (time.perf_counter() - t0) * 1000, err))
+        if think:
+            time.sleep(s["rng"].uniform(0, think))
+
+
+def run_process(proc: int, db_path: str, users: list[str], tickers: list[str], anchor: date, threads: int,
+                iterations: int, write_every: int, conn_mode: str, writes: str, think: float, seed: int) -> list:
+    """En process med threads sessioner; returnerar [(steg, ms, fel)]."""
+    db.DB_PATH = Path(db_path)
+    shared = db.get_conn()
+    conn_for = (lambda: shared) if conn_mode == "shared" else db.get_conn
+    results: list = []
+    workers = []
+    for t in range(threads):
+        n = proc * threads + t
+        s = {"user": users[n % len(users)], "tickers": tickers, "anchor": anchor, "db_path": db_path,
+             "writes": writes, "rng": random.Random(seed * 100_003 + n)}
+        workers.append(threading.Thread(target=_session, args=(conn_for, s, iterations, write_every, results, think)))
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return results
+
+
+def _etl_loop(db_path: str, tickers: list[str], start: date, interval: float, stop: threading.Event,
+              loads: list) -> None:
+    """Lägger in en ny handelsdag per interval sekunder tills stop sätts."""
+    rng = np.random.default_rng(0)
+    day = pd.Timestamp(start)
+    while not stop.is_set():
+        day += pd.offsets.BDay()
+        px = 100 * (1 + rng.normal(0, 0.01, (1, len(tickers))))
+        t0 = time.perf_counter()
+        etl.load(synthetic.price_frame(pd.DatetimeIndex([day]), tickers, px), db_path=db_path)
+        loads.append((time.perf_counter() - t0) * 1000)
+        stop.wait(interval)
+
+
+# ---------- Rapport ----------
+
+def summarize(samples: list, wall: float) -> dict:
+    by_step: dict[str, list] = defaultdict(list)
+    for name, ms, err in samples:
+        by_step[name].append((ms, err))
+    steps = {}
+    for name, rows in sorted(by_step.items()):
+        ms = np.array([r[0] for r in rows])
+        errs = [r[1] for r in rows if r[1]]
+        steps[name] = {
+            "count": len(rows),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+            "locked_rate": errs.count("locked") / len(rows),
+            "errors": {k: errs.count(k) for k in sorted(set(errs))},
+        }
+    total = len(samples)
+    locked = sum(1 for s in samples if s[2] == "locked")
+    return {
+        "wall_s": wall,
+        "operations": total,
+        "throughput_ops_s": total / wall if wall > 0 else float("nan"),
+        "locked_rate": locked / total if total else 0.0,
+        "error_rate": sum(1 for s in samples if s[2]) / total if total else 0.0,
+        "steps": steps,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Lasttest med samtidiga sessioner")
+    ap.add_argument("--processes", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=25, help="sessioner per process")
+    ap.add_argument("--iterations", type=int, default=20, help="sidvisningar per session")
+    ap.add_argument("--write-every", type=int, default=3, help="en trade var n:e sidvisning (0 = inga)")
+    ap.add_argument("--conn", choices=["shared", "per-session"], default="shared")
+    ap.add_argument("--writes", choices=["writer", "direct"], default="writer")
+    ap.add_argument("--think", type=float, default=0.0, help="max slumpad paus mellan sidvisningar (s)")
+    ap.add_argument("--etl-interval", type=float, default=0.0, help="s mellan inlästa handelsdagar (0 = av)")
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--trades", type=int, default=20_000)
+    ap.add_argument("--tickers", type=int, default=100)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        info = synthetic.generate(Path(tmp) / "load.db", args.users, args.trades, args.tickers, args.years,
+                                  universe_extra=0, seed=args.seed)
+        conn = sqlite3.connect(info["db_path"])
+        conn.execute("PRAGMA journal_mode = WAL;")     # som db.get_conn
+        conn.close()
+        db_path = str(info["db_path"])
+
+        stop, etl_ms = threading.Event(), []
+        loader = threading.Thread(target=_etl_loop, args=(db_path, info["tickers"], info["anchor"],
+                                                          args.etl_interval, stop, etl_ms))
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(args.processes, mp_context=ctx) as pool:
+            t0 = time.perf_counter()
+            if args.etl_interval:
+                loader.start()
+            jobs = [
+                pool.submit(run_process, p, db_path, info["users"], info["tickers"], info["anchor"], args.threads,
+                            args.iterations, args.write_every, args.conn, args.writes, args.think, args.seed)
+                for p in range(args.processes)
+            ]
+            try:
+                samples = [s for j in jobs for s in j.result()]
+            finally:
+                stop.set()
+                if loader.is_alive():
+                    loader.join()
+            wall = time.perf_counter() - t0
+
+    report = {
+        "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "sessions": args.processes * args.threads,
+        "etl_loads": len(etl_ms),
+        "etl_max_ms": max(etl_ms, default=None),
+        **summarize(samples, wall),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# benchmarks/suite.py
+"""
+Benchmarksvit för de heta vägarna, på deterministisk syntetisk data
+(synthetic.py): N användare, M trades, K tickers, Y års kurser i en
+temporär data.db.
+
+Mäter etl.load, portfolio.overview / running_avg_costs /
+realized_pnl_avgcost, innehav per månadsskifte (overview_asof, även som
+per_date_ms), trades.list_trades, universe.search_by_name och
+Dashboard-kedjan (performance.nav_series, TWR). Allt mäts kallt – process-
+cacharna töms före varje körning – så att siffrorna visar beräkningen och
+inte cacheträffar. Dessutom importtiden vid kallstart per sida
+(import.<sida>, se importtime.py). Resultatet skrivs som JSON.
+
+    python benchmarks/suite.py --out bench.json
+    python benchmarks/suite.py --compare bench.json [--tolerance 0.25]
+
+Varje mätning är repeat stickprov om minst MIN_SAMPLE_MS vardera (korta
+anrop upprepas). Med --compare jämförs bästa stickprovet mot en tidigare
+körning; en mätning som är mer än tolerance långsammare (och minst
+--min-delta ms) flaggas som regression och skriptet avslutas med kod 1,
+liksom om en sida överskrider --import-budget eller laddar yfinance/altair
+vid import.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src", Path(__file__).resolve().parent):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import etl
+import importtime
+import synthetic
+from app.services import performance, portfolio, trades, universe, versions
+
+MIN_SAMPLE_MS = 200.0
+QUERIES = ["nordic", "invest 1", "bank", "T00", "stål", "x0001", "svenska data", "zz"]
+
+
+def clear_caches() -> None:
+    versions.clear_cache()
+    portfolio.clear_snapshot_cache()
+
+
+def timeit(fn: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None,
+           min_sample_ms: float = MIN_SAMPLE_MS) -> dict:
+    """
+    ms per anrop: repeat stickprov, vart och ett med så många anrop att det
+    tar minst min_sample_ms (korta mätningar blir annars mest brus). setup
+    körs före varje anrop men räknas inte.
+    """
+    def sample(number: int) -> float:
+        total = 0.0
+        for _ in range(number):
+            if setup is not None:
+                setup()
+            t0 = time.perf_counter()
+            fn()
+            total += time.perf_counter() - t0
+        return total * 1000 / number
+
+    first = sample(1)
+    number = max(1, min(1000, math.ceil(min_sample_ms / max(first, 1e-3))))
+    runs = [sample(number) for _ in range(repeat)]
+    return {"min_ms": min(runs), "median_ms": statistics.median(runs), "runs": len(runs), "number": number}
+
+
+def run(users: int, n_trades: int, n_tickers: int, years: int, repeat: int, seed: int = 0,
+        imports: bool = True) -> dict:
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+
+        # etl.load: hela historiken mot en tom DB per körning
+        days, names, px = synthetic.price_panel(n_tickers, years, seed)
+        frame = synthetic.price_frame(days, names, px)
+        fresh = (tmp / f"load{i}.db" for i in itertools.count())
+        results["etl.load"] = timeit(lambda: etl.load(frame, db_path=next(fresh)), repeat, min_sample_ms=0)
+
+        info = synthetic.generate(tmp / "bench.db", users, n_trades, n_tickers, years, seed=seed)
+        conn = sqlite3.connect(info["db_path"])
+        user, anchor = info["heaviest_user"], info["anchor"]
+        month_ends = [d.date() for d in pd.date_range(days[0], anchor, freq="ME")]
+
+        cases = {
+            "portfolio.overview": lambda: portfolio.overview(conn, user),
+            "portfolio.running_avg_costs": lambda: portfolio.running_avg_costs(conn, user),
+            "portfolio.realized_pnl_avgcost": lambda: portfolio.realized_pnl_avgcost(conn, user),
+            "trades.list_trades": lambda: trades.list_trades(conn, user),
+            "performance.nav_series": lambda: performance.nav_series(conn, user, "Allt", anchor),
+            "performance.nav_series_1y": lambda: performance.nav_series(conn, user, "1 år", anchor),
+            # innehav per månadsskifte över hela historiken (as-of-snapshots byggs under loopen)
+            "portfolio.overview_asof_months": lambda: [portfolio.overview_asof(conn, user, d) for d in month_ends],
+        }
+        for name, fn in cases.items():
+            results[name] = timeit(fn, repeat, setup=clear_caches)
+        results["portfolio.overview_asof_months"]["per_date_ms"] = (
+            results["portfolio.overview_asof_months"]["min_ms"] / len(month_ends))
+
+        df = universe.load_universe(info["universe_csv"])
+        results["universe.search_by_name"] = timeit(
+            lambda: [universe.search_by_name(df, q, limit=50) for q in QUERIES], repeat
+        )
+        conn.close()
+
+    if imports:
+        results.update(importtime.run(repeat))
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "params": {"users": users, "trades": n_trades, "tickers": n_tickers, "years": years,
+                       "repeat": repeat, "seed": seed},
+            "rows": {"prices": info["price_rows"], "trades": info["trade_rows"]},
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.25, min_delta_ms: float = 1.0) -> list[dict]:
+    """
+    En rad per mätning som finns i båda; regression om bästa stickprovet
+    (min_ms, det stabilaste måttet) är mer än tolerance sämre än baslinjens.
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        ratio = cur["min_ms"] / base["min_ms"] if base["min_ms"] > 0 else float("inf")
+        rows.append({
+            "name": name,
+            "baseline_ms": base["min_ms"],
+            "current_ms": cur["min_ms"],
+            "ratio": ratio,
+            "regression": ratio > 1.0 + tolerance and cur["min_ms"] - base["min_ms"] >= min_delta_ms,
+        })
+    return rows
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmarksvit på syntetisk data")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--trades", type=int, default=20_000)
+    ap.add_argument("--tickers", type=int, default=100)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, help="skriv resultatet som JSON hit")
+    ap.add_argument("--compare", type=Path, help="tidigare JSON att jämföra mot")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--min-delta", type=float, default=1.0, help="ms; mindre skillnader räknas som brus")
+    ap.add_argument("--import-budget", type=float, default=importtime.DEFAULT_BUDGET_MS,
+                    help="ms; högsta tillåtna importtid vid kallstart per sida")
+    ap.add_argument("--skip-imports", action="store_true", help="mät inte importtiden")
+    args = ap.parse_args()
+
+    result = run(args.users, args.trades, args.tickers, args.years, args.repeat, args.seed,
+                 imports=not args.skip_imports)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    print(text)
+
+    failed = False
+    imports = {k: v for k, v in result["results"].items() if k.startswith("import.")}
+    for problem in importtime.failures(imports, args.import_budget):
+        print(f"IMPORT {problem}", file=sys.stderr)
+        failed = True
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("meta", {}).get("params") != result["meta"]["params"]:
+            print("Varning: baslinjen kördes med andra parametrar", file=sys.stderr)
+        rows = compare(result, baseline, args.tolerance, args.min_delta)
+        for r in rows:
+            flag = "REGRESSION" if r["regression"] else "ok"
+            print(f"{r['name']:<34} {r['baseline_ms']:>10.2f} -> {r['current_ms']:>10.2f} ms  "
+                  f"x{r['ratio']:.2f}  {flag}", file=sys.stderr)
+        failed = failed or any(r["regression"] for r in rows)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
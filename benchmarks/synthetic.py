@@ -0,0 +1,150 @@
+# benchmarks/synthetic.py
+"""
+Deterministisk syntetisk data för benchmarks: K tickers med Y års
+dagskurser, N användare med totalt M trades och ett universum (CSV) med
+namn för sökningen. Samma parametrar och seed ger exakt samma data.
+
+    from synthetic import generate
+    info = generate(Path("bench.db"), users=20, trades=20_000, tickers=100, years=5)
+
+Trades dras per användare över en delmängd av tickers, mest köp; en sälj
+tar aldrig mer än innehavet, så validate/replay beter sig som med riktig
+data. Priset är dagens stängning och courtaget 0,1 % (minst 1 kr).
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import etl
+from app.services import db, versions
+
+END = "2024-12-31"
+WORDS = ["Nordic", "Svenska", "Industri", "Invest", "Bygg", "Data", "Energi", "Medical", "Skog",
+         "Fastighet", "Handel", "Telekom", "Bank", "Gruv", "Logistik", "Bio", "Stål", "Media"]
+SEGMENTS = ["Large Cap", "Mid Cap", "Small Cap"]
+
+
+def ticker_names(k: int) -> list[str]:
+    return [f"T{i:04d}.ST" for i in range(k)]
+
+
+def price_panel(k: int, years: int, seed: int = 0, extra_days: int = 0,
+                end: str = END) -> tuple[pd.DatetimeIndex, list[str], np.ndarray]:
+    """
+    (handelsdagar, tickers, kurser dag × ticker), geometrisk slumpvandring.
+    extra_days lägger till dagar utöver years * 261 (t.ex. en "ny" dag att
+    läsa in efter historiken).
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=end, periods=years * 261 + extra_days)
+    px = 100 * np.cumprod(1 + rng.normal(0.0003, 0.015, (len(days), k)), axis=0)
+    return days, ticker_names(k), px
+
+
+def price_frame(days: pd.DatetimeIndex, names: list[str], px: np.ndarray) -> pd.DataFrame:
+    """Lång frame (ts, ticker, close) som etl.load tar emot."""
+    return pd.DataFrame({
+        "ts": np.repeat(days.strftime("%Y-%m-%d").to_numpy(), len(names)),
+        "ticker": np.tile(names, len(days)),
+        "close": px.ravel(),
+    })
+
+
+def timed(fn: Callable[[], object]) -> tuple[float, object]:
+    """(ms, resultat) för ett enda anrop – för kall/varm-mätningar där upprepning vore fel."""
+    t0 = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - t0) * 1000, out
+
+
+def trade_rows(days: pd.DatetimeIndex, names: list[str], px: np.ndarray,
+               users: int, n_trades: int, seed: int = 0) -> list[tuple]:
+    """[(user, ticker, ts, side, qty, price, fee)] sorterat på ts."""
+    rng = np.random.default_rng(seed + 1)
+    per_user = np.full(users, n_trades // users)
+    per_user[: n_trades % users] += 1
+    rows = []
+    for u, n in enumerate(per_user):
+        user = f"user{u:03d}"
+        universe = rng.choice(len(names), size=min(len(names), 30), replace=False)
+        cols = rng.choice(universe, size=n)
+        dix = np.sort(rng.integers(0, len(days), size=n))
+        held: dict[int, float] = {}
+        for j, d in zip(cols, dix):
+            q = held.get(j, 0.0)
+            sell = q > 0 and rng.random() < 0.3
+            qty = float(max(1, int(q * rng.uniform(0.2, 1.0)))) if sell else float(rng.integers(1, 50))
+            held[j] = q - qty if sell else q + qty
+            price = float(round(px[d, j], 4))
+            rows.append((user, names[j], days[d].date().isoformat(), "SELL" if sell else "BUY",
+                         qty, price, max(1.0, round(0.001 * qty * price, 2))))
+    rows.sort(key=lambda r: r[2])
+    return rows
+
+
+def universe_csv(path: Path, k: int, extra: int = 0, seed: int = 0) -> Path:
+    """Universum med ticker_names() plus extra påhittade bolag (name_display;yf_symbol;segment)."""
+    rng = np.random.default_rng(seed + 2)
+    n = k + extra
+    w = rng.integers(0, len(WORDS), size=(n, 2))
+    names = [f"{WORDS[a]} {WORDS[b]} {i}" for i, (a, b) in enumerate(w)]
+    syms = ticker_names(k) + [f"X{i:05d}.ST" for i in range(extra)]
+    pd.DataFrame({
+        "name_display": names,
+        "yf_symbol": syms,
+        "segment": [SEGMENTS[i % len(SEGMENTS)] for i in range(n)],
+    }).to_csv(path, sep=";", index=False)
+    return path
+
+
+def insert_trades(conn: sqlite3.Connection, rows: list[tuple]) -> None:
+    """Trades i en transaktion, med versionsbump per användare (som trades.py)."""
+    with conn:
+        conn.executemany(
+            "INSERT INTO trades(user, ticker, ts, side, qty, price, fee) VALUES (?,?,?,?,?,?,?)", rows
+        )
+        versions.bump(conn, *sorted({versions.trades_domain(r[0]) for r in rows}))
+
+
+def generate(path: Path, users: int = 20, trades: int = 20_000, tickers: int = 100, years: int = 5,
+             universe_extra: int = 2_000, seed: int = 0) -> dict:
+    """Skriver prices, trades och universum; returnerar metadata för benchmarksviten."""
+    days, names, px = price_panel(tickers, years, seed)
+    etl.load(price_frame(days, names, px), db_path=path)
+    conn = sqlite3.connect(path)
+    try:
+        db.ensure_schema(conn)
+        rows = trade_rows(days, names, px, users, trades, seed)
+        insert_trades(conn, rows)
+    finally:
+        conn.close()
+    counts = pd.Series([r[0] for r in rows]).value_counts()
+    return {
+        "db_path": path,
+        "universe_csv": universe_csv(path.with_name("universe.csv"), tickers, universe_extra, seed),
+        "anchor": days[-1].date(),
+        "tickers": names,
+        "users": sorted(counts.index),
+        "heaviest_user": str(counts.idxmax()),
+        "price_rows": len(days) * len(names),
+        "trade_rows": len(rows),
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        info = generate(Path(tmp) / "bench.db")
+        print({k: v for k, v in info.items() if k not in ("tickers", "users")})
@@ -1,8 +1,9 @@
 import logging
 import sqlite3
+import sys
+from contextlib import nullcontext
 from pathlib import Path
 import pandas as pd
-import yfinance as yf
 
 # Paths
 ROOT = Path(__file__).resolve().parents[1]
@@ -11,20 +12,29 @@ LOG_PATH = ROOT / "logs" / "etl.log"
 DB_PATH.parent.mkdir(exist_ok=True)
 LOG_PATH.parent.mkdir(exist_ok=True)
 
-# Logger
+# app/ bredvid: kurslarm och telemetry (loggning via kö, tidsspann)
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+try:
+    from app.services import telemetry
+except ImportError:  # ETL utan appen bredvid: vanliga hanterare, inga spann
+    telemetry = None
+
+def _traced(name):
+    return telemetry.traced(name) if telemetry else (lambda fn: fn)
+
+# Logger – hanterarna sätts upp i main() (telemetry.setup: JSON till LOG_PATH via en kö)
 log = logging.getLogger("etl")
 log.setLevel(logging.INFO)
-if not log.handlers:
-    fmt = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
-    fh = logging.FileHandler(LOG_PATH, encoding="utf-8"); fh.setFormatter(fmt)
-    sh = logging.StreamHandler();                         sh.setFormatter(fmt)
-    log.addHandler(fh); log.addHandler(sh)
 
 # Extract + transform
-def extract(tickers=("AAPL","INVE-B.ST"), period="5d", interval="1d") -> pd.DataFrame: # Fetching info for Apple and Investor AB.
-    log.info(f"Hämtar data: {tickers}, period={period}, interval={interval}")
-    df = yf.download(tickers, period=period, interval=interval,
-                     progress=False, auto_adjust=False)
+@_traced("etl.extract")
+def extract(tickers=("AAPL","INVE-B.ST"), period="5d", interval="1d", start=None) -> pd.DataFrame: # Fetching info for Apple and Investor AB.
+    """start (YYYY-MM-DD) hämtar historik från det datumet i stället för period."""
+    import yfinance as yf  # tung import, behövs bara när något faktiskt hämtas
+    log.info("Hämtar data", extra={"tickers": list(tickers), "period": period, "interval": interval, "start": start})
+    window = {"start": start} if start else {"period": period}
+    df = yf.download(tickers, interval=interval, progress=False, auto_adjust=False, **window)
     if df.empty:
         return pd.DataFrame(columns=["ts","ticker","close"])
 
@@ -42,36 +52,207 @@ def extract(tickers=("AAPL","INVE-B.ST"), period="5d", interval="1d") -> pd.Data
     tidy["ts"] = pd.to_datetime(tidy["ts"]).dt.tz_localize(None).astype(str)
     return tidy.dropna(subset=["close"])[["ts","ticker","close"]]
 
+# Valuta per värdepapper (Yahoos metadata) och växelkurser mot SEK
+BASE_CURRENCY = "SEK"
+
+@_traced("etl.extract_currencies")
+def extract_currencies(tickers) -> pd.DataFrame:
+    """ticker, currency enligt Yahoo. Tickers som inte går att slå upp hoppas över."""
+    import yfinance as yf
+    rows = []
+    for t in tickers:
+        try:
+            ccy = yf.Ticker(t).fast_info.get("currency")
+        except Exception:
+            log.warning("Ingen valuta", extra={"ticker": t})
+            continue
+        if ccy:
+            rows.append({"ticker": t, "currency": str(ccy).upper()})
+    return pd.DataFrame(rows, columns=["ticker","currency"])
+
+@_traced("etl.extract_fx")
+def extract_fx(currencies, period="5d", interval="1d", start=None) -> pd.DataFrame:
+    """ts, ccy, rate (SEK per enhet) från Yahoos par <CCY>SEK=X."""
+    ccys = sorted({c for c in currencies if c and c != BASE_CURRENCY})
+    if not ccys:
+        return pd.DataFrame(columns=["ts","ccy","rate"])
+    log.info("Hämtar växelkurser", extra={"currencies": ccys, "period": period, "start": start})
+    pairs = {f"{c}{BASE_CURRENCY}=X": c for c in ccys}
+    df = extract(tickers=tuple(pairs), period=period, interval=interval, start=start)
+    return (df.assign(ccy=df["ticker"].map(pairs))
+              .rename(columns={"close":"rate"})[["ts","ccy","rate"]])
+
 # Load 
+def _ensure_tables(cur: sqlite3.Cursor) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS prices(
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          ticker TEXT NOT NULL,
+          ts TEXT NOT NULL,
+          close REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_prices ON prices(ticker, ts)")
+    # Versionsräknare för appens cachar (se app/services/versions.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions(
+          domain TEXT PRIMARY KEY,
+          version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS securities(
+          ticker TEXT PRIMARY KEY,
+          currency TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fx_rates(
+          ccy TEXT NOT NULL,
+          ts TEXT NOT NULL,
+          rate REAL NOT NULL,       -- SEK per enhet
+          PRIMARY KEY(ccy, ts)
+        )
+    """)
+
+def _bump(cur: sqlite3.Cursor, *domains: str) -> None:
+    # bumpas i samma transaktion som insättningen ("prices", "fx", se versions.py)
+    cur.executemany("""
+        INSERT INTO data_versions(domain, version) VALUES (?, 1)
+        ON CONFLICT(domain) DO UPDATE SET version = version + 1
+    """, [(d,) for d in domains])
+
+def _evaluate_alerts(conn: sqlite3.Connection) -> None:
+    """Kurslarmen (app/services/alerts.py) mot de nya raderna, om appen ligger bredvid."""
+    try:
+        from app.services import alerts
+    except ImportError:
+        return
+    try:
+        fired = alerts.evaluate(conn)
+        if fired:
+            log.info("Kurslarm", extra={"fired": fired})
+    except Exception:
+        # ett fel i larmen ska inte fälla inläsningen
+        log.exception("Utvärdering av kurslarm misslyckades")
+
+@_traced("etl.load")
 def load(df: pd.DataFrame, db_path: Path | str = DB_PATH) -> int:
     if df.empty:
         return 0
     with sqlite3.connect(db_path) as conn:
         cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS prices(
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              ticker TEXT NOT NULL,
-              ts TEXT NOT NULL,
-              close REAL NOT NULL
-            )
-        """)
-        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_prices ON prices(ticker, ts)")
+        _ensure_tables(cur)
         cur.executemany(
             "INSERT OR IGNORE INTO prices(ticker, ts, close) VALUES (?,?,?)",
             list(df[["ticker","ts","close"]].itertuples(index=False, name=None))
         )
+        inserted = cur.rowcount
+        if inserted > 0:
+            _bump(cur, "prices")
+        conn.commit()
+        if inserted > 0:
+            _evaluate_alerts(conn)
+        return inserted
+
+@_traced("etl.load_securities")
+def load_securities(df: pd.DataFrame, db_path: Path | str = DB_PATH) -> int:
+    """
+    Valuta per ticker (ersätter tidigare värde). Bumpar fx-versionen (valuta-
+    cachen, as-of-snapshots) och prices-versionen (allt som värderas i SEK).
+    """
+    if df.empty:
+        return 0
+    with sqlite3.connect(db_path) as conn:
+        cur = conn.cursor()
+        _ensure_tables(cur)
+        cur.executemany(
+            """INSERT INTO securities(ticker, currency) VALUES (?,?)
+               ON CONFLICT(ticker) DO UPDATE SET currency = excluded.currency
+               WHERE currency <> excluded.currency""",
+            list(df[["ticker","currency"]].itertuples(index=False, name=None))
+        )
+        changed = cur.rowcount
+        if changed > 0:
+            _bump(cur, "prices", "fx")
         conn.commit()
-        return cur.rowcount
+        return changed
+
+@_traced("etl.load_fx")
+def load_fx(df: pd.DataFrame, db_path: Path | str = DB_PATH) -> int:
+    """Växelkurser (SEK per enhet); bumpar fx-versionen och, som prisdata, prices-versionen."""
+    if df.empty:
+        return 0
+    with sqlite3.connect(db_path) as conn:
+        cur = conn.cursor()
+        _ensure_tables(cur)
+        cur.executemany(
+            "INSERT OR IGNORE INTO fx_rates(ccy, ts, rate) VALUES (?,?,?)",
+            list(df[["ccy","ts","rate"]].itertuples(index=False, name=None))
+        )
+        inserted = cur.rowcount
+        if inserted > 0:
+            _bump(cur, "prices", "fx")
+        conn.commit()
+        return inserted
+
+def missing_securities(tickers, db_path: Path | str = DB_PATH) -> list[str]:
+    """Tickers utan rad i securities – bara de behöver slås upp hos Yahoo."""
+    with sqlite3.connect(db_path) as conn:
+        _ensure_tables(conn.cursor())
+        known = {r[0] for r in conn.execute("SELECT ticker FROM securities")}
+    return [t for t in tickers if t not in known]
+
+def fx_currencies(db_path: Path | str = DB_PATH) -> list[str]:
+    """Valutor (utom SEK) bland värdepappren i DB – de som behöver växelkurser."""
+    with sqlite3.connect(db_path) as conn:
+        _ensure_tables(conn.cursor())
+        rows = conn.execute("SELECT DISTINCT currency FROM securities WHERE currency <> ?", (BASE_CURRENCY,))
+        return [r[0] for r in rows]
+
+def fx_backfill_starts(db_path: Path | str = DB_PATH) -> dict[str, str]:
+    """
+    {valuta: startdatum} för valutor vars växelkurshistorik börjar efter den
+    första kursen eller traden i ett värdepapper i den valutan (ny valuta,
+    eller första körningen). Annars fylls äldre datum med första kända kurs.
+    """
+    with sqlite3.connect(db_path) as conn:
+        _ensure_tables(conn.cursor())
+        has_trades = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='trades'").fetchone()
+        trades_sql = "UNION ALL SELECT ticker, MIN(ts) FROM trades GROUP BY ticker" if has_trades else ""
+        rows = conn.execute(f"""
+            SELECT s.currency, MIN(SUBSTR(f.first_ts, 1, 10)), (SELECT MIN(ts) FROM fx_rates WHERE ccy = s.currency)
+            FROM securities s
+            JOIN (SELECT ticker, MIN(ts) AS first_ts FROM prices GROUP BY ticker {trades_sql}) f ON f.ticker = s.ticker
+            WHERE s.currency <> ?
+            GROUP BY s.currency
+        """, (BASE_CURRENCY,)).fetchall()
+    return {ccy: need for ccy, need, have in rows if need and (have is None or have > need)}
 
 def main():
+    if telemetry:
+        telemetry.setup(LOG_PATH)
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s",
+                            handlers=[logging.FileHandler(LOG_PATH, encoding="utf-8"), logging.StreamHandler()])
     try:
-        df = extract()
-        tried = load(df)
-        log.info(f"Inserted {len(df)} rows (duplicates ignored). Tried inserts: {tried}")
+        with telemetry.span("etl.run") if telemetry else nullcontext():
+            df = extract()
+            inserted = load(df)
+            log.info("Kurser inlästa", extra={"rows": len(df), "inserted": inserted})
+            load_securities(extract_currencies(missing_securities(df["ticker"].unique().tolist())))
+            backfill = fx_backfill_starts()
+            for ccy, start in backfill.items():
+                log.info("Fyller på växelkurshistorik", extra={"currency": ccy, "start": start})
+                load_fx(extract_fx([ccy], start=start))
+            fx = extract_fx([c for c in fx_currencies() if c not in backfill])
+            log.info("Växelkurser inlästa", extra={"inserted": load_fx(fx)})
     except Exception:
         # loggar stacktrace till både fil och konsol
         log.exception("Körningen misslyckades i ETL-flödet")
+    finally:
+        if telemetry:
+            telemetry.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
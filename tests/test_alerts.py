@@ -0,0 +1,123 @@
+import sys, sqlite3
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import alerts, db, trades, versions
+
+
+def _bars(ticker, days, closes):
+    return pd.DataFrame({"ts": [d.date().isoformat() for d in days], "ticker": ticker, "close": closes})
+
+
+def _conn(tmp_path):
+    path = tmp_path / "test.db"
+    days = pd.bdate_range("2024-01-01", periods=30)
+    load(pd.concat([_bars("AAA", days, np.full(30, 100.0)), _bars("BBB", days, np.linspace(50, 60, 30))]),
+         db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    versions.clear_cache()
+    return conn, path
+
+
+def _after(days_from, closes, ticker="AAA"):
+    return _bars(ticker, pd.bdate_range(days_from, periods=len(closes)), closes)
+
+
+def test_history_does_not_fire_and_new_bars_do(tmp_path):
+    conn, path = _conn(tmp_path)
+    above = alerts.add_rule(conn, "u", "AAA", "above", 105.0)
+    high = alerts.add_rule(conn, "u", "BBB", "new_high")
+    alerts.add_rule(conn, "u", "AAA", "below", 90.0)
+    # markören sattes vid första regeln: historiken läses inte om
+    assert conn.execute("SELECT price_id FROM alert_cursor").fetchone()[0] == \
+        conn.execute("SELECT MAX(id) FROM prices").fetchone()[0]
+    assert alerts.evaluate(conn) == 0
+
+    load(_after("2024-02-12", [104.0, 106.0, 107.0, 104.0, 108.0]), db_path=path)
+    fired = alerts.recent(conn, "u")
+    # korsningar uppåt: 104 -> 106 och 104 -> 108, inte 106 -> 107
+    assert fired["ts"].tolist() == ["2024-02-16", "2024-02-13"]
+    assert set(fired["kind"]) == {"above"}
+    assert "över 105.00" in fired["message"].iloc[0]
+
+    # BBB: ny högsta först när historikens max (60) passeras
+    load(_after("2024-02-12", [59.0, 61.0, 60.5, 62.0], ticker="BBB"), db_path=path)
+    bbb = alerts.recent(conn, "u").query("ticker == 'BBB'")
+    assert bbb["ts"].tolist() == ["2024-02-15", "2024-02-13"]
+
+    # samma rader igen och bakåtfyllnad av gammal historik utlöser inget
+    load(_after("2024-02-12", [104.0, 106.0]), db_path=path)
+    load(_after("2023-06-01", [200.0, 80.0]), db_path=path)
+    assert len(alerts.recent(conn, "u")) == 4
+    rules = alerts.list_rules(conn, "u").set_index("id")
+    assert rules.loc[above, "last_ts"] == "2024-02-16"
+    assert rules.loc[high, "last_close"] == 62.0
+
+
+def test_move_and_drawdown_from_cost(tmp_path):
+    conn, path = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 100.0, "2024-01-02", fee=0.0)
+    alerts.add_rule(conn, "u", "AAA", "move_pct", 5.0)
+    alerts.add_rule(conn, "u", "AAA", "drawdown", 10.0)
+    alerts.add_rule(conn, "v", "AAA", "drawdown", 10.0)   # v äger inga AAA
+    alerts.evaluate(conn)
+
+    load(_after("2024-02-12", [97.0, 91.0, 89.0, 95.0, 88.0]), db_path=path)
+    fired = alerts.recent(conn, "u").sort_values(["ts", "kind"])
+    got = list(zip(fired["ts"], fired["kind"]))
+    assert got == [
+        ("2024-02-13", "move_pct"),      # 97 -> 91: -6,2 %
+        ("2024-02-14", "drawdown"),      # under 90 (GAV 100 - 10 %)
+        ("2024-02-15", "move_pct"),      # 89 -> 95: +6,7 %
+        ("2024-02-16", "drawdown"),      # ny korsning nedåt
+        ("2024-02-16", "move_pct"),
+    ]
+    assert alerts.recent(conn, "v").empty
+    assert alerts.mark_seen(conn, "u") == 5
+    assert alerts.recent(conn, "u")["seen"].eq(1).all()
+
+
+def test_matches_rowwise_reference(tmp_path):
+    conn, path = _conn(tmp_path)
+    rng = np.random.default_rng(3)
+    rules = []
+    for t in ("AAA", "BBB"):
+        for kind, thr in (("above", 101.0 if t == "AAA" else 58.0), ("below", 99.0 if t == "AAA" else 57.0),
+                          ("move_pct", 1.0), ("new_high", None), ("new_low", None)):
+            rules.append((alerts.add_rule(conn, "u", t, kind, thr), t, kind, thr))
+    alerts.evaluate(conn)
+
+    seq = {}
+    for t, start in (("AAA", 100.0), ("BBB", 60.0)):
+        seq[t] = start * np.cumprod(1 + rng.normal(0, 0.015, 40))
+    # lästs in i tre omgångar av olika storlek
+    for lo, hi in ((0, 1), (1, 15), (15, 40)):
+        load(pd.concat([_after("2024-02-12", seq[t], t).iloc[lo:hi] for t in seq]), db_path=path)
+
+    got = set(zip(*alerts.recent(conn, "u", limit=1000)[["ticker", "kind", "ts"]].to_numpy().T))
+    days = [d.date().isoformat() for d in pd.bdate_range("2024-02-12", periods=40)]
+    hist = {"AAA": np.full(30, 100.0), "BBB": np.linspace(50, 60, 30)}
+    ref = set()
+    for _id, t, kind, thr in rules:
+        prev, hi, lo = hist[t][-1], hist[t].max(), hist[t].min()
+        for d, c in zip(days, seq[t]):
+            if ((kind == "above" and prev <= thr < c) or (kind == "below" and c < thr <= prev)
+                    or (kind == "move_pct" and abs(c / prev - 1) * 100 >= thr)
+                    or (kind == "new_high" and c > hi) or (kind == "new_low" and c < lo)):
+                ref.add((t, kind, d))
+            prev, hi, lo = c, max(hi, c), min(lo, c)
+    assert got == ref
+
+
+def test_load_without_alert_tables(tmp_path):
+    # ETL mot en DB där appen aldrig körts: inga larmtabeller, inget fel
+    assert load(_after("2024-01-01", [1.0, 2.0]), db_path=tmp_path / "bare.db") == 2
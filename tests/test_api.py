@@ -0,0 +1,126 @@
+import sys, json, sqlite3, threading
+from datetime import date
+import urllib.error
+import urllib.request
+from pathlib import Path
+import pandas as pd
+import pytest
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app import api
+from app.services import db, trades, versions
+
+
+@pytest.fixture
+def server(tmp_path):
+    days = pd.bdate_range("2024-01-01", "2024-03-29")
+    rows = [{"ts": d.date().isoformat(), "ticker": t, "close": 100.0 + i}
+            for i, d in enumerate(days) for t in ("AAA", "BBB")]
+    path = tmp_path / "test.db"
+    load(pd.DataFrame(rows), db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    versions.clear_cache()
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 100.0, "2024-01-02", fee=1.0)
+
+    srv = api.make_server("127.0.0.1", 0, path)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    srv.base = f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.conn = conn
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    conn.close()
+
+
+def _get(srv, path, etag=None):
+    req = urllib.request.Request(srv.base + path, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as r:
+            body = r.read()
+            return r.status, r.headers.get("ETag"), json.loads(body) if body else None
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        return e.code, e.headers.get("ETag"), json.loads(body) if body else None
+
+
+def test_conditional_get_and_invalidation(server):
+    status, etag, body = _get(server, "/users/u/overview")
+    assert status == 200 and etag
+    assert body["positions"][0]["ticker"] == "AAA"
+    assert body["positions"][0]["qty"] == 10
+
+    # oförändrad data: 304 utan kropp, svaret byggs inte
+    misses = server.cache.misses
+    assert _get(server, "/users/u/overview", etag)[:2] == (304, etag)
+    assert server.cache.misses == misses and server.not_modified == 1
+
+    # ny trade för u: ny ETag; annan användare påverkas inte
+    _, other, _ = _get(server, "/users/v/cash")
+    trades.record_trade(server.conn, "u", "BBB", "BUY", 5, 100.0, "2024-02-01")
+    status, etag2, body = _get(server, "/users/u/overview", etag)
+    assert status == 200 and etag2 != etag
+    assert [p["ticker"] for p in body["positions"]] == ["AAA", "BBB"]
+    assert _get(server, "/users/v/cash", other)[0] == 304
+
+    # nya kurser ändrar överblicken men inte trades-historiken
+    _, t_etag, _ = _get(server, "/users/u/trades")
+    load(pd.DataFrame([{"ts": "2024-04-01", "ticker": "AAA", "close": 200.0}]), db_path=server.db_path)
+    assert _get(server, "/users/u/overview", etag2)[0] == 200
+    assert _get(server, "/users/u/trades", t_etag)[0] == 304
+
+
+def test_endpoints(server):
+    _, _, cash = _get(server, "/users/u/cash")
+    assert cash["cash"] == pytest.approx(api.portfolio.START_CASH - 1001.0)
+    assert _get(server, "/users/u/realized")[2]["realized_pnl"] == 0.0
+
+    _, _, nav = _get(server, "/users/u/nav?period=Allt&anchor=2024-03-29")
+    ref, base, method = api.performance.nav_series(server.conn, "u", "Allt", date(2024, 3, 29))
+    assert nav["method"] == method == "twr" and nav["base_value"] == base
+    assert [p["value"] for p in nav["series"]] == ref.tolist()
+    assert nav["series"][-1]["date"] == "2024-03-29"
+
+    for i in range(3):
+        trades.record_trade(server.conn, "u", "BBB", "BUY", 1, 100.0, f"2024-02-0{i + 1}")
+    _, _, page = _get(server, "/users/u/trades?limit=2")
+    assert [t["ts"] for t in page["trades"]] == ["2024-02-03", "2024-02-02"]
+    nxt = page["next"]
+    _, _, rest = _get(server, f"/users/u/trades?limit=2&cursor_ts={nxt['cursor_ts']}&cursor_id={nxt['cursor_id']}")
+    assert [t["ts"] for t in rest["trades"]] == ["2024-02-01", "2024-01-02"] and rest["next"] is None
+    # limit <= 0 kläms till 1 i stället för att ge en tom sida eller fel
+    _, _, one = _get(server, "/users/u/trades?limit=-5")
+    assert [t["ts"] for t in one["trades"]] == ["2024-02-03"] and one["next"] is not None
+
+    # as-of: innehav och kassa som de såg ut vid dagens slut
+    _, _, before = _get(server, "/users/u/overview?asof=2024-01-31")
+    assert before["asof"] == "2024-01-31" and [p["ticker"] for p in before["positions"]] == ["AAA"]
+    ref = api.portfolio.overview_asof(server.conn, "u", "2024-01-31")
+    assert before["positions"][0]["market_value"] == pytest.approx(ref["market_value"].iloc[0])
+    _, _, after = _get(server, "/users/u/overview?asof=2024-02-03")
+    assert [p["ticker"] for p in after["positions"]] == ["AAA", "BBB"]
+    assert _get(server, "/users/u/cash?asof=2024-01-01")[2]["cash"] == pytest.approx(api.portfolio.START_CASH)
+    assert _get(server, "/users/u/realized?asof=2024-02-03")[2]["realized_pnl"] == 0.0
+
+    _, q_etag, quotes = _get(server, "/quotes?tickers=aaa,CCC")
+    assert quotes["quotes"][0]["source"] == "db" and quotes["quotes"][1]["price"] is None
+    server.conn.execute("INSERT INTO quotes(ticker, price, ts, fetched_at) VALUES ('AAA', 123.0, '2024-04-02', 1.0)")
+    server.conn.commit()
+    status, _, quotes = _get(server, "/quotes?tickers=aaa,CCC", q_etag)
+    assert status == 200 and quotes["quotes"][0] == {
+        "ticker": "AAA", "price": 123.0, "ts": "2024-04-02", "fetched_at": 1.0, "source": "quote"}
+
+
+def test_errors(server):
+    assert _get(server, "/users/u/nope")[0] == 404
+    assert _get(server, "/users/u/nav?period=10%20%C3%A5r")[0] == 400
+    assert _get(server, "/users/u/overview?asof=31%2F01")[0] == 400
+    assert _get(server, "/quotes")[0] == 400
+    assert _get(server, "/health")[2] == {"status": "ok"}
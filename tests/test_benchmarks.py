@@ -0,0 +1,80 @@
+import sys, sqlite3
+from pathlib import Path
+import pandas as pd
+
+# gör app, src och benchmarks importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src", ROOT / "benchmarks"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import suite
+import synthetic
+from app.services import trades
+
+
+def test_generator_is_deterministic_and_valid(tmp_path):
+    a = synthetic.generate(tmp_path / "a.db", users=3, trades=300, tickers=10, years=1, universe_extra=20)
+    b = synthetic.generate(tmp_path / "b.db", users=3, trades=300, tickers=10, years=1, universe_extra=20)
+    assert a["trade_rows"] == 300 and a["price_rows"] == 261 * 10
+    assert a["heaviest_user"] == b["heaviest_user"]
+
+    rows = {}
+    for info in (a, b):
+        conn = sqlite3.connect(info["db_path"])
+        rows[info["db_path"]] = conn.execute("SELECT user, ticker, ts, side, qty, price FROM trades ORDER BY id").fetchall()
+        # ingen sälj överstiger innehavet
+        for user in info["users"]:
+            df = trades.list_trades(conn, user)
+            signed = df["qty"].where(df["side"] == "BUY", -df["qty"])
+            assert (signed.groupby(df["ticker"]).cumsum() >= 0).all()
+        conn.close()
+    assert rows[a["db_path"]] == rows[b["db_path"]]
+    assert len(pd.read_csv(a["universe_csv"], sep=";")) == 30
+
+
+def test_compare_flags_only_real_slowdowns():
+    base = {"results": {"x": {"min_ms": 10.0}, "y": {"min_ms": 0.2}, "z": {"min_ms": 5.0}}}
+    cur = {"results": {"x": {"min_ms": 14.0}, "y": {"min_ms": 0.5}, "z": {"min_ms": 5.5}, "new": {"min_ms": 1.0}}}
+    rows = {r["name"]: r for r in suite.compare(cur, base, tolerance=0.25, min_delta_ms=1.0)}
+    assert set(rows) == {"x", "y", "z"}
+    assert rows["x"]["regression"]            # 40 % och 4 ms långsammare
+    assert not rows["y"]["regression"]        # stor kvot men under brusgränsen
+    assert not rows["z"]["regression"]        # inom toleransen
+
+
+def test_loadtest_sessions_in_process(tmp_path):
+    import loadtest
+    info = synthetic.generate(tmp_path / "load.db", users=3, trades=300, tickers=5, years=1, universe_extra=0)
+    samples = loadtest.run_process(0, str(info["db_path"]), info["users"], info["tickers"], info["anchor"],
+                                   threads=3, iterations=4, write_every=2, conn_mode="shared",
+                                   writes="direct", think=0.0, seed=0)
+    report = loadtest.summarize(samples, wall=1.0)
+    assert report["operations"] == 3 * (4 + 2) and report["error_rate"] == 0.0
+    assert report["steps"]["write"]["count"] == 6
+    assert {"p50_ms", "p95_ms", "p99_ms", "locked_rate"} <= set(report["steps"]["write"])
+
+    conn = sqlite3.connect(info["db_path"])
+    assert conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 300 + 6
+    conn.close()
+
+
+def test_importtime_report_and_lazy_modules():
+    import importtime
+    sample = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       100 |        100 |   _io\n"
+        "import time:      2000 |       2500 | app.services.db\n"
+        "import time:        50 |        800 |     sqlite3\n"
+    )
+    rows = importtime.parse(sample)
+    assert [(r["module"], r["depth"]) for r in rows] == [("_io", 1), ("app.services.db", 0), ("sqlite3", 2)]
+
+    assert "import streamlit as st" in importtime.page_imports(ROOT / "app" / "pages" / "1_Dashboard.py")
+    rows = importtime.run_once(["import etl", "from app.services import price_fetcher, watchlist, quotes"])
+    loaded = {r["module"] for r in rows}
+    assert "app.services.price_fetcher" in loaded and not loaded & set(importtime.LAZY)
+
+    report = {"import.x": {"min_ms": 900.0, "lazy_violations": ["altair"]}, "import.y": {"min_ms": 10.0, "lazy_violations": []}}
+    assert len(importtime.failures(report, budget_ms=500.0)) == 2
+    assert importtime.failures(report, budget_ms=5000.0) == ["import.x: laddar altair vid import"]
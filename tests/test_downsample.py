@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from app.services import downsample
+
+
+def test_lttb_keeps_endpoints_and_extrema():
+    rng = np.random.default_rng(3)
+    idx = pd.bdate_range("2004-01-01", periods=5000)
+    port = 100 * np.cumprod(1 + rng.normal(0, 0.01, len(idx)))
+    port[1234] = port.max() * 1.5   # spik som måste synas
+    omx = 100 * np.cumprod(1 + rng.normal(0, 0.01, len(idx)))
+    omx[:10] = np.nan
+    df = pd.DataFrame({"Portfölj": port, "^OMXSPI": omx, "Portfölj_SEK": port * 10}, index=idx)
+
+    out = downsample.downsample_frame(df, ["Portfölj", "^OMXSPI"], 900)
+    assert len(out) <= 900 + 4
+    assert out.index[0] == idx[0] and out.index[-1] == idx[-1]
+    assert out.index.is_monotonic_increasing
+    for c in ("Portfölj", "^OMXSPI"):
+        assert out[c].max() == df[c].max() and out[c].min() == df[c].min()
+    assert (out["Portfölj_SEK"] == out["Portfölj"] * 10).all()   # hela rader följer med
+
+    short = df.iloc[:500]
+    assert downsample.downsample_frame(short, ["Portfölj"], 900) is short
+
+
+def test_lttb_exact_on_line_with_one_peak():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[40] = 5.0
+    sel = downsample.lttb(x, y, 10)
+    assert len(sel) == 10 and sel[0] == 0 and sel[-1] == 99
+    assert 40 in sel
+    assert (np.diff(sel) > 0).all()
@@ -8,7 +8,7 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
-from etl import extract, load
+from etl import extract, load, load_securities, missing_securities
 
 def test_extract_shape():
     df = extract(tickers=("AAPL",), period="5d", interval="1d")
@@ -22,4 +22,9 @@ def test_load_inserts_into_temp_db(tmp_path):
     with sqlite3.connect(db) as conn:
         cur = conn.cursor()
         cur.execute("SELECT ticker, close FROM prices WHERE ticker='TEST'")
-        assert cur.fetchone() == ("TEST", 123.45)
\ No newline at end of file
+        assert cur.fetchone() == ("TEST", 123.45)
+def test_missing_securities_skips_known_tickers(tmp_path):
+    db = tmp_path / "test.db"
+    assert missing_securities(["AAPL", "VOLV-B.ST"], db_path=db) == ["AAPL", "VOLV-B.ST"]
+    load_securities(pd.DataFrame({"ticker": ["AAPL"], "currency": ["USD"]}), db_path=db)
+    assert missing_securities(["AAPL", "VOLV-B.ST"], db_path=db) == ["VOLV-B.ST"]
@@ -0,0 +1,136 @@
+import sys, sqlite3
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load, load_fx, load_securities
+from app.config import START_CASH
+from app.services import db, fx, performance, portfolio, trades, versions
+
+
+def _conn(tmp_path):
+    days = pd.bdate_range("2024-01-01", "2024-03-29")
+    rows = [{"ts": d.date().isoformat(), "ticker": t, "close": px}
+            for d in days for t, px in (("AAPL", 100.0), ("AAA.ST", 50.0))]
+    # AAPL stiger 10 % sista dagen
+    rows[-2]["close"] = 110.0
+    path = tmp_path / "test.db"
+    load(pd.DataFrame(rows), db_path=path)
+    load_securities(pd.DataFrame({"ticker": ["AAPL"], "currency": ["USD"]}), db_path=path)
+    # USD/SEK 10 hela januari, 11 från februari (bara vissa dagar noterade)
+    load_fx(pd.DataFrame({"ccy": ["USD", "USD"], "ts": ["2024-01-01", "2024-02-01"], "rate": [10.0, 11.0]}),
+            db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    versions.clear_cache()
+    return conn
+
+
+def test_currencies_from_securities_and_suffix(tmp_path):
+    conn = _conn(tmp_path)
+    assert fx.currencies(conn, ["AAPL", "AAA.ST", "NOKIA.HE", "OKÄND"]) == ["USD", "SEK", "EUR", "SEK"]
+    assert fx.missing(conn, ["AAPL", "NOKIA.HE"]) == ["EUR"]
+
+
+def test_rates_asof_and_panel_matches_rowwise(tmp_path):
+    conn = _conn(tmp_path)
+    r = fx.rates_at(conn, ["AAPL", "AAPL", "AAPL", "AAA.ST"],
+                    ["2023-12-29", "2024-01-31T15:00:00", "2024-02-05", "2024-02-05"])
+    # före första kursen gäller den första
+    assert r.tolist() == [10.0, 10.0, 11.0, 1.0]
+
+    dates = pd.bdate_range("2024-01-25", "2024-02-08").to_numpy(dtype="datetime64[ns]")
+    prices = np.arange(len(dates) * 2, dtype=float).reshape(-1, 2) + 1.0
+    got = fx.to_base(conn, prices, ["AAPL", "AAA.ST"], dates)
+    ref = np.array([[p[0] * (11.0 if d >= np.datetime64("2024-02-01") else 10.0), p[1]]
+                    for d, p in zip(dates, prices)])
+    np.testing.assert_allclose(got, ref)
+
+
+def test_overview_and_cash_in_sek(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAPL", "BUY", 10, 100.0, "2024-01-15", fee=1.0)
+    trades.record_trade(conn, "u", "AAA.ST", "BUY", 20, 50.0, "2024-01-15")
+
+    # köpt för 10 000 SEK + 10 SEK courtage (USD 10)
+    assert abs(portfolio.cash_balance(conn, "u") - (START_CASH - 10_010.0 - 1000.0)) < 1e-9
+    ov = portfolio.overview(conn, "u").set_index("ticker")
+    assert ov.loc["AAPL", "currency"] == "USD"
+    assert ov.loc["AAPL", "fx_rate"] == 11.0
+    assert abs(ov.loc["AAPL", "avg_buy_price"] - 1001.0) < 1e-9
+    assert abs(ov.loc["AAPL", "market_value"] - 10 * 110.0 * 11.0) < 1e-9
+    assert abs(ov.loc["AAA.ST", "market_value"] - 1000.0) < 1e-9
+
+
+def test_twr_includes_currency_move(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAPL", "BUY", 10, 100.0, "2024-01-02")
+    series, base, method = performance.nav_series(conn, "u", "Allt", date(2024, 3, 29))
+    assert method == "twr"
+    assert abs(base - 10 * 100.0 * 10.0) < 1e-9
+    # +10 % i SEK när kronan försvagas och +10 % i USD sista dagen
+    assert abs(series.iloc[-1] - 100.0 * 1.1 * 1.1) < 1e-9
+
+
+def test_rate_panel_cache_keys_on_whole_axis(tmp_path):
+    conn = _conn(tmp_path)
+    # samma första/sista dag och längd, men olika helgdagar däremellan
+    a = np.array(["2024-01-29", "2024-01-31", "2024-02-02"], dtype="datetime64[ns]")
+    b = np.array(["2024-01-29", "2024-02-01", "2024-02-02"], dtype="datetime64[ns]")
+    assert fx.rate_panel(conn, ["USD"], a)[:, 0].tolist() == [10.0, 10.0, 11.0]
+    assert fx.rate_panel(conn, ["USD"], b)[:, 0].tolist() == [10.0, 11.0, 11.0]
+
+
+def test_new_rates_bump_prices_version(tmp_path):
+    conn = _conn(tmp_path)
+    before = versions.get(conn, versions.PRICES, versions.FX)
+    assert load_fx(pd.DataFrame({"ccy": ["USD"], "ts": ["2024-03-01"], "rate": [12.0]}),
+                   db_path=tmp_path / "test.db") == 1
+    assert versions.get(conn, versions.PRICES, versions.FX) == (before[0] + 1, before[1] + 1)
+    # vanliga kursrader rör inte fx-versionen
+    load(pd.DataFrame([{"ts": "2024-04-01", "ticker": "AAA.ST", "close": 51.0}]), db_path=tmp_path / "test.db")
+    assert versions.get(conn, versions.FX) == (before[1] + 1,)
+    assert fx.latest_rates(conn, ["AAPL", "AAA.ST"]).tolist() == [12.0, 1.0]
+
+
+def test_asof_snapshots_follow_currency_metadata(tmp_path):
+    days = pd.bdate_range("2024-01-01", "2024-03-29")
+    path = tmp_path / "test.db"
+    load(pd.DataFrame([{"ts": d.date().isoformat(), "ticker": "AAPL", "close": 100.0} for d in days]), db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    versions.clear_cache()
+    portfolio.clear_snapshot_cache()
+    trades.record_trade(conn, "u", "AAPL", "BUY", 10, 100.0, "2024-01-15")
+    assert portfolio.overview_asof(conn, "u", "2024-03-29")["avg_buy_price"].iloc[0] == 100.0
+
+    # valuta och växelkurs kommer efter att snapshoten byggts
+    load_securities(pd.DataFrame({"ticker": ["AAPL"], "currency": ["USD"]}), db_path=path)
+    load_fx(pd.DataFrame({"ccy": ["USD"], "ts": ["2024-01-01"], "rate": [10.0]}), db_path=path)
+    ov = portfolio.overview_asof(conn, "u", "2024-03-29")
+    assert ov["avg_buy_price"].iloc[0] == 1000.0
+
+    # en ny kursrad ändrar inte snapshot-nyckeln
+    base = portfolio._snapshot_base(conn, "u")
+    load(pd.DataFrame([{"ts": "2024-04-01", "ticker": "AAPL", "close": 101.0}]), db_path=path)
+    assert portfolio._snapshot_base(conn, "u") == base
+
+
+def test_fx_backfill_starts_at_first_price_or_trade(tmp_path):
+    from etl import fx_backfill_starts
+    conn = _conn(tmp_path)   # AAPL (USD) från 2024-01-01, USD-kurser från 2024-01-01
+    path = db.database_path(conn)
+    assert fx_backfill_starts(path) == {}
+
+    # en äldre trade och en ny valuta utan kurser
+    trades.record_trade(conn, "u", "AAPL", "BUY", 1, 100.0, "2023-06-01T10:00:00")
+    load(pd.DataFrame([{"ts": "2024-02-01", "ticker": "NOKIA.HE", "close": 4.0}]), db_path=path)
+    load_securities(pd.DataFrame({"ticker": ["NOKIA.HE"], "currency": ["EUR"]}), db_path=path)
+    assert fx_backfill_starts(path) == {"USD": "2023-06-01", "EUR": "2024-02-01"}
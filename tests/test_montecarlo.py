@@ -0,0 +1,62 @@
+import sys, time
+from pathlib import Path
+import numpy as np
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from app.services import montecarlo as mc
+
+
+def _history(seed=3):
+    rng = np.random.default_rng(seed)
+    r = rng.normal(0.0004, 0.01, (500, 3))
+    r[:20, 2] = np.nan            # noterad senare -> raderna tas bort
+    return mc.prepare(r, [1000.0, 2000.0, 500.0])
+
+
+def test_same_seed_same_result_regardless_of_workers():
+    lr, v = _history()
+    assert lr.shape == (480, 3)
+    steps = list(mc.run(lr, v, horizon=5, n_paths=50_000, block=10_000, workers=1, seed=7))
+    assert [s["done"] for s in steps] == [10_000, 20_000, 30_000, 40_000, 50_000]
+    assert [s["final"] for s in steps] == [False] * 4 + [True]
+    par = mc.simulate(lr, v, horizon=5, n_paths=50_000, block=10_000, workers=2, seed=7)
+    assert par["var"] == steps[-1]["var"] and par["es"] == steps[-1]["es"]
+    assert par["paths_per_sec"] > 0
+    other = mc.simulate(lr, v, horizon=5, n_paths=50_000, block=10_000, workers=1, seed=8)
+    assert other["var"] != par["var"]
+
+
+def test_normal_mode_matches_analytic_var():
+    # en tillgång, log-avkastning ~ N(mu, s): förlusten har känd kvantil
+    rng = np.random.default_rng(0)
+    lr = rng.normal(0.0, 0.02, (2000, 1))
+    mu, s = lr.mean(), lr.std(ddof=1)
+    h = 10
+    res = mc.simulate(lr, np.array([100.0]), horizon=h, n_paths=200_000, mode="normal", workers=1)
+    z99 = 2.3263478740408408
+    expected = 100.0 * (1 - np.exp(h * mu - z99 * s * np.sqrt(h)))
+    assert abs(res["var"][0.99] - expected) / expected < 0.02
+    assert res["es"][0.99] > res["var"][0.99] > res["var"][0.95] > 0
+
+
+def test_kept_reports_dropped_columns():
+    r = np.full((5, 3), 0.01)
+    r[:, 1] = np.nan                      # ingen historik alls
+    assert mc.kept(r, [100.0, 100.0, 0.0]).tolist() == [True, False, False]
+    lr, v = mc.prepare(r, [100.0, 100.0, 0.0])
+    assert lr.shape == (5, 1) and v.tolist() == [100.0]
+
+
+def test_closing_run_early_cancels_queued_blocks():
+    lr, v = _history()
+    t0 = time.perf_counter()
+    gen = mc.run(lr, v, horizon=63, n_paths=8_000_000, block=20_000, workers=2, seed=1)
+    first = next(gen)
+    gen.close()                           # som när sidan körs om mitt i simuleringen
+    assert not first["final"]
+    assert time.perf_counter() - t0 < 5   # utan avbrott: alla 400 block körs klart
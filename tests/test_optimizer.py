@@ -0,0 +1,105 @@
+import sys, sqlite3
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import covariance, optimizer, risk
+
+
+def _ledoit_wolf(X):
+    """Referens: Ledoit-Wolf mot skalad identitet direkt på avkastningarna."""
+    T, p = X.shape
+    Xc = X - X.mean(axis=0)
+    S = Xc.T @ Xc / T
+    mu = np.trace(S) / p
+    d2 = ((S - mu * np.eye(p)) ** 2).sum()
+    b2 = sum(((np.outer(x, x) - S) ** 2).sum() for x in Xc) / T**2
+    k = min(b2, d2) / d2
+    return k * mu * np.eye(p) + (1 - k) * S, k
+
+
+def test_store_rolls_window_incrementally(tmp_path):
+    path = tmp_path / "test.db"
+    rng = np.random.default_rng(11)
+    days = pd.bdate_range("2024-01-02", periods=220)
+    tickers = ["AAA", "BBB", "CCC", "DDD"]
+    px = 100 * np.cumprod(1 + rng.normal(0, 0.01, (len(days), 4)) + rng.normal(0, 0.01, (len(days), 1)), axis=0)
+    df = pd.DataFrame({
+        "ts": np.repeat(days.strftime("%Y-%m-%d"), 4), "ticker": np.tile(tickers, len(days)), "close": px.ravel(),
+    })
+    load(df[df["ts"] < "2024-09-01"], db_path=path)
+    conn = sqlite3.connect(path)
+    risk.clear_cache(); covariance.clear_cache()
+    anchor = date(2024, 11, 1)
+
+    covariance.get_estimate(conn, tickers, 60, anchor)
+    load(df[df["ts"] >= "2024-09-01"], db_path=path)       # nya dagar -> glidande fönster
+    est = covariance.get_estimate(conn, tickers, 60, anchor)
+    assert est["days"] == 60
+
+    ret = np.diff(px, axis=0) / px[:-1]
+    ref, k = _ledoit_wolf(ret[-60:])
+    np.testing.assert_allclose(est["cov"], ref * 252, rtol=1e-9)
+    assert abs(est["shrinkage"] - k) < 1e-9 and 0 < k < 1
+    np.testing.assert_allclose(est["mean"], ret[-60:].mean(axis=0) * 252, rtol=1e-9)
+
+
+def _kkt_ok(w, grad, cap, tol=1e-6):
+    free = (w > 1e-9) & (w < cap - 1e-9)
+    lam = grad[free].mean() if free.any() else np.median(grad)
+    return (np.abs(grad[free] - lam).max(initial=0) < tol
+            and (grad[w <= 1e-9] >= lam - tol).all()
+            and (grad[w >= cap - 1e-9] <= lam + tol).all())
+
+
+def test_solvers_respect_constraints_and_optimality():
+    rng = np.random.default_rng(2)
+    X = rng.normal(0, 0.01, (500, 12)) + rng.normal(0, 0.01, (500, 1)) * rng.uniform(0.2, 1.5, 12)
+    cov = np.cov(X, rowvar=False) * 252
+    mean = rng.normal(0.08, 0.06, 12)
+
+    w = optimizer.min_variance(cov, cap=0.15)
+    assert abs(w.sum() - 1) < 1e-9 and w.min() >= 0 and w.max() <= 0.15 + 1e-12
+    assert _kkt_ok(w, cov @ w, 0.15)
+
+    # utan bindande villkor: känd sluten form
+    d = np.diag([0.04, 0.09, 0.16])
+    np.testing.assert_allclose(optimizer.min_variance(d), [36 / 61, 16 / 61, 9 / 61], atol=1e-8)
+    mu = np.array([0.05, 0.06, 0.07])
+    tangent = np.linalg.solve(d, mu) / np.linalg.solve(d, mu).sum()
+    ws = optimizer.max_sharpe(mu, d)
+    assert optimizer._sharpe(ws, mu, d) >= optimizer._sharpe(tangent, mu, d) * (1 - 1e-4)
+
+    ws = optimizer.max_sharpe(mean, cov, cap=0.25)
+    assert ws.max() <= 0.25 + 1e-12 and optimizer._sharpe(ws, mean, cov) > optimizer._sharpe(w, mean, cov)
+
+    rp = optimizer.risk_parity(cov)
+    np.testing.assert_allclose(optimizer.risk_contributions(rp, cov), np.full(12, 1 / 12), atol=1e-8)
+    rp = optimizer.risk_parity(cov, cap=0.1)
+    assert abs(rp.sum() - 1) < 1e-9 and rp.max() <= 0.1 + 1e-12
+
+    try:
+        optimizer.min_variance(cov, cap=0.05)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("för låg viktgräns ska ge ValueError")
+
+
+def test_risk_parity_skips_tickers_without_variance():
+    # tredje tickern har oförändrad kurs i fönstret: ingen varians, inget riskbidrag
+    cov = np.diag([0.04, 0.09, 0.0])
+    with np.errstate(all="raise"):
+        rp = optimizer.risk_parity(cov)
+    np.testing.assert_allclose(rp, [0.6, 0.4, 0.0], atol=1e-8)
+    # taket tvingar in den riskfria tickern för att vikterna ska summera till 1
+    rp = optimizer.risk_parity(cov, cap=0.4)
+    assert abs(rp.sum() - 1) < 1e-9 and rp.max() <= 0.4 + 1e-12 and np.isfinite(rp).all()
@@ -0,0 +1,110 @@
+import sys, sqlite3
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import db, performance, trades, versions
+
+
+def _conn(tmp_path):
+    rng = np.random.default_rng(7)
+    days = pd.bdate_range("2024-01-01", "2024-06-28")
+    rows = []
+    for t in ("AAA", "BBB", "CCC"):
+        px = 100 * np.cumprod(1 + rng.normal(0, 0.01, len(days)))
+        for i, (d, c) in enumerate(zip(days, px)):
+            if t == "CCC" and i % 7 == 3:  # luckor som ska interpoleras
+                continue
+            rows.append({"ts": d.date().isoformat(), "ticker": t, "close": float(c)})
+    path = tmp_path / "test.db"
+    load(pd.DataFrame(rows), db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    versions.clear_cache()
+    return conn
+
+
+def _reference(conn, user, period, anchor):
+    """
+    Den tidigare pandas-implementationen i Dashboard-sidan, med rättningen att
+    kumulerad qty fylls framåt per ticker innan den läggs på kursdagarna.
+    """
+    tickers = performance.portfolio.positions(conn, user)["ticker"].tolist()
+    start = performance.period_start_for(anchor, period)
+    sql = f"SELECT ts, ticker, close FROM prices WHERE ticker IN ({','.join('?' * len(tickers))}) AND ts <= ?"
+    params = tickers + [anchor.isoformat()]
+    if start is not None:
+        sql += " AND ts >= ?"
+        params.append(start.isoformat())
+    px = pd.read_sql_query(sql + " ORDER BY ts", conn, params=params)
+    px["ts"] = pd.to_datetime(px["ts"])
+    price = px.pivot(index="ts", columns="ticker", values="close").sort_index()
+    price = price.dropna(how="all", axis=1).interpolate(limit_direction="both")
+
+    tr = pd.read_sql_query("SELECT ts, ticker, side, qty FROM trades WHERE user=? AND ts <= ? ORDER BY ts, id",
+                           conn, params=[user, anchor.isoformat()])
+    tr["ts"] = pd.to_datetime(tr["ts"], format="ISO8601")
+    tr["qty_signed"] = tr["qty"].where(tr["side"] == "BUY", -tr["qty"])
+    qty = tr.pivot_table(index="ts", columns="ticker", values="qty_signed", aggfunc="sum").sort_index().cumsum().ffill()
+    qty = qty.reindex(price.index, method="ffill").fillna(0.0).reindex(columns=price.columns, fill_value=0.0)
+
+    ret = price.pct_change().replace([np.inf, -np.inf], np.nan).fillna(0.0)
+    hold = qty.shift(1) * price.shift(1)
+    tot = hold.sum(axis=1)
+    first = tot.gt(0).idxmax()
+    w = hold.loc[first:].div(tot.loc[first:], axis=0).fillna(0.0)
+    idx = ((1.0 + (w * ret.loc[first:]).sum(axis=1)).cumprod() * 100.0)
+    return idx, float(tot.loc[first])
+
+
+def test_twr_matches_pandas_reference(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 100.0, "2023-12-01")
+    trades.record_trade(conn, "u", "BBB", "BUY", 5, 100.0, "2024-02-14T11:00:00", fee=9.0)
+    trades.record_trade(conn, "u", "AAA", "SELL", 4, 101.0, "2024-03-16")  # lördag
+    trades.record_trade(conn, "u", "CCC", "BUY", 8, 99.0, "2024-04-02")
+    anchor = date(2024, 6, 28)
+
+    for period in ("3 månader", "YTD", "Allt"):
+        series, base, method = performance.nav_series(conn, "u", period, anchor)
+        ref, ref_base = _reference(conn, "u", period, anchor)
+        assert method == "twr"
+        np.testing.assert_allclose(series.to_numpy(), ref.to_numpy(), rtol=1e-12)
+        assert (series.index == ref.index).all()
+        assert abs(base - ref_base) < 1e-9
+
+
+def test_cached_until_data_changes(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 100.0, "2024-01-02")
+    anchor = date(2024, 6, 28)
+    first = performance.nav_series(conn, "u", "Allt", anchor)
+    assert performance.nav_series(conn, "u", "Allt", anchor) is first
+
+    trades.record_trade(conn, "u", "BBB", "BUY", 5, 100.0, "2024-03-01")
+    again = performance.nav_series(conn, "u", "Allt", anchor)
+    assert again is not first
+    assert again[0].iloc[-1] != first[0].iloc[-1]
+
+
+def test_static_fallback_and_cash_series(tmp_path):
+    conn = _conn(tmp_path)
+    # köp efter periodens sista dag -> ingen historik i perioden, statisk korg
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 100.0, "2024-07-01", fee=1.0)
+    series, base, method = performance.nav_series(conn, "u", "1 vecka", date(2024, 6, 28))
+    assert method == "static"
+    assert series.iloc[0] == 100.0 and len(series) == 6
+
+    tr = performance.load_trades(conn, "u", date(2024, 12, 31))
+    dates = np.array(["2024-06-28", "2024-07-01", "2024-07-02"], dtype="datetime64[ns]")
+    cash = performance.cash_series(tr, dates)
+    start = performance.START_CASH
+    assert cash.tolist() == [start, start - 1001.0, start - 1001.0]
@@ -0,0 +1,75 @@
+import sys, sqlite3
+from pathlib import Path
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.config import START_CASH
+from app.services import db, portfolio, trades
+
+def _conn(tmp_path):
+    path = tmp_path / "test.db"
+    load(pd.DataFrame([
+        {"ts":"2024-01-31","ticker":"AAA","close":10.0},
+        {"ts":"2024-02-29","ticker":"AAA","close":12.0},
+        {"ts":"2024-03-28","ticker":"AAA","close":15.0},
+    ]), db_path=path)
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    return conn
+
+def test_asof_matches_now_and_past(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 10.0, "2024-01-15", fee=5.0)
+    trades.record_trade(conn, "u", "AAA", "SELL", 4, 12.0, "2024-02-20")
+    trades.record_trade(conn, "u", "AAA", "BUY", 2, 15.0, "2024-03-10T10:30:00")
+    portfolio.clear_snapshot_cache()
+
+    now = portfolio.overview(conn, "u")
+    pd.testing.assert_frame_equal(portfolio.overview_asof(conn, "u", "2024-12-31"), now, check_dtype=False)
+    assert portfolio.cash_balance_asof(conn, "u", "2024-12-31") == portfolio.cash_balance(conn, "u")
+    assert portfolio.realized_pnl_asof(conn, "u", "2024-12-31") == portfolio.realized_pnl_avgcost(conn, "u")
+
+    feb = portfolio.overview_asof(conn, "u", "2024-02-29")
+    assert feb["qty"].tolist() == [6.0]
+    assert feb["last_close"].tolist() == [12.0]
+    assert portfolio.cash_balance_asof(conn, "u", "2024-01-31") == START_CASH - 105.0
+    assert portfolio.positions_asof(conn, "u", "2023-12-31").empty
+
+def test_asof_snapshot_invalidated_by_new_trade(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 10, 10.0, "2024-01-15")
+    assert portfolio.positions_asof(conn, "u", "2024-03-31")["qty"].tolist() == [10.0]
+    # bakdaterad trade före cachade snapshots
+    trades.record_trade(conn, "u", "AAA", "BUY", 5, 10.0, "2024-01-02")
+    assert portfolio.positions_asof(conn, "u", "2024-03-31")["qty"].tolist() == [15.0]
+
+def test_overview_all_matches_per_user(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "a", "AAA", "BUY", 10, 10.0, "2024-01-15", fee=5.0)
+    trades.record_trade(conn, "a", "AAA", "SELL", 4, 12.0, "2024-02-20")
+    trades.record_trade(conn, "b", "AAA", "BUY", 3, 11.0, "2024-01-20")
+    trades.record_trade(conn, "b", "AAA", "SELL", 3, 14.0, "2024-03-01")
+
+    out = portfolio.overview_all(conn).set_index(["user", "ticker"])
+    cash = out.xs(portfolio.CASH_TICKER, level="ticker")["qty"]
+    assert cash["a"] == portfolio.cash_balance(conn, "a")
+    assert cash["b"] == portfolio.cash_balance(conn, "b")
+
+    ov = portfolio.overview(conn, "a").set_index("ticker")
+    assert out.loc[("a", "AAA"), "qty"] == ov.loc["AAA", "qty"]
+    assert out.loc[("a", "AAA"), "avg_buy_price"] == ov.loc["AAA", "avg_buy_price"]
+    assert out.loc[("a", "AAA"), "market_value"] == ov.loc["AAA", "market_value"]
+    realized = out.groupby(level="user")["realized_pnl"].sum()
+    assert realized["a"] == portfolio.realized_pnl_avgcost(conn, "a")
+    assert realized["b"] == portfolio.realized_pnl_avgcost(conn, "b")
+    assert out.loc[("b", "AAA"), "qty"] == 0.0
+
+    only_c = portfolio.overview_all(conn, ["c"])
+    assert only_c["ticker"].tolist() == [portfolio.CASH_TICKER]
+    assert only_c["qty"].tolist() == [START_CASH]
@@ -0,0 +1,80 @@
+import sys, sqlite3, threading, time
+from datetime import date
+from pathlib import Path
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from app.services import db, price_fetcher, versions
+
+
+def test_fetch_under_budget_writes_prices(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    release = threading.Event()
+
+    def download(ticker, start, end):
+        if ticker == "SLOW":
+            release.wait(5)
+            return [("2024-05-03", 1.0)]
+        if ticker == "NONE":
+            return []
+        if ticker == "ERR":
+            raise RuntimeError("nätverksfel")
+        return [("2024-05-02", 99.0), ("2024-05-03", 100.0)]
+
+    fetcher = price_fetcher.PriceFetcher(path, budget=0.3, download=download)
+    t0 = time.perf_counter()
+    job = fetcher.request(["AAA", "SLOW", "NONE", "ERR", "AAA"], date(2024, 4, 26), date(2024, 5, 3))
+    assert time.perf_counter() - t0 < 0.1        # returnerar direkt
+    assert fetcher.request(["SLOW"], date(2024, 4, 26), date(2024, 5, 3)) is job  # pågående jobb delas
+
+    assert job.wait(2)
+    release.set()
+    assert job.timed_out == ["SLOW"]
+    assert sorted(job.failed) == ["ERR", "NONE"]
+    assert job.written == 2
+    rows = conn.execute("SELECT ticker, ts, close FROM prices ORDER BY ts").fetchall()
+    assert rows == [("AAA", "2024-05-02", 99.0), ("AAA", "2024-05-03", 100.0)]
+    assert versions.get(conn, versions.PRICES) == (1,)
+
+    # samma intervall försöks inte igen inom retry_after, ett nytt intervall gör det
+    assert fetcher.request(["NONE"], date(2024, 4, 26), date(2024, 5, 3)) is None
+    again = fetcher.request(["NONE"], date(2024, 1, 1), date(2024, 5, 3))
+    assert again is not None and again.wait(2) and again.written == 0
+
+
+def test_alert_failure_does_not_fail_the_fetch(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    db.ensure_schema(sqlite3.connect(path))
+
+    def boom(conn):
+        raise sqlite3.OperationalError("trasig larmtabell")
+
+    monkeypatch.setattr(price_fetcher.alerts, "evaluate", boom)
+    fetcher = price_fetcher.PriceFetcher(path, download=lambda t, s, e: [("2024-05-03", 100.0)])
+    job = fetcher.request(["AAA"], date(2024, 4, 26), date(2024, 5, 3))
+    assert job.wait(2)
+    assert job.written == 1 and not job.failed
+
+
+def test_expired_attempts_are_pruned(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    db.ensure_schema(sqlite3.connect(path))
+    clock = [1000.0]
+    monkeypatch.setattr(price_fetcher.time, "monotonic", lambda: clock[0])
+    fetcher = price_fetcher.PriceFetcher(path, retry_after=60.0, download=lambda t, s, e: [])
+
+    for day in range(1, 11):  # nytt startdatum vid varje körning
+        job = fetcher.request(["NONE"], date(2024, 1, day), date(2024, 5, 3))
+        assert job.wait(2)
+        clock[0] += 61.0
+    assert len(fetcher._tried_at) == 1
+
+    # ett utgånget försök ger en ny hämtning, ett färskt gör det inte
+    assert fetcher.request(["NONE"], date(2024, 1, 10), date(2024, 5, 3)).wait(2)
+    assert fetcher.request(["NONE"], date(2024, 1, 10), date(2024, 5, 3)) is None
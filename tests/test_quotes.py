@@ -0,0 +1,92 @@
+import sys, sqlite3, threading, time
+from pathlib import Path
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import db, quotes
+
+
+def _wait_for(pred, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_serves_db_then_cached_quote(tmp_path):
+    path = tmp_path / "test.db"
+    load(pd.DataFrame([{"ts": "2024-05-02", "ticker": "AAA", "close": 10.0}]), db_path=path)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    db.ensure_schema(conn)
+    calls = []
+
+    def download(ticker, start, end):
+        calls.append(ticker)
+        return [("2024-05-02", 10.0), ("2024-05-03", 11.0)]
+
+    cache = quotes.QuoteCache(path, max_age=60, download=download)
+    first = cache.get(conn, "AAA")
+    assert first == {"last_close": 10.0, "ts": "2024-05-02", "source": "db", "stale": True}
+    assert _wait_for(lambda: cache.get(conn, "AAA")["source"] == "quote")
+    assert cache.get(conn, "AAA") == {"last_close": 11.0, "ts": "2024-05-03", "source": "quote", "stale": False}
+    assert calls == ["AAA"]   # färsk kurs -> ingen ny hämtning
+
+    assert cache.get(conn, "ZZZ") is None   # varken cache eller prices
+
+
+def test_concurrent_refreshes_are_coalesced(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path, check_same_thread=False)
+    db.ensure_schema(conn)
+    release = threading.Event()
+    calls = []
+
+    def download(ticker, start, end):
+        calls.append(ticker)
+        release.wait(2)
+        return [("2024-05-03", 5.0)]
+
+    # två cacheinstanser = två processer mot samma databasfil
+    a = quotes.QuoteCache(path, max_age=0, download=download)
+    b = quotes.QuoteCache(path, max_age=0, download=download)
+    started = []
+    threads = [threading.Thread(target=lambda c=c: started.append(c.refresh("AAA"))) for c in (a, b) * 8]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert started.count(True) == 1
+
+    release.set()
+    assert _wait_for(lambda: a.get(conn, "AAA") is not None)
+    # gammal kurs serveras direkt medan en ny hämtas
+    q = b.get(conn, "AAA")
+    assert q["last_close"] == 5.0 and q["stale"] is True
+    assert _wait_for(lambda: len(calls) >= 2)
+
+
+def test_unknown_ticker_leaves_no_row(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path, check_same_thread=False)
+    db.ensure_schema(conn)
+    calls = []
+
+    def download(ticker, start, end):
+        calls.append(ticker)
+        return []
+
+    cache = quotes.QuoteCache(path, download=download)
+    assert cache.get(conn, "NOPE") is None
+    assert _wait_for(lambda: calls and not cache._pending)
+    assert conn.execute("SELECT COUNT(*) FROM quotes").fetchone()[0] == 0
+    # backoff i processen: nästa get startar ingen ny hämtning (och skriver inget)
+    assert cache.get(conn, "NOPE") is None and not cache.refresh("NOPE")
+    assert calls == ["NOPE"] and cache.refreshes == 1
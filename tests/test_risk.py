@@ -0,0 +1,86 @@
+import sys, sqlite3
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import risk
+
+
+def _prices(days, tickers, seed=5):
+    rng = np.random.default_rng(seed)
+    bench = rng.normal(0, 0.01, len(days))
+    rows = []
+    for j, t in enumerate(tickers):
+        r = 0.5 * bench + rng.normal(0, 0.01 * (j + 1), len(days))
+        px = 100 * np.cumprod(1 + r)
+        for i, d in enumerate(days):
+            if t == "NEW" and i < 40:      # noterad senare
+                continue
+            rows.append({"ts": d.date().isoformat(), "ticker": t, "close": float(px[i])})
+    for i, d in enumerate(days):
+        rows.append({"ts": d.date().isoformat(), "ticker": risk.BENCHMARK, "close": float(100 * np.prod(1 + bench[: i + 1]))})
+    return pd.DataFrame(rows)
+
+
+def test_metrics_match_pandas_and_incremental_equals_full(tmp_path):
+    path = tmp_path / "test.db"
+    days = pd.bdate_range("2023-01-02", periods=300)
+    tickers = ["AAA", "BBB", "NEW"]
+    df = _prices(days, tickers)
+    load(df[df["ts"] < days[250].date().isoformat()], db_path=path)
+    conn = sqlite3.connect(path)
+    risk.clear_cache()
+    start = date(2023, 1, 1)
+
+    model = risk.get_model(conn, tickers, start)
+    assert len(model.dates) == 250
+    load(df[df["ts"] >= days[250].date().isoformat()], db_path=path)
+    model = risk.get_model(conn, tickers, start)   # inkrementellt
+    assert model.rebuilds == 1 and len(model.dates) == 300
+
+    full = risk.RiskModel(tickers, start)
+    full.update(conn)
+    for a, b in [(model.n, full.n), (model.sxy, full.sxy), (model.mdd, full.mdd)]:
+        np.testing.assert_allclose(a, b, rtol=1e-12)
+
+    # referens: pandas på hela panelen
+    px = df.pivot(index="ts", columns="ticker", values="close")[tickers + [risk.BENCHMARK]]
+    ret = px.pct_change(fill_method=None)
+    got = model.ticker_metrics(window=20).set_index("ticker")
+    np.testing.assert_allclose(got["vol_ann"], ret[tickers].std() * np.sqrt(252), rtol=1e-9)
+    np.testing.assert_allclose(got["vol_20d"], ret[tickers].iloc[-20:].std() * np.sqrt(252), rtol=1e-9)
+    np.testing.assert_allclose(got["max_drawdown"], (px[tickers] / px[tickers].cummax() - 1).min(), rtol=1e-9)
+    b = ret[risk.BENCHMARK]
+    for t in tickers:
+        pair = ret[[t, risk.BENCHMARK]].dropna()
+        beta = pair.cov().iloc[0, 1] / pair[risk.BENCHMARK].var()
+        te = (pair[t] - pair[risk.BENCHMARK]).std() * np.sqrt(252)
+        assert abs(got.loc[t, "beta"] - beta) < 1e-9
+        assert abs(got.loc[t, "tracking_error"] - te) < 1e-9
+    np.testing.assert_allclose(model.correlation().to_numpy(), ret[tickers].corr().to_numpy(), rtol=1e-9)
+
+    port = model.portfolio({"AAA": 1.0, "BBB": 1.0})
+    pr = ret[["AAA", "BBB"]].mean(axis=1)
+    assert abs(port["vol_ann"] - pr.std() * np.sqrt(252)) < 1e-9
+
+
+def test_changed_history_triggers_rebuild(tmp_path):
+    path = tmp_path / "test.db"
+    days = pd.bdate_range("2023-01-02", periods=60)
+    df = _prices(days, ["AAA"])
+    load(df.iloc[5:], db_path=path)
+    conn = sqlite3.connect(path)
+    risk.clear_cache()
+    model = risk.get_model(conn, ["AAA"], date(2023, 1, 1))
+    load(df.iloc[:5], db_path=path)   # bakåtfyllning av äldre dagar
+    model = risk.get_model(conn, ["AAA"], date(2023, 1, 1))
+    assert model.rebuilds == 2
+    assert int(model.n[0, 0]) == 59
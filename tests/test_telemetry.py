@@ -0,0 +1,64 @@
+import sys, json, logging
+from pathlib import Path
+import pytest
+
+# gör app importbar utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services import telemetry
+
+
+@telemetry.traced()
+def _work(n):
+    with telemetry.span("inner", n=n):
+        return sum(range(n))
+
+
+def test_spans_nest_and_render():
+    with telemetry.collect() as spans:
+        with telemetry.span("root") as root:
+            _work(10)
+            _work(20)
+        with pytest.raises(ZeroDivisionError):
+            with telemetry.span("fails"):
+                1 / 0
+
+    names = [s["name"] for s in spans]
+    assert names == ["inner", "test_telemetry._work", "inner", "test_telemetry._work", "root", "fails"]
+    by_id = {s["span_id"]: s for s in spans}
+    for s in spans[:4]:
+        assert s["trace_id"] == root["trace_id"]
+    assert by_id[spans[0]["parent_id"]]["name"] == "test_telemetry._work"
+    assert spans[1]["parent_id"] == root["span_id"] and root["parent_id"] is None
+    assert spans[0]["n"] == 10 and spans[5]["error"] == "ZeroDivisionError"
+    assert spans[5]["trace_id"] != root["trace_id"]
+
+    tree = telemetry.format_tree(spans).splitlines()
+    assert [line.split()[0] for line in tree] == ["root", "test_telemetry._work", "inner",
+                                                  "test_telemetry._work", "inner", "fails"]
+    assert tree[1].startswith("  test_telemetry._work") and tree[2].startswith("    inner")
+    stacks = dict(line.rsplit(" ", 1) for line in telemetry.folded(spans))
+    assert set(stacks) == {"root", "root;test_telemetry._work", "root;test_telemetry._work;inner", "fails"}
+
+
+def test_queued_json_log(tmp_path):
+    path = tmp_path / "app.log"
+    level = logging.getLogger().level
+    telemetry.setup(path, console=False)
+    try:
+        with telemetry.span("etl.run"):
+            logging.getLogger("etl").info("Kurser inlästa", extra={"inserted": 3})
+    finally:
+        telemetry.shutdown()
+        logging.getLogger().setLevel(level)
+
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    msg, span = rows
+    assert msg["msg"] == "Kurser inlästa" and msg["inserted"] == 3 and msg["logger"] == "etl"
+    assert msg["span_id"] == span["span"]["span_id"] and msg["trace_id"] == span["span"]["trace_id"]
+    assert span["logger"] == "trace" and span["span"]["name"] == "etl.run"
+
+    traces = telemetry.read_spans(path)
+    assert list(traces) == [span["span"]["trace_id"]]
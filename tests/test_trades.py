@@ -0,0 +1,69 @@
+import sys, io, sqlite3
+from pathlib import Path
+
+# gör app importbar utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services import db, trades
+
+def _conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / "test.db")
+    db.ensure_schema(conn)
+    return conn
+
+def test_import_trades_csv_reports_rejects(tmp_path):
+    conn = _conn(tmp_path)
+    trades.record_trade(conn, "u", "AAA", "BUY", 5, 10.0, "2024-01-01")
+    csv = io.StringIO(
+        "Datum;Värdepapper;Typ av transaktion;Antal;Kurs;Courtage\n"
+        "2024-02-01;AAA;Sälj;4;11,50;1,00\n"       # ok (5 i lager)
+        "2024-02-02;AAA;Sälj;3;11,00;0\n"          # blankning (1 kvar)
+        "2024-02-03;Bolaget B;Köp;-10;1 200,00;0\n" # ok, namn -> ticker, negativt antal
+        "not-a-date;AAA;Köp;1;10;0\n"
+        "2024-02-04;AAA;Utdelning;1;10;0\n"
+        "2024-02-05;AAA;Köp;0;10;0\n"
+    )
+    n, rejects = trades.import_trades_csv(conn, "u", csv, symbols={"Bolaget B": "BBB"})
+
+    assert n == 2
+    assert rejects["row"].tolist() == [3, 5, 6, 7]
+    assert rejects["error"].tolist() == [
+        "Kan inte sälja fler än du äger",
+        "ts måste vara ISO8601 (YYYY-MM-DD)",
+        "side måste vara 'BUY' eller 'SELL'",
+        "qty måste vara > 0",
+    ]
+    hist = trades.list_trades(conn, "u")
+    assert hist["ticker"].tolist() == ["AAA", "AAA", "BBB"]
+    assert hist["price"].tolist() == [10.0, 11.5, 1200.0]
+    assert trades.current_qty(conn, "u", "AAA") == 1.0
+
+def test_number_formats():
+    import pandas as pd
+    got = trades._to_number(pd.Series(["1 234,50", "1.234,50", "1,234.50", "1234,5", "1.234.567", "0,125", "12,50",
+                                       "1,5.5,5", "x", "1,000", "1.234", "-12,345"]))
+    assert got.iloc[:7].tolist() == [1234.5, 1234.5, 1234.5, 1234.5, 1234567.0, 0.125, 12.5]
+    # tusental eller decimaler? tvetydigt -> NaN
+    assert got.iloc[7:].isna().all()
+
+def test_list_trades_page_walks_history_with_cursor(tmp_path):
+    conn = _conn(tmp_path)
+    for i in range(7):
+        trades.record_trade(conn, "u", "AAA" if i % 2 else "BBB", "BUY", 1, 10.0 + i, f"2024-01-0{i + 1}")
+    trades.record_trade(conn, "v", "AAA", "BUY", 1, 10.0, "2024-01-03")
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = trades.list_trades_page(conn, "u", limit=3, cursor=cursor)
+        seen += page["ts"].tolist()
+        if cursor is None:
+            break
+    assert seen == sorted(seen, reverse=True) and len(seen) == 7
+
+    page, cursor = trades.list_trades_page(conn, "u", ticker="AAA", start="2024-01-03", end="2024-01-06",
+                                           newest_first=False)
+    assert page["ts"].tolist() == ["2024-01-04", "2024-01-06"] and cursor is None
+    assert trades.count_trades(conn, "u", ticker="AAA") == 3
+    assert trades.count_trades(conn, "u", side="sell") == 0
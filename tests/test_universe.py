@@ -0,0 +1,105 @@
+import sys
+from pathlib import Path
+import pandas as pd
+
+# gör app importbar utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services import universe
+
+CSV = ROOT / "data" / "omx_securities.csv"
+
+def _reference_search(df, query, segments=None, limit=50):
+    # den tidigare pandas-implementationen av search_by_name
+    if not query:
+        out = df.copy()
+    else:
+        q = universe._normalize_text(query).lower()
+        out = df.loc[df["search_blob"].str.contains(q, na=False, regex=False)].copy()
+        if out.empty:
+            return out.reset_index(drop=True)
+        pos = df["name_display"].str.lower().str.find(q)
+        out = out.assign(
+            _a=df["name_display"].str.lower().str.startswith(q).astype(int),
+            _b=df["yf_symbol"].str.lower().str.startswith(q).astype(int),
+            _c=pos.where(pos >= 0, 9999),
+        ).sort_values(["_a", "_b", "_c", "name_display"], ascending=[False, False, True, True]
+        ).drop(columns=["_a", "_b", "_c"])
+    if segments:
+        out = out[out["segment"].str.lower().isin({s.lower() for s in segments})]
+    if limit is not None:
+        out = out.head(limit)
+    return out.reset_index(drop=True)
+
+def test_search_index_matches_reference_ranking():
+    df = universe.load_universe(CSV)
+    queries = ["", "a", "in", "investor", "eric", "cellulosa", "SCA", "INVE-B", "VOLV", "ab", "b ", "st", "hold"]
+    for q in queries:
+        for segments in (None, ["Large"], ["mid", "small"]):
+            for limit in (5, 50, None):
+                got = universe.search_by_name(df, q, segments=segments, limit=limit)
+                ref = _reference_search(df, q, segments=segments, limit=limit)
+                if ref.empty:  # utan exakta träffar används stavfelsreserven
+                    continue
+                pd.testing.assert_frame_equal(got, ref, obj=f"q={q!r} seg={segments} limit={limit}")
+
+def test_search_is_typo_tolerant():
+    df = universe.load_universe(CSV)
+    assert universe.search_by_name(df, "ericson", limit=3)["yf_symbol"].str.startswith("ERIC").any()
+    assert universe.search_by_name(df, "qqqqq").empty
+
+def test_load_universe_is_cached_and_snapshotted(tmp_path, monkeypatch):
+    csv = tmp_path / "u.csv"
+    csv.write_text("name_display;yf_symbol;segment\nAlfa AB;ALFA.ST;Large\n", encoding="utf-8")
+    universe.clear_cache()
+    first = universe.load_universe(csv)
+    assert universe.load_universe(csv) is first
+    assert universe.snapshot_path(csv).exists()
+
+    # kallstart: snapshoten används, CSV:n parsas inte
+    universe.clear_cache()
+    monkeypatch.setattr(universe, "_parse_universe", lambda p: (_ for _ in ()).throw(AssertionError("parsed")))
+    assert universe.load_universe(csv)["yf_symbol"].tolist() == ["ALFA.ST"]
+    monkeypatch.undo()
+
+    # ändrad fil -> ny laddning, ny snapshot
+    csv.write_text("name_display;yf_symbol;segment\nAlfa AB;ALFA.ST;Large\nBeta;BETA.ST;Mid\n", encoding="utf-8")
+    assert universe.search_by_name(universe.load_universe(csv), "beta")["yf_symbol"].tolist() == ["BETA.ST"]
+
+def test_sharded_universe_loads_only_queried_shards(tmp_path):
+    universe.clear_cache()
+    (tmp_path / "us").mkdir()
+    (tmp_path / "us" / "large.csv").write_text("name_display;yf_symbol\nAlfa Inc;ALFA\nBeta Corp;BETA\n", encoding="utf-8")
+    (tmp_path / "us" / "small.csv").write_text("name_display;yf_symbol\nAlfalfa Co;ALFF\n", encoding="utf-8")
+    (tmp_path / "se.csv").write_text("name_display;yf_symbol;segment\nAlfa Laval;ALFA.ST;Large\nBetsson B;BETS-B.ST;Mid\n",
+                                     encoding="utf-8")
+    uni = universe.ShardedUniverse({"Stockholm": tmp_path / "se.csv", "US": tmp_path / "us"})
+
+    res = uni.search("alf", segments=["large"], exchanges=["US"])
+    assert res["yf_symbol"].tolist() == ["ALFA"]
+    assert not universe.snapshot_path(tmp_path / "us" / "small.csv").exists()  # aldrig laddad
+    assert not universe.snapshot_path(tmp_path / "se.csv").exists()
+
+    res = uni.search("alf")
+    assert res["yf_symbol"].tolist() == ["ALFA", "ALFA.ST", "ALFF"]
+    assert res["exchange"].tolist() == ["US", "Stockholm", "US"]
+    assert uni.segments("US") == ["large", "small"]
+    assert set(uni.frame(segments=["Mid"])["yf_symbol"]) == {"BETS-B.ST"}
+
+def test_sharded_frame_is_cached_until_a_shard_changes(tmp_path):
+    universe.clear_cache()
+    csv = tmp_path / "se.csv"
+    csv.write_text("name_display;yf_symbol;segment\nAlfa Laval;ALFA.ST;Large\nBetsson B;BETS-B.ST;Mid\n",
+                   encoding="utf-8")
+    uni = universe.ShardedUniverse({"Stockholm": csv})
+
+    df = uni.frame(segments=["Large"])
+    assert uni.frame(segments=["large"]) is df
+    assert uni.names(segments=["Large"]) is uni.names(segments=["Large"])
+    assert uni.names() == {"Alfa Laval": "ALFA.ST", "Betsson B": "BETS-B.ST"}
+
+    csv.write_text("name_display;yf_symbol;segment\nAlfa Laval AB;ALFA.ST;Large\n", encoding="utf-8")
+    assert uni.frame(segments=["Large"]) is not df
+    assert uni.names(segments=["Large"]) == {"Alfa Laval AB": "ALFA.ST"}
@@ -0,0 +1,51 @@
+import sys, sqlite3
+from pathlib import Path
+import pandas as pd
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from etl import load
+from app.services import db, trades, versions
+
+def test_versions_bump_with_writes_and_invalidate_cache(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    assert versions.get(conn, versions.PRICES) == (0,)
+
+    row = pd.DataFrame([{"ts": "2024-01-02", "ticker": "AAA", "close": 1.0}])
+    load(row, db_path=path)
+    load(row, db_path=path)  # dubblett -> ingen bump
+    assert versions.get(conn, versions.PRICES) == (1,)
+
+    calls = []
+    def compute():
+        calls.append(1)
+        return trades.count_trades(conn, "u")
+
+    dom = [versions.trades_domain("u")]
+    assert versions.cached(conn, dom, "n", compute) == 0
+    assert versions.cached(conn, dom, "n", compute) == 0
+    trades.record_trade(conn, "u", "AAA", "BUY", 1, 1.0, "2024-01-02")
+    trades.record_trade(conn, "other", "AAA", "BUY", 1, 1.0, "2024-01-02")
+    assert versions.cached(conn, dom, "n", compute) == 1
+    assert len(calls) == 2
+    assert versions.get(conn, versions.trades_domain("u"), versions.trades_domain("x")) == (1, 0)
+
+def test_schema_runs_once_per_file(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+
+    # ny anslutning mot samma fil: ingen DDL körs (tabellen återskapas inte)
+    conn.execute("DROP TABLE quotes")
+    other = sqlite3.connect(path)
+    db.ensure_schema(other)
+    assert other.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'quotes'").fetchone()[0] == 0
+    other.close()
+    conn.close()
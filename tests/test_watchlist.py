@@ -0,0 +1,45 @@
+import sys, sqlite3
+from pathlib import Path
+
+# gör app och src importbara utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+for p in (ROOT, ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from app.services import db, watchlist
+
+
+def test_refresh_is_batched_over_distinct_tickers(tmp_path):
+    path = tmp_path / "test.db"
+    conn = sqlite3.connect(path)
+    db.ensure_schema(conn)
+    # 300 användare med överlappande listor över 7 distinkta tickers
+    tickers = [f"T{i}.ST" for i in range(7)]
+    for u in range(300):
+        for t in tickers[u % 3: u % 3 + 5]:
+            watchlist.add(conn, f"user{u}", t)
+
+    calls = []
+
+    def download_many(chunk):
+        calls.append(list(chunk))
+        return {t: ("2024-05-03", 10.0 + i) for i, t in enumerate(chunk) if t != "T6.ST"}
+
+    stats = watchlist.refresh_cycle(path, chunk_size=3, download_many=download_many)
+    assert stats == {"tickers": 7, "calls": 3, "updated": 6}
+    assert sorted(t for c in calls for t in c) == tickers   # varje ticker exakt en gång
+
+    df = watchlist.view(conn, "user2")
+    assert df["ticker"].tolist() == tickers[2:7]
+    assert df.set_index("ticker")["last_price"].notna().to_dict() == {
+        "T2.ST": True, "T3.ST": True, "T4.ST": True, "T5.ST": True, "T6.ST": False,
+    }
+
+    # färska kurser och backoff för den som saknades -> inget nytt anrop
+    calls.clear()
+    assert watchlist.refresh_cycle(path, chunk_size=3, download_many=download_many)["calls"] == 0
+    assert calls == []
+
+    assert watchlist.remove(conn, "user2", ["T6.ST"]) == 1
+    assert not watchlist.add(conn, "user2", "t2.st")
@@ -0,0 +1,65 @@
+import sys, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# gör app importbar utan paketering
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services import trades
+from app.services.writer import TradeWriter
+
+def test_concurrent_sells_cannot_oversell(tmp_path):
+    path = tmp_path / "test.db"
+    w = TradeWriter(path, max_delay=0.01)
+    try:
+        w.record("u", "AAA", "BUY", 10, 100.0, "2024-01-01")
+
+        def sell(_):
+            try:
+                return w.record("u", "AAA", "SELL", 1, 110.0, "2024-01-02")
+            except ValueError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            ids = list(pool.map(sell, range(25)))
+    finally:
+        w.close()
+
+    assert sum(i is not None for i in ids) == 10
+    assert w.commits < 1 + 25  # flera trades per commit
+    conn = sqlite3.connect(path)
+    assert trades.current_qty(conn, "u", "AAA") == 0.0
+
+def test_rejection_is_returned_to_caller(tmp_path):
+    w = TradeWriter(tmp_path / "test.db")
+    try:
+        bad = w.submit("u", "AAA", "HOLD", 1, 100.0, "2024-01-01")
+        good = w.submit("u", "AAA", "BUY", 1, 100.0, "2024-01-01")
+        assert isinstance(bad.exception(timeout=5), AssertionError)
+        assert good.result(timeout=5) > 0
+    finally:
+        w.close()
+
+def test_bad_item_does_not_fail_its_batch(tmp_path):
+    path = tmp_path / "test.db"
+    w = TradeWriter(path, max_delay=0.2)
+    try:
+        futs = [w.submit("u", "AAA", "BUY", 1, 100.0, "2024-01-01"),
+                w.submit("u", "AAA", "BUY", None, 100.0, "2024-01-01"),   # TypeError i valideringen
+                w.submit("u", "AAA", "BUY", 2, 100.0, "2024-01-01")]
+        assert isinstance(futs[1].exception(timeout=5), TypeError)
+        assert futs[0].result(timeout=5) and futs[2].result(timeout=5)
+        assert w.commits == 1
+    finally:
+        w.close()
+    conn = sqlite3.connect(path)
+    assert trades.current_qty(conn, "u", "AAA") == 3.0
+
+def test_setup_failure_fails_callers(tmp_path):
+    w = TradeWriter(tmp_path / "saknas" / "test.db")   # katalogen finns inte
+    fut = w.submit("u", "AAA", "BUY", 1, 100.0, "2024-01-01")
+    assert isinstance(fut.exception(timeout=5), sqlite3.OperationalError)
+    w._thread.join(5)
+    assert isinstance(w.submit("u", "AAA", "BUY", 1, 100.0, "2024-01-01").exception(timeout=1), sqlite3.OperationalError)